@@ -0,0 +1,7 @@
+from django.contrib import admin
+from .models import ActivityEvent
+
+@admin.register(ActivityEvent)
+class ActivityEventAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "scope", "kind", "object_repr", "actor")
+    list_filter = ("scope", "kind")
@@ -0,0 +1,146 @@
+"""Activity feed: append-only ActivityEvent rows plus a per-process ring buffer.
+
+Each scope has a version number in the shared cache. A process serves
+recent() from its buffer while the version matches and reloads the last
+BUFFER_SIZE events (one indexed query) when another process has written.
+Events are published after the surrounding transaction commits.
+"""
+import datetime
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import ActivityEvent
+
+BUFFER_SIZE = 50
+PRUNE_BATCH = 5000
+
+TEXTS = {
+    ActivityEvent.SCOPE_DEFECTS: {
+        ActivityEvent.KIND_CREATED: "создан дефект",
+        ActivityEvent.KIND_UPDATED: "отредактирован дефект",
+        ActivityEvent.KIND_DELETED: "удалён дефект",
+        ActivityEvent.KIND_STATUS: "изменён статус дефекта",
+        ActivityEvent.KIND_ASSIGNED: "назначен исполнитель дефекта",
+    },
+    ActivityEvent.SCOPE_PROJECTS: {
+        ActivityEvent.KIND_CREATED: "создан проект",
+        ActivityEvent.KIND_UPDATED: "отредактирован проект",
+        ActivityEvent.KIND_DELETED: "удалён проект",
+    },
+}
+
+_buffers = {}
+_lock = threading.Lock()
+
+class _Buffer:
+    def __init__(self, version, items):
+        self.version = version
+        self.items = deque(items, maxlen=BUFFER_SIZE)
+
+def _version_key(scope):
+    return f"activity:version:{scope}"
+
+def current_version(scope):
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns())
+        version = cache.get(key)
+    return version
+
+def _bump(scope):
+    try:
+        return cache.incr(_version_key(scope))
+    except ValueError:
+        cache.set(_version_key(scope), time.time_ns())
+        return None
+
+def as_item(event):
+    text = TEXTS.get(event.scope, {}).get(event.kind, "действие")
+    detail = event.payload.get("text")
+    return {
+        "id": event.pk,
+        "scope": event.scope,
+        "kind": event.kind,
+        "object_id": event.object_id,
+        "project_id": event.project_id,
+        "time": timezone.localtime(event.created_at).strftime("%H:%M"),
+        "ts": int(event.created_at.timestamp()),
+        "text": f"{text} {event.object_repr}" + (f": {detail}" if detail else ""),
+    }
+
+def _publish(event):
+    version = _bump(event.scope)
+    item = as_item(event)
+    with _lock:
+        buf = _buffers.get(event.scope)
+        if buf is not None and version is not None and buf.version == version - 1:
+            buf.items.appendleft(item)
+            buf.version = version
+        else:
+            _buffers.pop(event.scope, None)
+
+def record(scope, kind, obj=None, actor=None, project_id=None, object_repr=None, object_id=None, **payload):
+    """Append an event for `obj` and publish it to the feed once the transaction commits."""
+    if project_id is None and obj is not None:
+        project_id = obj.pk if scope == ActivityEvent.SCOPE_PROJECTS else getattr(obj, "project_id", None)
+    event = ActivityEvent.objects.create(
+        scope=scope,
+        kind=kind,
+        object_id=object_id if object_id is not None else getattr(obj, "pk", None),
+        object_repr=(object_repr if object_repr is not None else str(obj or ""))[:255],
+        project_id=project_id,
+        actor=actor if getattr(actor, "is_authenticated", False) else None,
+        payload=payload,
+    )
+    transaction.on_commit(lambda: _publish(event))
+    return event
+
+def record_many(scope, entries, actor=None):
+    """Bulk variant of record() for (kind, obj, payload) entries: one INSERT, published after commit."""
+    actor = actor if getattr(actor, "is_authenticated", False) else None
+    events = ActivityEvent.objects.bulk_create([
+        ActivityEvent(
+            scope=scope,
+            kind=kind,
+            object_id=obj.pk,
+            object_repr=str(obj)[:255],
+            project_id=obj.pk if scope == ActivityEvent.SCOPE_PROJECTS else getattr(obj, "project_id", None),
+            actor=actor,
+            payload=payload,
+        )
+        for kind, obj, payload in entries
+    ], batch_size=500)
+    transaction.on_commit(lambda: [_publish(e) for e in events])
+    return events
+
+def recent(scope, limit=10):
+    version = current_version(scope)
+    with _lock:
+        buf = _buffers.get(scope)
+        if buf is not None and buf.version == version:
+            return list(buf.items)[:limit]
+    events = ActivityEvent.objects.filter(scope=scope).order_by("-created_at", "-id")[:BUFFER_SIZE]
+    buf = _Buffer(version, [as_item(e) for e in events])
+    with _lock:
+        _buffers[scope] = buf
+    return list(buf.items)[:limit]
+
+def prune(days=None):
+    """Delete events older than the retention period in batches; returns the number deleted."""
+    days = settings.ACTIVITY_RETENTION_DAYS if days is None else days
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    deleted = 0
+    while True:
+        ids = list(ActivityEvent.objects.filter(created_at__lt=cutoff).values_list("id", flat=True)[:PRUNE_BATCH])
+        if not ids:
+            break
+        deleted += ActivityEvent.objects.filter(id__in=ids).delete()[0]
+    if deleted:
+        for scope, _ in ActivityEvent.SCOPE_CHOICES:
+            _bump(scope)
+    return deleted
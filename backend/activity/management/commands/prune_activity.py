@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+class Command(BaseCommand):
+    help = "Удалить события ленты активности старше срока хранения (ACTIVITY_RETENTION_DAYS)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None)
+
+    def handle(self, *args, **options):
+        from activity.feed import prune
+        deleted = prune(options["days"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} activity event(s)"))
@@ -0,0 +1,41 @@
+from django.db import models
+from django.conf import settings
+
+class ActivityEvent(models.Model):
+    SCOPE_DEFECTS = "defects"
+    SCOPE_PROJECTS = "projects"
+    SCOPE_CHOICES = [
+        (SCOPE_DEFECTS, "дефекты"),
+        (SCOPE_PROJECTS, "проекты"),
+    ]
+
+    KIND_CREATED = "created"
+    KIND_UPDATED = "updated"
+    KIND_DELETED = "deleted"
+    KIND_STATUS = "status_changed"
+    KIND_ASSIGNED = "assigned"
+    KIND_CHOICES = [
+        (KIND_CREATED, "создан"),
+        (KIND_UPDATED, "отредактирован"),
+        (KIND_DELETED, "удалён"),
+        (KIND_STATUS, "изменён статус"),
+        (KIND_ASSIGNED, "назначен исполнитель"),
+    ]
+
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField(null=True, blank=True)
+    object_repr = models.CharField(max_length=255, blank=True)
+    project_id = models.PositiveBigIntegerField(null=True, blank=True)
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["scope", "-created_at"], name="activity_scope_created_idx"),
+            models.Index(fields=["created_at"], name="activity_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.kind} {self.object_repr}"
@@ -0,0 +1,289 @@
+"""Push channel for activity events (SSE and long-poll).
+
+One Broker per process polls ActivityEvent in a background thread and
+fans new events out to subscriber queues, so the number of open streams
+does not change the number of queries.
+
+Events are inserted inside the writer's transaction, so ids are handed
+out before commit and a lower id can become visible after a higher one.
+Positions are therefore a Cursor: the highest id seen plus the recent ids
+below it that were still missing ("gaps"). The broker re-reads its gaps
+for LATE_COMMIT_SECONDS, and every stream keeps its own cursor, sends it
+as the SSE id and catches up from the table on reconnect (Last-Event-ID)
+or when its queue overflowed.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Max, Q
+from .feed import as_item
+from .models import ActivityEvent
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1.0
+BATCH_SIZE = 500
+QUEUE_SIZE = 1000
+LATE_COMMIT_SECONDS = 60
+MAX_GAPS = 32
+KEEPALIVE = 15
+STREAM_SECONDS = 300
+RETRY_MS = 3000
+
+def counter_delta(event):
+    """Change of defect counts per status implied by the event."""
+    payload = event.payload or {}
+    if event.scope != ActivityEvent.SCOPE_DEFECTS:
+        return {}
+    if event.kind == ActivityEvent.KIND_CREATED and payload.get("status"):
+        return {payload["status"]: 1}
+    if event.kind == ActivityEvent.KIND_DELETED and payload.get("status"):
+        return {payload["status"]: -1}
+    if event.kind == ActivityEvent.KIND_STATUS:
+        return {payload.get("old_status"): -1, payload.get("new_status"): 1}
+    return {}
+
+def event_item(event):
+    item = as_item(event)
+    item["delta"] = counter_delta(event)
+    return item
+
+class Cursor:
+    """Highest event id seen plus recent lower ids not seen yet; text form "last" or "last:gap,gap"."""
+
+    def __init__(self, last=0, gaps=()):
+        self.last = last
+        self.gaps = {gap: time.monotonic() + LATE_COMMIT_SECONDS for gap in gaps if gap < last}
+
+    @classmethod
+    def parse(cls, value):
+        if value is None:
+            return None
+        last, _, gaps = str(value).partition(":")
+        try:
+            return cls(int(last), [int(g) for g in gaps.split(",") if g])
+        except ValueError:
+            return None
+
+    def __str__(self):
+        self.expire()
+        gaps = ",".join(str(g) for g in sorted(self.gaps))
+        return f"{self.last}:{gaps}" if gaps else str(self.last)
+
+    def expire(self):
+        now = time.monotonic()
+        for gap in [g for g, deadline in self.gaps.items() if deadline < now]:
+            del self.gaps[gap]
+
+    def advance(self, item):
+        """Mark the item's id seen; False when it already was."""
+        pk = item["id"]
+        if pk in self.gaps:
+            del self.gaps[pk]
+            return True
+        if pk <= self.last:
+            return False
+        # Only a recent event can be overtaken by a transaction still open.
+        if time.time() - item["ts"] < LATE_COMMIT_SECONDS:
+            deadline = time.monotonic() + LATE_COMMIT_SECONDS
+            for gap in range(max(self.last + 1, pk - MAX_GAPS), pk):
+                self.gaps[gap] = deadline
+            for gap in sorted(self.gaps)[:-MAX_GAPS]:
+                del self.gaps[gap]
+        self.last = pk
+        return True
+
+    def pending(self):
+        """Events after the cursor: not seen gaps and everything above `last`."""
+        self.expire()
+        return Q(id__gt=self.last) | Q(id__in=list(self.gaps))
+
+def read_after(cursor, limit=BATCH_SIZE):
+    """Unseen events as items, oldest first; every returned id is marked seen."""
+    events = ActivityEvent.objects.filter(cursor.pending()).order_by("id")[:limit]
+    return [item for item in map(event_item, events) if cursor.advance(item)]
+
+class Subscription:
+    def __init__(self, project_id=None, project_ids=None, scope=None):
+        self.project_id = project_id
+        self.project_ids = project_ids
+        self.scope = scope
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.lagged = False
+        self.cursor = None
+
+    def accepts(self, item):
+        if self.scope is not None and item["scope"] != self.scope:
+            return False
+        if self.project_id is not None and item["project_id"] != self.project_id:
+            return False
+        if self.project_ids is not None and item["project_id"] not in self.project_ids:
+            return False
+        return True
+
+    def deliver(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # The reader catches up from the table instead.
+            self.lagged = True
+
+class Broker:
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self.cursor = None
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def last_id(self):
+        return self.cursor.last if self.cursor else None
+
+    def _init_cursor(self):
+        if self.cursor is None:
+            self.cursor = Cursor(ActivityEvent.objects.aggregate(m=Max("id"))["m"] or 0)
+
+    def start(self):
+        with self.lock:
+            self._init_cursor()
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="activity-broker", daemon=True)
+                self.thread.start()
+
+    def subscribe(self, subscription):
+        """Register the subscription; its `cursor` starts at the broker's position."""
+        with self.lock:
+            subscription.cursor = Cursor.parse(self.cursor) if self.cursor else Cursor()
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def poll_once(self):
+        # Under the lock, so a subscriber's starting cursor never includes undelivered events.
+        with self.lock:
+            self._init_cursor()
+            items = read_after(self.cursor)
+            # Every subscriber gets every event: its cursor has to see the ids it filters out too.
+            for sub in self.subscribers:
+                for item in items:
+                    sub.deliver(item)
+        return len(items)
+
+    def run(self):
+        while True:
+            if self.subscribers:
+                try:
+                    self.poll_once()
+                except Exception:
+                    logger.exception("activity broker poll failed")
+                finally:
+                    close_old_connections()
+            time.sleep(self.interval)
+
+broker = Broker()
+
+_stream_slots = threading.BoundedSemaphore(settings.ACTIVITY_MAX_STREAMS)
+
+class LimitedStream:
+    """SSE frames holding one of the per-process stream slots until the response is closed.
+
+    Each open stream occupies a worker thread, so the cap keeps threads free
+    for ordinary requests; open_stream() returns None when all slots are taken.
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.frames)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.frames.close()
+            _stream_slots.release()
+
+def open_stream(subscription, after=None):
+    if not _stream_slots.acquire(blocking=False):
+        return None
+    return LimitedStream(iter_sse(subscription, after))
+
+def sse_message(item, cursor):
+    return f"id: {cursor}\nevent: activity\ndata: {json.dumps(item, ensure_ascii=False)}\n\n"
+
+def catch_up(subscription, cursor):
+    """Accepted unseen events from the table, all pages."""
+    while True:
+        subscription.lagged = False
+        items = read_after(cursor)
+        yield from (i for i in items if subscription.accepts(i))
+        if len(items) < BATCH_SIZE:
+            break
+
+def iter_sse(subscription, after=None, seconds=STREAM_SECONDS):
+    """SSE frames for a subscription; ends after `seconds` so the client reconnects with Last-Event-ID.
+
+    `after` is the Cursor the client resumes from (None: only new events).
+    """
+    broker.start()
+    broker.subscribe(subscription)
+    cursor = subscription.cursor if after is None else after
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        if after is not None:
+            for item in catch_up(subscription, cursor):
+                yield sse_message(item, cursor)
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if subscription.lagged:
+                for item in catch_up(subscription, cursor):
+                    yield sse_message(item, cursor)
+            try:
+                item = subscription.queue.get(timeout=KEEPALIVE)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if cursor.advance(item) and subscription.accepts(item):
+                yield sse_message(item, cursor)
+    finally:
+        broker.unsubscribe(subscription)
+
+def wait_for_events(subscription, after, timeout):
+    """Long-poll: events after the Cursor `after` (advanced in place), waiting up to `timeout` seconds."""
+    broker.start()
+    broker.subscribe(subscription)
+    try:
+        items = [i for i in read_after(after) if subscription.accepts(i)]
+        deadline = time.monotonic() + timeout
+        while not items and time.monotonic() < deadline:
+            if subscription.lagged:
+                items = list(catch_up(subscription, after))
+                continue
+            try:
+                item = subscription.queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                break
+            if after.advance(item) and subscription.accepts(item):
+                items.append(item)
+        while True:
+            try:
+                item = subscription.queue.get_nowait()
+            except queue.Empty:
+                break
+            if after.advance(item) and subscription.accepts(item):
+                items.append(item)
+        return items
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,190 @@
+import datetime
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from projects.models import Project
+from defects.models import Defect
+from defects.services import change_status
+from activity import feed
+from activity.models import ActivityEvent
+
+User = get_user_model()
+
+@pytest.fixture(autouse=True)
+def fresh_feed():
+    cache.clear()
+    feed._buffers.clear()
+
+@pytest.mark.django_db
+def test_status_change_is_recorded_and_served_from_buffer(django_capture_on_commit_callbacks):
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    d = Defect.objects.create(project=p, title="D1")
+    assert feed.recent(ActivityEvent.SCOPE_DEFECTS) == []
+    with django_capture_on_commit_callbacks(execute=True):
+        change_status(d, Defect.STATUS_IN_PROGRESS, m)
+    with CaptureQueriesContext(connection) as ctx:
+        items = feed.recent(ActivityEvent.SCOPE_DEFECTS)
+    assert len(ctx.captured_queries) == 0
+    assert items[0]["text"] == "изменён статус дефекта D1: новый → в работе"
+    assert items[0]["project_id"] == p.id
+
+@pytest.mark.django_db
+def test_other_process_write_reloads_buffer():
+    p = Project.objects.create(title="P")
+    feed.recent(ActivityEvent.SCOPE_PROJECTS)
+    ActivityEvent.objects.create(scope=ActivityEvent.SCOPE_PROJECTS, kind=ActivityEvent.KIND_CREATED, object_id=p.pk, object_repr="P")
+    feed._bump(ActivityEvent.SCOPE_PROJECTS)
+    assert feed.recent(ActivityEvent.SCOPE_PROJECTS)[0]["text"] == "создан проект P"
+
+@pytest.mark.django_db
+def test_project_list_shows_recent_actions_without_log_entry(django_capture_on_commit_callbacks):
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    client = Client()
+    client.login(username="m", password="x")
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post("/projects/create/", {"title": "Новый", "status": "active"})
+    resp = client.get("/projects/")
+    assert [a["text"] for a in resp.context["recent_actions"]] == ["создан проект Новый"]
+
+@pytest.mark.django_db
+def test_prune_activity_respects_retention():
+    from django.core.management import call_command
+    old = ActivityEvent.objects.create(scope=ActivityEvent.SCOPE_DEFECTS, kind=ActivityEvent.KIND_CREATED)
+    ActivityEvent.objects.filter(pk=old.pk).update(created_at=timezone.now() - datetime.timedelta(days=100))
+    ActivityEvent.objects.create(scope=ActivityEvent.SCOPE_DEFECTS, kind=ActivityEvent.KIND_CREATED)
+    call_command("prune_activity", "--days", "90")
+    assert ActivityEvent.objects.count() == 1
+
+@pytest.mark.django_db
+def test_broker_fans_out_one_poll_to_all_subscribers():
+    from activity.stream import Broker, Subscription
+    p1 = Project.objects.create(title="P1")
+    p2 = Project.objects.create(title="P2")
+    broker = Broker()
+    broker.poll_once()
+    subs = [broker.subscribe(Subscription(project_id=p1.id)) for _ in range(100)]
+    other = broker.subscribe(Subscription(project_id=p2.id))
+    feed.record(ActivityEvent.SCOPE_DEFECTS, ActivityEvent.KIND_CREATED, project_id=p1.id, object_repr="D1", status="new")
+    with CaptureQueriesContext(connection) as ctx:
+        assert broker.poll_once() == 1
+    assert len(ctx.captured_queries) == 1
+    assert all(s.queue.qsize() == 1 for s in subs)
+    item = subs[0].queue.get_nowait()
+    assert item["delta"] == {"new": 1} and subs[0].accepts(item)
+    # filtered when read: the other stream's cursor still has to see the id
+    assert not other.accepts(other.queue.get_nowait())
+
+@pytest.mark.django_db
+def test_sse_stream_replays_after_last_event_id(monkeypatch):
+    from activity import stream
+    monkeypatch.setattr(stream, "broker", stream.Broker())
+    monkeypatch.setattr(stream.broker, "start", lambda: None)
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    d = Defect.objects.create(project=p, title="D1")
+    change_status(d, Defect.STATUS_IN_PROGRESS, m)
+    client = Client()
+    client.login(username="m", password="x")
+    resp = client.get(f"/activity/stream/?project={p.id}", HTTP_LAST_EVENT_ID="0")
+    assert resp["Content-Type"] == "text/event-stream"
+    chunks = iter(resp.streaming_content)
+    assert next(chunks).startswith(b"retry:")
+    frame = next(chunks).decode("utf-8")
+    resp.close()
+    assert frame.startswith("id: ") and "event: activity" in frame
+    assert '"delta": {"new": -1, "in_progress": 1}' in frame
+
+@pytest.mark.django_db
+def test_long_poll_returns_events_and_checks_membership(monkeypatch):
+    from activity import stream
+    monkeypatch.setattr(stream, "broker", stream.Broker())
+    monkeypatch.setattr(stream.broker, "start", lambda: None)
+    e = User.objects.create_user(username="e", email="e@example.com", password="x", role="engineer")
+    p = Project.objects.create(title="P")
+    hidden = Project.objects.create(title="H")
+    p.members.add(e)
+    feed.record(ActivityEvent.SCOPE_PROJECTS, ActivityEvent.KIND_UPDATED, p)
+    feed.record(ActivityEvent.SCOPE_PROJECTS, ActivityEvent.KIND_UPDATED, hidden)
+    client = Client()
+    client.login(username="e", password="x")
+    data = client.get("/activity/poll/?after=0&timeout=0").json()
+    assert [i["project_id"] for i in data["events"]] == [p.id]
+    # the cursor moves past events the user may not see
+    assert data["last_id"] == ActivityEvent.objects.latest("id").id == int(data["cursor"])
+    assert client.get(f"/activity/poll/?after=0&timeout=0&project={hidden.id}").status_code == 403
+
+# closing a stream fires request_finished, which drops the connection mid-test
+@pytest.mark.django_db(transaction=True)
+def test_sse_stream_slots_are_capped_per_process(monkeypatch):
+    import threading
+    from activity import stream
+    monkeypatch.setattr(stream, "broker", stream.Broker())
+    monkeypatch.setattr(stream.broker, "start", lambda: None)
+    monkeypatch.setattr(stream, "_stream_slots", threading.BoundedSemaphore(1))
+    User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    client = Client()
+    client.login(username="m", password="x")
+    first = client.get("/activity/stream/")
+    assert first["Content-Type"] == "text/event-stream"
+    second = client.get("/activity/stream/")
+    assert second.status_code == 503 and second["Retry-After"]
+    first.close()
+    third = client.get("/activity/stream/")
+    assert third.status_code == 200
+    third.close()
+
+def _event(pk, title):
+    return ActivityEvent.objects.create(
+        id=pk, scope=ActivityEvent.SCOPE_DEFECTS, kind=ActivityEvent.KIND_CREATED, object_repr=title, payload={"status": "new"},
+    )
+
+@pytest.mark.django_db(transaction=True)
+def test_events_committed_out_of_order_reach_broker_sse_and_poll(monkeypatch):
+    from activity import stream
+    monkeypatch.setattr(stream, "broker", stream.Broker())
+    monkeypatch.setattr(stream.broker, "start", lambda: None)
+    User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    base = _event(None, "D0").pk
+    stream.broker.poll_once()
+    sub = stream.broker.subscribe(stream.Subscription())
+    # the transaction holding base+1 is still open when base+2 commits
+    _event(base + 2, "D2")
+    assert stream.broker.poll_once() == 1
+    assert str(stream.broker.cursor) == f"{base + 2}:{base + 1}"
+    _event(base + 1, "D1")
+    assert stream.broker.poll_once() == 1
+    assert [sub.queue.get_nowait()["id"] for _ in range(2)] == [base + 2, base + 1]
+    assert str(stream.broker.cursor) == str(base + 2)
+    client = Client()
+    client.login(username="m", password="x")
+    # a client that saw D2 while D1 was pending gets D1 on reconnect, and nothing twice
+    resp = client.get("/activity/stream/", HTTP_LAST_EVENT_ID=f"{base + 2}:{base + 1}")
+    chunks = iter(resp.streaming_content)
+    next(chunks)
+    frame = next(chunks).decode("utf-8")
+    resp.close()
+    assert frame.startswith(f"id: {base + 2}\n") and f'"id": {base + 1}' in frame
+    data = client.get(f"/activity/poll/?after={base + 2}:{base + 1}&timeout=0").json()
+    assert [i["id"] for i in data["events"]] == [base + 1]
+    assert data["cursor"] == str(base + 2)
+    assert client.get(f"/activity/poll/?after={data['cursor']}&timeout=0").json()["events"] == []
+
+@pytest.mark.django_db
+def test_overflowed_subscription_catches_up_from_table(monkeypatch):
+    import queue
+    from activity import stream
+    monkeypatch.setattr(stream, "broker", stream.Broker())
+    monkeypatch.setattr(stream.broker, "start", lambda: None)
+    stream.broker.poll_once()
+    sub = stream.Subscription()
+    sub.queue = queue.Queue(maxsize=1)
+    stream.broker.subscribe(sub)
+    ids = [_event(None, f"D{i}").pk for i in range(3)]
+    stream.broker.poll_once()
+    assert sub.lagged and sub.queue.qsize() == 1
+    assert [i["id"] for i in stream.wait_for_events(sub, sub.cursor, 0)] == ids
@@ -0,0 +1,54 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views import View
+from projects.access import member_project_ids
+from .models import ActivityEvent
+from .stream import Cursor, Subscription, open_stream, wait_for_events
+
+POLL_TIMEOUT = 25
+RETRY_AFTER = 60
+
+def int_param(value):
+    return int(value) if value is not None and str(value).isdigit() else None
+
+class SubscriptionMixin:
+    def subscription(self, request):
+        """Subscription for ?project=&scope=, limited to the user's projects unless manager."""
+        user = request.user
+        project_id = int_param(request.GET.get("project"))
+        scope = request.GET.get("scope")
+        if scope is not None and scope not in dict(ActivityEvent.SCOPE_CHOICES):
+            return None
+        project_ids = None if user.is_manager else set(member_project_ids(user))
+        if project_id is not None and project_ids is not None and project_id not in project_ids:
+            return None
+        return Subscription(project_id=project_id, project_ids=project_ids, scope=scope)
+
+class ActivityStreamView(LoginRequiredMixin, SubscriptionMixin, View):
+    def get(self, request):
+        subscription = self.subscription(request)
+        if subscription is None:
+            return HttpResponseForbidden()
+        after = Cursor.parse(request.headers.get("Last-Event-ID") or request.GET.get("after"))
+        frames = open_stream(subscription, after)
+        if frames is None:
+            resp = HttpResponse("Слишком много открытых потоков, используйте /activity/poll/", status=503)
+            resp["Retry-After"] = str(RETRY_AFTER)
+            return resp
+        resp = StreamingHttpResponse(frames, content_type="text/event-stream")
+        resp["Cache-Control"] = "no-cache"
+        resp["X-Accel-Buffering"] = "no"
+        return resp
+
+class ActivityPollView(LoginRequiredMixin, SubscriptionMixin, View):
+    def get(self, request):
+        subscription = self.subscription(request)
+        if subscription is None:
+            return HttpResponseForbidden()
+        after = Cursor.parse(request.GET.get("after"))
+        if after is None:
+            return HttpResponseBadRequest("after required")
+        timeout = int_param(request.GET.get("timeout"))
+        timeout = POLL_TIMEOUT if timeout is None else min(timeout, POLL_TIMEOUT)
+        events = wait_for_events(subscription, after, timeout)
+        return JsonResponse({"events": events, "last_id": after.last, "cursor": str(after)})
@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import ActivityStreamView, ActivityPollView
+
+urlpatterns = [
+    path("stream/", ActivityStreamView.as_view(), name="activity_stream"),
+    path("poll/", ActivityPollView.as_view(), name="activity_poll"),
+]
@@ -0,0 +1,11 @@
+"""Cache facts the apps depend on."""
+from django.conf import settings
+
+PROCESS_LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+def is_shared_cache(alias="default"):
+    """False when every process (gunicorn worker, management command) has its own copy."""
+    return settings.CACHES[alias]["BACKEND"] not in PROCESS_LOCAL_BACKENDS
@@ -0,0 +1,27 @@
+"""Conditional GET: weak ETags and Last-Modified checked before serialization.
+
+Views compute a validator from cheap markers (a timestamp, row counts,
+cache generations) and pass a callable that builds the full response;
+when the client's If-None-Match / If-Modified-Since still match, the
+callable is never run and a 304 goes out instead.
+"""
+import hashlib
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+def weak_etag(*parts):
+    return 'W/"%s"' % hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+def conditional(request, etag, last_modified, render):
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = render()
+    if response.status_code in (200, 304):
+        if etag is not None:
+            response["ETag"] = etag
+        if timestamp is not None:
+            response["Last-Modified"] = http_date(timestamp)
+        # Clients may keep the body but must revalidate before reusing it.
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
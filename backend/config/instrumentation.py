@@ -0,0 +1,145 @@
+"""Per-request SQL and timing instrumentation.
+
+Enabled with REQUEST_INSTRUMENTATION=1. Every statement run while the view
+builds its response is recorded through a connection execute wrapper with
+its duration, a fingerprint (the SQL with IN lists collapsed; parameters are
+never part of it) and the project code or template that issued it. The summary
+goes into a Server-Timing header and one JSON log line; requests slower than
+SLOW_REQUEST_MS also get a warning with the slowest and duplicated statements
+and where they came from. When disabled the middleware removes itself from
+the chain at startup, so it costs nothing.
+
+Streaming responses (exports, SSE) are measured up to the moment the view
+returns, not while the body is being iterated.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger("instrumentation")
+
+IN_LIST = re.compile(r"\((?:%s,\s*)+%s\)")
+SPACES = re.compile(r"\s+")
+PROJECT_ROOT = str(settings.BASE_DIR) + os.sep
+SITE_PACKAGES = os.sep + "site-packages" + os.sep
+TEMPLATE_RENDER = Template.render.__code__
+
+def fingerprint(sql):
+    return SPACES.sub(" ", IN_LIST.sub("(...)", sql)).strip()
+
+def _project_class(obj):
+    module = sys.modules.get(type(obj).__module__)
+    return getattr(module, "__file__", "").startswith(PROJECT_ROOT)
+
+def origin():
+    """Where a statement came from, innermost first: a project frame ('path:line in func'),
+    the template being rendered (lazy querysets), or the project view whose inherited
+    method ran it (generic views)."""
+    template = method = None
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code is not MIDDLEWARE_CALL:
+        code = frame.f_code
+        if code.co_filename.startswith(PROJECT_ROOT) and SITE_PACKAGES not in code.co_filename:
+            return f"{code.co_filename[len(PROJECT_ROOT):]}:{frame.f_lineno} in {code.co_name}"
+        if code is TEMPLATE_RENDER:
+            template = template or "template " + str(frame.f_locals["self"].origin.template_name)
+        elif method is None and code.co_varnames[:1] == ("self",):
+            owner = frame.f_locals.get("self")
+            if _project_class(owner):
+                method = f"{type(owner).__module__}.{type(owner).__qualname__}.{code.co_name}"
+        frame = frame.f_back
+    return template or method
+
+class QueryLog:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((
+                (time.perf_counter() - started) * 1000, sql, context["connection"].alias, origin(),
+            ))
+
+    @property
+    def total_ms(self):
+        return sum(q[0] for q in self.queries)
+
+    def slowest(self, limit):
+        return sorted(self.queries, key=lambda q: q[0], reverse=True)[:limit]
+
+    def duplicates(self):
+        """{fingerprint: (count, total ms, origins)} for statements run more than once."""
+        groups = {}
+        for ms, sql, _, where in self.queries:
+            count, total, origins = groups.get(fingerprint(sql), (0, 0.0, set()))
+            if where:
+                origins.add(where)
+            groups[fingerprint(sql)] = (count + 1, total + ms, origins)
+        return {fp: g for fp, g in groups.items() if g[0] > 1}
+
+def server_timing(total_ms, log):
+    duplicated = sum(count for count, _, _ in log.duplicates().values())
+    return ", ".join([
+        f'db;dur={log.total_ms:.1f};desc="{len(log.queries)} queries"',
+        f'dup;desc="{duplicated} duplicated"',
+        f"app;dur={max(total_ms - log.total_ms, 0):.1f}",
+        f"total;dur={total_ms:.1f}",
+    ])
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, get_response):
+        if not settings.REQUEST_INSTRUMENTATION:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        log = QueryLog()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(log))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - started) * 1000
+        response["Server-Timing"] = server_timing(total_ms, log)
+        self.report(request, response, total_ms, log)
+        return response
+
+    def report(self, request, response, total_ms, log):
+        duplicates = log.duplicates()
+        match = getattr(request, "resolver_match", None)
+        line = {
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "total_ms": round(total_ms, 1),
+            "db_ms": round(log.total_ms, 1),
+            "queries": len(log.queries),
+            "duplicated": sum(count for count, _, _ in duplicates.values()),
+        }
+        logger.info(json.dumps(line, ensure_ascii=False))
+        if total_ms < settings.SLOW_REQUEST_MS:
+            return
+        limit = settings.REQUEST_INSTRUMENTATION_TOP
+        line["slowest"] = [
+            {"ms": round(ms, 1), "sql": fingerprint(sql), "db": alias, "origin": where}
+            for ms, sql, alias, where in log.slowest(limit)
+        ]
+        line["duplicates"] = [
+            {"count": count, "ms": round(ms, 1), "sql": fp, "origins": sorted(origins)}
+            for fp, (count, ms, origins) in sorted(duplicates.items(), key=lambda kv: kv[1][0], reverse=True)[:limit]
+        ]
+        logger.warning(json.dumps({"slow_request": line}, ensure_ascii=False))
+
+MIDDLEWARE_CALL = QueryInstrumentationMiddleware.__call__.__code__
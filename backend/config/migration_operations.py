@@ -0,0 +1,29 @@
+"""Migration operations shared by the apps."""
+from django.db import NotSupportedError, migrations
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """AddIndex that runs CREATE INDEX CONCURRENTLY on PostgreSQL so writes are not blocked.
+
+    Other backends get a plain CREATE INDEX. Migrations using it must set
+    `atomic = False`, since PostgreSQL refuses concurrent builds in a transaction.
+    """
+
+    def _concurrently(self, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return {}
+        if schema_editor.connection.in_atomic_block:
+            raise NotSupportedError("AddIndexConcurrently requires a non-atomic migration (atomic = False)")
+        return {"concurrently": True}
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, **self._concurrently(schema_editor))
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, **self._concurrently(schema_editor))
+
+    def describe(self):
+        return "Concurrently c" + super().describe()[1:]
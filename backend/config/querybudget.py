@@ -0,0 +1,71 @@
+"""Query budgets for the test suite.
+
+Every URL pattern of the project's urls modules is declared in a budget
+table (see config/tests.py) either as a Budget — the request to make and
+the most queries it may run — or as a Skip with the reason it cannot be
+measured. A budget is a constant: tests measure each request at two data
+sizes and fail when the count exceeds the budget or grows with the data.
+
+Patterns are keyed by URL name; unnamed or ambiguous ones (DRF router
+roots, plain report views) by their route.
+"""
+from typing import NamedTuple
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+
+EXCLUDED_PREFIXES = ("admin/", "^media/")
+
+class Budget(NamedTuple):
+    queries: int
+    method: str = "get"
+    args: tuple = ()
+    params: dict = None
+    data: dict = None
+    user: str = "manager"
+    api: bool = False
+    path: str = None
+
+class Skip(NamedTuple):
+    reason: str
+
+def _walk(patterns, prefix=""):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _walk(pattern.url_patterns, prefix + str(pattern.pattern))
+        else:
+            yield prefix + str(pattern.pattern), pattern
+
+def url_keys():
+    """{key: route} for every pattern outside admin/media, format-suffix variants excluded."""
+    routes = [
+        (route, p) for route, p in _walk(get_resolver().url_patterns)
+        if not route.startswith(EXCLUDED_PREFIXES) and "format" not in p.pattern.regex.groupindex
+    ]
+    names = [p.name for _, p in routes]
+    return {p.name if p.name and names.count(p.name) == 1 else route: route for route, p in routes}
+
+def url_for(key, budget, objects):
+    if budget.path:
+        return budget.path
+    if "/" in key:
+        return "/" + key
+    return reverse(key, args=[objects[a].pk for a in budget.args])
+
+def count_queries(client, key, budget, objects):
+    """Run the request in a savepoint that is rolled back; returns (status, SQL list)."""
+    url = url_for(key, budget, objects)
+    params = budget.params(objects) if callable(budget.params) else budget.params
+    data = budget.data(objects) if callable(budget.data) else budget.data
+    with transaction.atomic():
+        with CaptureQueriesContext(connection) as ctx:
+            if budget.method == "get":
+                response = client.get(url, params or {})
+            elif budget.api:
+                response = client.post(url, data or {}, format="json")
+            else:
+                response = client.post(url, data or {})
+            if response.streaming:
+                b"".join(response.streaming_content)
+        transaction.set_rollback(True)
+    return response.status_code, [q["sql"] for q in ctx.captured_queries]
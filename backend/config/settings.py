@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import tempfile
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -22,9 +23,11 @@ INSTALLED_APPS = [
     "projects",
     "defects",
     "reports",
+    "activity",
 ]
 
 MIDDLEWARE = [
+    "config.instrumentation.QueryInstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -60,6 +63,9 @@ if os.environ.get("DJANGO_USE_SQLITE", "0") == "1":
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": os.environ.get("DJANGO_SQLITE_NAME", BASE_DIR / "db.sqlite3"),
+            "OPTIONS": {"timeout": 20},
+            # file-backed so concurrent writers wait on the lock like on postgres
+            "TEST": {"NAME": os.path.join(tempfile.gettempdir(), "defects_control_test.sqlite3")},
         }
     }
 else:
@@ -74,6 +80,34 @@ else:
         }
     }
 
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("DJANGO_CACHE_LOCATION", "defects-control"),
+    }
+}
+
+ACTIVITY_RETENTION_DAYS = int(os.environ.get("ACTIVITY_RETENTION_DAYS", "90"))
+ACTIVITY_MAX_STREAMS = int(os.environ.get("ACTIVITY_MAX_STREAMS", "16"))
+
+# running export jobs older than this are failed (the worker died mid-job)
+EXPORT_JOB_TIMEOUT = int(os.environ.get("EXPORT_JOB_TIMEOUT", "3600"))
+
+REPORTS_CACHE_TIMEOUT = int(os.environ.get("REPORTS_CACHE_TIMEOUT", "300"))
+
+REQUEST_INSTRUMENTATION = os.environ.get("REQUEST_INSTRUMENTATION", "0") == "1"
+SLOW_REQUEST_MS = int(os.environ.get("SLOW_REQUEST_MS", "500"))
+REQUEST_INSTRUMENTATION_TOP = 5
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "instrumentation": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
+
 AUTH_USER_MODEL = "users.User"
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -135,7 +169,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
@@ -148,6 +182,11 @@ REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
 
+SIMPLE_JWT = {
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.TokenObtainSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.TokenRefreshSerializer",
+}
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "Defects Control API",
     "DESCRIPTION": "Система регистрации и контроля дефектов",
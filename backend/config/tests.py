@@ -0,0 +1,236 @@
+import json
+import logging
+import pytest
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.test import Client, override_settings
+from projects.models import Project, Stage
+from defects.models import Defect, Comment
+from config.instrumentation import fingerprint, logger
+from config.querybudget import Budget, Skip, count_queries, url_keys
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+User = get_user_model()
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    # seed_base() saves an export file; keep it out of the real MEDIA_ROOT
+    settings.MEDIA_ROOT = tmp_path
+
+def test_fingerprint_collapses_in_lists():
+    three = fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s,  %s)')
+    assert three == fingerprint('SELECT *\n FROM "t" WHERE "id" IN (%s, %s)')
+    assert three.endswith("IN (...)")
+
+@pytest.mark.django_db
+def test_instrumentation_disabled_adds_nothing():
+    User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    client = Client()
+    client.login(username="m", password="x")
+    resp = client.get("/defects/")
+    assert resp.status_code == 200
+    assert "Server-Timing" not in resp
+
+@pytest.mark.django_db
+@override_settings(REQUEST_INSTRUMENTATION=True, SLOW_REQUEST_MS=0)
+def test_instrumentation_server_timing_and_slow_log(caplog, monkeypatch):
+    monkeypatch.setattr(logger, "propagate", True)
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    s = Stage.objects.create(project=p, title="S")
+    d = Defect.objects.create(project=p, stage=s, title="D")
+    Comment.objects.create(defect=d, author=m, text="c")
+    client = Client()
+    client.login(username="m", password="x")
+    with caplog.at_level(logging.INFO, logger="instrumentation"):
+        resp = client.get(f"/defects/{d.id}/")
+    assert resp.status_code == 200
+    timing = resp["Server-Timing"]
+    assert timing.startswith("db;dur=") and "total;dur=" in timing
+    lines = [json.loads(r.getMessage()) for r in caplog.records if r.name == "instrumentation"]
+    info = next(l for l in lines if "slow_request" not in l)
+    assert info["path"] == f"/defects/{d.id}/" and info["queries"] > 0
+    slow = next(l["slow_request"] for l in lines if "slow_request" in l)
+    assert slow["slowest"] and all(q["sql"] for q in slow["slowest"])
+    origins = [q["origin"] for q in slow["slowest"]] + [o for q in slow["duplicates"] for o in q["origins"]]
+    assert "defects.web_views.DefectDetailView.get_object" in origins
+    assert not any(o and o.startswith("config/") for o in origins)
+
+BUDGETS = {
+    # API
+    "schema": Budget(0, user=None),
+    "api/docs/": Budget(0, user=None),
+    "token_obtain_pair": Budget(1, method="post", api=True, user=None, data={"username": "m", "password": "x"}),
+    "token_refresh": Budget(1, method="post", api=True, user=None, data=lambda o: {"refresh": str(RefreshToken.for_user(o["manager"]))}),
+    "user-list": Budget(1, api=True),
+    "user-bulk-role": Budget(3, method="post", api=True, data=lambda o: {"ids": [o["engineer"].pk], "role": "engineer"}),
+    "user-detail": Budget(1, api=True, args=("engineer",)),
+    "api/users/": Budget(1, api=True),
+    "project-list": Budget(3, api=True),
+    "project-detail": Budget(4, api=True, args=("project",)),
+    "project-stages": Budget(3, api=True, args=("project",)),
+    "api/projects/": Budget(3, api=True),
+    "defect-list": Budget(1, api=True),
+    "defect-bulk": Budget(7, method="post", api=True, data=lambda o: {"ids": o["same_key_defects"], "priority": "high"}),
+    "defect-detail": Budget(5, api=True, args=("defect",)),
+    "defect-attachments": Budget(2, api=True, args=("defect",)),
+    "defect-change-status": Budget(13, method="post", api=True, args=("defect",), data={"status": "in_progress"}),
+    "defect-comments": Budget(2, api=True, args=("defect",)),
+    "api/defects/": Budget(1, api=True),
+    "api/reports/summary/": Budget(3, api=True),
+    "api/reports/by_project/": Budget(2, api=True, params=lambda o: {"project_id": o["project"].pk}),
+    "api/reports/by_engineer/": Budget(2, api=True, params=lambda o: {"engineer_id": o["engineer"].pk}),
+    "api/reports/matrix/projects/": Budget(1, api=True),
+    "api/reports/matrix/engineers/": Budget(1, api=True),
+    "api/reports/flow/": Budget(30, api=True),
+    "api/reports/burndown/": Budget(2, api=True),
+    "api/reports/export/": Budget(1, api=True),
+    "api/reports/cache_stats/": Budget(0, api=True),
+    "export-job-list": Budget(1, api=True),
+    "export-job-detail": Budget(1, api=True, args=("job",)),
+    "export-job-download": Budget(1, api=True, args=("job",)),
+    "api/reports/": Budget(0, api=True),
+    # web: users
+    "login": Budget(0, user=None),
+    "logout": Budget(4),
+    "profile": Budget(2),
+    "profile_edit": Budget(2),
+    "change_role": Budget(5, path="/change_role/manager/"),
+    "users_list": Budget(3),
+    "user_edit": Budget(3, args=("engineer",)),
+    "user_set_password": Budget(4, args=("engineer",)),
+    "restore": Budget(0, user=None),
+    # web: projects
+    "projects_list": Budget(4),
+    "project_create": Budget(3),
+    "project_detail": Budget(6, args=("project",)),
+    "project_edit": Budget(5, args=("project",)),
+    "project_delete": Budget(3, args=("project",)),
+    "stage_create": Budget(2, args=("project",)),
+    "stage_edit": Budget(3, args=("stage",)),
+    "object_create": Budget(2, args=("project",)),
+    "object_edit": Budget(3, args=("build_object",)),
+    "project_defects_export_csv": Budget(3, args=("project",)),
+    "project_defects_export_xls": Budget(3, args=("project",)),
+    "project_export_csv": Budget(4, args=("project",)),
+    "project_export_xls": Budget(4, args=("project",)),
+    "projects_export_csv": Budget(3),
+    "projects_export_xls": Budget(3),
+    # web: defects
+    "defects_list": Budget(5),
+    "defect_create": Budget(4),
+    "defects_bulk": Budget(6, method="post", data=lambda o: {"ids": o["same_key_defects"], "action": "assign", "performer": o["engineer"].pk}),
+    "defect_detail": Budget(6, args=("defect",)),
+    "defect_edit": Budget(6, args=("defect",)),
+    "defect_change_status": Budget(12, method="post", args=("defect",), data={"status": "in_progress"}),
+    "defect_upload_attachments": Budget(2, args=("defect",)),
+    "defect_assign": Budget(3, args=("defect",)),
+    "defect_accept": Budget(12, method="post", args=("defect",), user="engineer"),
+    "defect_submit_report": Budget(7, method="post", args=("defect",), user="engineer", data={"text": "готово"}),
+    "defect_delete": Budget(3, args=("defect",)),
+    "defects_export_csv": Budget(3),
+    "defects_export_xls": Budget(3),
+    "defect_export_csv": Budget(4, args=("defect",)),
+    "defect_export_xls": Budget(4, args=("defect",)),
+    # web: reports and activity
+    "reports_dashboard": Budget(4),
+    "reports_dashboard_data": Budget(4),
+    "reports_export": Budget(3),
+    "reports_export_download": Budget(3, args=("job",)),
+    "reports_by_project": Budget(4, params=lambda o: {"project_id": o["project"].pk}),
+    "reports_by_engineer": Budget(4, params=lambda o: {"engineer_id": o["engineer"].pk}),
+    "activity_stream": Skip("SSE stream stays open; events come from the shared broker thread"),
+    "activity_poll": Budget(3, params={"after": 0, "timeout": 0}),
+}
+
+SIZES = (10, 1000)
+_password = None
+
+def seed_base():
+    from django.core.files.base import ContentFile
+    from projects.models import BuildObject
+    from reports.models import ExportJob
+    global _password
+    _password = _password or make_password("x")
+    m = User.objects.create(username="m", email="m@example.com", password=_password, role="manager")
+    e = User.objects.create(username="e", email="e@example.com", password=_password, role="engineer")
+    User.objects.create(username="o", email="o@example.com", password=_password, role="observer")
+    p = Project.objects.create(title="P")
+    p.members.add(e)
+    s = Stage.objects.create(project=p, title="S")
+    d = Defect.objects.create(project=p, stage=s, title="D", performer=e)
+    job = ExportJob.objects.create(dataset="raw_defects", created_by=m, status=ExportJob.STATUS_DONE)
+    job.file.save("budget.csv", ContentFile(b"id\n"))
+    return {
+        "manager": m, "engineer": e, "project": p, "stage": s, "defect": d, "job": job,
+        "build_object": BuildObject.objects.create(project=p, title="B"),
+    }
+
+def grow(objects, n):
+    """Bring the data set to about n defects: more projects, defects, comments and history."""
+    from defects import stats
+    from defects.models import Attachment, StatusHistory
+    e, p, d = objects["engineer"], objects["project"], objects["defect"]
+    have = Defect.objects.count()
+    projects = Project.objects.bulk_create(Project(title=f"P{i}") for i in range(Project.objects.count(), n // 10 + 1))
+    Project.members.through.objects.bulk_create(Project.members.through(project=pr, user=e) for pr in projects)
+    Stage.objects.bulk_create(Stage(project=pr, title="S") for pr in projects)
+    targets = [p] + list(Project.objects.exclude(pk=p.pk))
+    statuses = [s for s, _ in Defect.STATUS_CHOICES]
+    priorities = [pr for pr, _ in Defect.PRIORITY_CHOICES]
+    # even rows go to the target project, the rest are spread over the others
+    Defect.objects.bulk_create([
+        Defect(
+            project=targets[i % 2 and i % len(targets)], title=f"D{i}", performer=e if i % 3 else None,
+            status=statuses[i % len(statuses)], priority=priorities[i % len(priorities)],
+        )
+        for i in range(have, n)
+    ])
+    extra = n // 10 - Comment.objects.filter(defect=d).count()
+    Comment.objects.bulk_create([Comment(defect=d, author=e, text=f"c{i}") for i in range(extra)])
+    StatusHistory.objects.bulk_create([
+        StatusHistory(defect=d, old_status="new", new_status="in_progress", changed_by=e) for _ in range(extra)
+    ])
+    Attachment.objects.bulk_create([Attachment(defect=d, file=f"attachments/a{i}.txt") for i in range(extra)])
+    stats.rebuild()
+    # defects sharing the target's rollup key: bulk writes cost one statement per key, not per row
+    objects["same_key_defects"] = list(
+        Defect.objects.filter(project=p, performer=e, status=d.status, priority=d.priority).values_list("pk", flat=True)
+    )
+
+def budget_client(objects, budget):
+    client = APIClient() if budget.api else Client()
+    if budget.user and budget.api:
+        client.force_authenticate(objects[budget.user])
+    elif budget.user:
+        client.force_login(objects[budget.user])
+    return client
+
+def measure(objects, key, budget):
+    from django.core.cache import cache
+    cache.clear()
+    return count_queries(budget_client(objects, budget), key, budget, objects)
+
+def test_query_budgets_cover_every_url_pattern():
+    keys = set(url_keys())
+    assert keys - set(BUDGETS) == set(), "URL patterns without a query budget"
+    assert set(BUDGETS) - keys == set(), "budgets for URL patterns that no longer exist"
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("key", [k for k, b in BUDGETS.items() if isinstance(b, Budget)])
+def test_query_budget(key, monkeypatch):
+    from activity.stream import broker
+    monkeypatch.setattr(broker, "start", lambda: None)
+    budget = BUDGETS[key]
+    objects = seed_base()
+    counts = {}
+    for n in SIZES:
+        grow(objects, n)
+        status, queries = measure(objects, key, budget)
+        assert status < 400, f"{key}: HTTP {status}"
+        counts[n] = queries
+    small, large = (len(counts[n]) for n in SIZES)
+    detail = "\n".join(counts[SIZES[-1]])
+    assert large <= small, f"{key}: {small} queries at {SIZES[0]} defects, {large} at {SIZES[-1]}\n{detail}"
+    assert large <= budget.queries, f"{key}: {large} queries, budget {budget.queries}\n{detail}"
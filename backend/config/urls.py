@@ -23,6 +23,7 @@ urlpatterns = [
     path("projects/", include("projects.web_urls")),
     path("defects/", include("defects.web_urls")),
     path("reports/", include("reports.web_urls")),
+    path("activity/", include("activity.web_urls")),
 ]
 
 if settings.DEBUG:
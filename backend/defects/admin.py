@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Defect, Attachment, Comment, StatusHistory
+from .models import Defect, Attachment, Comment, StatusHistory, DefectStat
 
 @admin.register(Defect)
 class DefectAdmin(admin.ModelAdmin):
@@ -17,4 +17,8 @@ class CommentAdmin(admin.ModelAdmin):
 
 @admin.register(StatusHistory)
 class StatusHistoryAdmin(admin.ModelAdmin):
-    list_display = ("defect", "old_status", "new_status", "changed_by", "changed_at")
\ No newline at end of file
+    list_display = ("defect", "old_status", "new_status", "changed_by", "changed_at")
+@admin.register(DefectStat)
+class DefectStatAdmin(admin.ModelAdmin):
+    list_display = ("project", "performer", "status", "priority", "count")
+    list_filter = ("status", "priority")
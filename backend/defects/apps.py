@@ -0,0 +1,23 @@
+from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, pre_delete
+
+SEARCH_MIGRATION = ("defects", "0003_defect_search")
+
+def install_search(sender, using, **kwargs):
+    from django.db.migrations.recorder import MigrationRecorder
+    from .search import install
+    conn = connections[using]
+    if SEARCH_MIGRATION in MigrationRecorder(conn).applied_migrations():
+        install(conn)
+
+class DefectsConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "defects"
+
+    def ready(self):
+        from django.conf import settings
+        from . import stats
+        post_migrate.connect(install_search, sender=self)
+        post_delete.connect(stats.track_delete, sender="defects.Defect", dispatch_uid="defects_stats_delete")
+        pre_delete.connect(stats.release_performer, sender=settings.AUTH_USER_MODEL, dispatch_uid="defects_stats_performer")
@@ -6,8 +6,9 @@ from django.contrib.auth import get_user_model
 class DefectForm(forms.ModelForm):
     class Meta:
         model = Defect
-        fields = ["project", "title", "description", "priority", "status", "performer", "deadline"]
+        fields = ["project", "title", "description", "priority", "status", "performer", "deadline", "version"]
         widgets = {
+            "version": forms.HiddenInput,
             "project": forms.Select(attrs={"class": "form-select"}),
             "title": forms.TextInput(attrs={"class": "form-control"}),
             "description": forms.Textarea(attrs={"class": "form-control"}),
@@ -32,6 +33,12 @@ class DefectForm(forms.ModelForm):
         User = get_user_model()
         if "performer" in self.fields:
             self.fields["performer"].queryset = User.objects.filter(role="engineer")
+        if "version" in self.fields:
+            self.fields["version"].required = False
+
+    def clean_version(self):
+        version = self.cleaned_data.get("version")
+        return self.instance.version if version is None else version
 
 class DefectStatusForm(forms.Form):
     status = forms.ChoiceField(label="Статус", choices=Defect.STATUS_CHOICES, widget=forms.Select(attrs={"class": "form-select"}))
@@ -55,4 +62,31 @@ class CommentForm(forms.ModelForm):
         labels = {"text": "Комментарий"}
 
 class AssignPerformerForm(forms.Form):
-    username = forms.CharField(label="Логин инженера", widget=forms.TextInput(attrs={"class": "form-control", "placeholder": "Введите логин инженера"}))
\ No newline at end of file
+    username = forms.CharField(label="Логин инженера", widget=forms.TextInput(attrs={"class": "form-control", "placeholder": "Введите логин инженера"}))
+class DefectBulkForm(forms.Form):
+    ACTION_ASSIGN = "assign"
+    ACTION_CLOSE = "close"
+
+    ids = forms.Field(widget=forms.MultipleHiddenInput)
+    action = forms.ChoiceField(choices=[(ACTION_ASSIGN, "Назначить"), (ACTION_CLOSE, "Закрыть")])
+    performer = forms.ModelChoiceField(
+        label="Исполнитель",
+        queryset=get_user_model().objects.filter(role="engineer", is_active=True),
+        required=False,
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+
+    def clean_ids(self):
+        try:
+            ids = list(dict.fromkeys(int(v) for v in self.cleaned_data["ids"]))
+        except (TypeError, ValueError):
+            raise forms.ValidationError("Некорректный список дефектов")
+        if not ids:
+            raise forms.ValidationError("Выберите дефекты")
+        return ids[:1000]
+
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get("action") == self.ACTION_ASSIGN and not cleaned.get("performer"):
+            self.add_error("performer", "Выберите инженера")
+        return cleaned
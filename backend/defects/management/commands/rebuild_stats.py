@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+class Command(BaseCommand):
+    help = "Пересчитать сводную таблицу DefectStat по дефектам и исправить расхождения."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Только показать число расхождений")
+
+    def handle(self, *args, **options):
+        from defects import stats
+        if options["check"]:
+            self.stdout.write(f"Drifted keys: {stats.drift(stats.actual_counts(), stats.stored_counts())}")
+            return
+        from reports.cache import bump, DEFECTS
+        drift = stats.rebuild()
+        bump(DEFECTS)
+        self.stdout.write(self.style.SUCCESS(f"DefectStat rebuilt, fixed {drift} drifted key(s)"))
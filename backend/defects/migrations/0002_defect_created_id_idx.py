@@ -0,0 +1,20 @@
+# Generated by Django 5.0.4 on 2026-10-18 19:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('defects', '0001_initial'),
+        ('projects', '0002_alter_project_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='defect',
+            index=models.Index(fields=['created_at', 'id'], name='defect_created_id_idx'),
+        ),
+    ]
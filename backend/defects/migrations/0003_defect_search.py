@@ -0,0 +1,19 @@
+from django.db import migrations
+
+def forwards(apps, schema_editor):
+    from defects.search import install
+    install(schema_editor.connection, backfill=True)
+
+def backwards(apps, schema_editor):
+    from defects.search import uninstall
+    uninstall(schema_editor.connection)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('defects', '0002_defect_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
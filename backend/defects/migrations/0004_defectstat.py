@@ -0,0 +1,50 @@
+# Generated by Django 5.0.4 on 2026-10-18 19:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_stats(apps, schema_editor):
+    Defect = apps.get_model('defects', 'Defect')
+    DefectStat = apps.get_model('defects', 'DefectStat')
+    rows = (
+        Defect.objects.values_list('project_id', 'performer_id', 'status', 'priority')
+        .annotate(n=models.Count('id'))
+        .order_by()
+    )
+    DefectStat.objects.bulk_create(
+        DefectStat(project_id=p, performer_id=u, status=s, priority=pr, count=n) for p, u, s, pr, n in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('defects', '0003_defect_search'),
+        ('projects', '0003_project_created_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DefectStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('new', 'новый'), ('in_progress', 'в работе'), ('review', 'на проверке'), ('closed', 'закрыт'), ('cancelled', 'отменён')], max_length=20)),
+                ('priority', models.CharField(choices=[('low', 'низкий'), ('medium', 'средний'), ('high', 'высокий')], max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('performer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='defect_stats', to=settings.AUTH_USER_MODEL)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='defect_stats', to='projects.project')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='defectstat',
+            constraint=models.UniqueConstraint(condition=models.Q(('performer__isnull', False)), fields=('project', 'performer', 'status', 'priority'), name='defectstat_unique_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='defectstat',
+            constraint=models.UniqueConstraint(condition=models.Q(('performer__isnull', True)), fields=('project', 'status', 'priority'), name='defectstat_unique_key_no_performer'),
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.4 on 2026-10-18 19:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('defects', '0004_defectstat'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='statushistory',
+            index=models.Index(fields=['new_status', 'changed_at'], name='statushistory_new_changed_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('defects', '0005_statushistory_new_changed_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='defect',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
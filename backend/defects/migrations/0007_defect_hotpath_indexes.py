@@ -0,0 +1,32 @@
+# Generated by Django 5.0.4 on 2026-10-18 20:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+from config.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('defects', '0006_defect_version'),
+        ('projects', '0004_project_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='defect',
+            index=models.Index(fields=['project', 'status', '-created_at', '-id'], name='defect_proj_status_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='defect',
+            index=models.Index(condition=models.Q(('status__in', ('new', 'in_progress', 'review'))), fields=['performer', '-created_at'], name='defect_performer_open_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='defect',
+            index=models.Index(condition=models.Q(('deadline__isnull', False), ('status__in', ('new', 'in_progress', 'review'))), fields=['deadline'], name='defect_open_deadline_idx'),
+        ),
+    ]
@@ -1,6 +1,26 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from projects.models import Project, Stage
+from . import stats
+
+# Defect.STATUS_NEW, STATUS_IN_PROGRESS, STATUS_REVIEW; module-level so Meta.indexes can use it.
+OPEN_STATUSES = ("new", "in_progress", "review")
+
+PERFORMER_ERROR = "Назначать исполнителем можно только инженера"
+
+def check_performers(performer_ids):
+    """Raise ValueError if any of the ids belongs to a non-engineer; one query for the whole batch."""
+    from users.models import User
+    ids = {pk for pk in performer_ids if pk}
+    if ids and User.objects.filter(pk__in=ids).exclude(role=User.ROLE_ENGINEER).exists():
+        raise ValueError(PERFORMER_ERROR)
+
+class DefectConflict(Exception):
+    """The defect row changed since it was loaded; `current` holds the stored state."""
+
+    def __init__(self, current):
+        super().__init__("Дефект был изменён другим пользователем, обновите данные")
+        self.current = current
 
 class Defect(models.Model):
     PRIORITY_LOW = "low"
@@ -35,20 +55,82 @@ class Defect(models.Model):
     deadline = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="defect_created_id_idx"),
+            models.Index(fields=["project", "status", "-created_at", "-id"], name="defect_proj_status_created_idx"),
+            models.Index(
+                fields=["performer", "-created_at"],
+                condition=models.Q(status__in=OPEN_STATUSES),
+                name="defect_performer_open_idx",
+            ),
+            models.Index(
+                fields=["deadline"],
+                condition=models.Q(deadline__isnull=False, status__in=OPEN_STATUSES),
+                name="defect_open_deadline_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if set(stats.KEY_FIELDS) <= set(field_names):
+            instance._stat_key = stats.key_of(instance)
+        return instance
+
+    def performer_changed(self, update_fields=None):
+        """Whether this save may store a performer that has not been validated yet."""
+        if not self.performer_id:
+            return False
+        if update_fields is not None and not {"performer", "performer_id"} & set(update_fields):
+            return False
+        key = getattr(self, "_stat_key", None)
+        return self._state.adding or key is None or key[1] != self.performer_id
+
     def save(self, *args, **kwargs):
-        if self.performer_id:
-            from users.models import User
-            try:
-                performer = User.objects.get(id=self.performer_id)
-            except User.DoesNotExist:
-                performer = None
-            if performer and (not performer.is_engineer):
-                raise ValueError("Назначать исполнителем можно только инженера")
-        super().save(*args, **kwargs)
+        if self.performer_changed(kwargs.get("update_fields")):
+            performer = self._state.fields_cache.get("performer")
+            if performer is not None and performer.pk == self.performer_id:
+                if not performer.is_engineer:
+                    raise ValueError(PERFORMER_ERROR)
+            else:
+                check_performers([self.performer_id])
+        tracked = self._state.adding or stats.tracks(kwargs.get("update_fields"))
+        old_key = stats.loaded_key(self) if tracked and not self._state.adding else None
+        expected = None if self._state.adding else self.version
+        if expected is not None:
+            self.version = expected + 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        self._expected_version = expected
+        try:
+            with transaction.atomic(using=kwargs.get("using")):
+                super().save(*args, **kwargs)
+                if tracked:
+                    stats.track_save(self, old_key)
+        except Exception:
+            if expected is not None:
+                self.version = expected
+            raise
+        finally:
+            self._expected_version = None
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        """UPDATE ... WHERE version = <loaded version>; a miss on an existing row is a conflict."""
+        expected = getattr(self, "_expected_version", None)
+        if expected is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        if super()._do_update(base_qs.filter(version=expected), using, pk_val, values, update_fields, forced_update):
+            return True
+        current = Defect.objects.using(using).filter(pk=pk_val).first()
+        if current is None:
+            return False
+        raise DefectConflict(current)
 
 class Attachment(models.Model):
     defect = models.ForeignKey(Defect, on_delete=models.CASCADE, related_name="attachments")
@@ -66,4 +148,35 @@ class StatusHistory(models.Model):
     old_status = models.CharField(max_length=20)
     new_status = models.CharField(max_length=20)
     changed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
-    changed_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["new_status", "changed_at"], name="statushistory_new_changed_idx"),
+        ]
+
+class DefectStat(models.Model):
+    """Rollup of defect counts per (project, performer, status, priority), see defects.stats."""
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="defect_stats")
+    performer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name="defect_stats")
+    status = models.CharField(max_length=20, choices=Defect.STATUS_CHOICES)
+    priority = models.CharField(max_length=10, choices=Defect.PRIORITY_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["project", "performer", "status", "priority"],
+                condition=models.Q(performer__isnull=False),
+                name="defectstat_unique_key",
+            ),
+            models.UniqueConstraint(
+                fields=["project", "status", "priority"],
+                condition=models.Q(performer__isnull=True),
+                name="defectstat_unique_key_no_performer",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.project_id}/{self.performer_id}/{self.status}/{self.priority}: {self.count}"
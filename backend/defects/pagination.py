@@ -0,0 +1,212 @@
+import base64
+import json
+from dataclasses import dataclass, field
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(value, pk, reverse=False):
+    raw = json.dumps([value.isoformat(), pk, int(reverse)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        value, pk, reverse = json.loads(raw)
+        ts = parse_datetime(value)
+        if ts is None:
+            raise ValueError(value)
+        return ts, int(pk), bool(reverse)
+    except (TypeError, ValueError, UnicodeError):
+        raise InvalidCursor("Некорректный курсор")
+
+@dataclass
+class KeysetPage:
+    items: list = field(default_factory=list)
+    next_cursor: str = None
+    previous_cursor: str = None
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+class KeysetPaginator:
+    """Keyset pagination on a (timestamp, id) pair.
+
+    Each page is a single indexed range scan "after the last seen row", so the
+    cost does not depend on how deep the client has paged.
+    """
+
+    def __init__(self, time_field="created_at", page_size=50, descending=True):
+        self.time_field = time_field
+        self.page_size = page_size
+        self.descending = descending
+
+    def order(self, qs, backwards=False):
+        desc = self.descending != backwards
+        prefix = "-" if desc else ""
+        return qs.order_by(f"{prefix}{self.time_field}", f"{prefix}id")
+
+    def _seek(self, qs, value, pk, backwards):
+        desc = self.descending != backwards
+        op = "lt" if desc else "gt"
+        # The inclusive bound is what the planner uses as the index range;
+        # the OR only breaks ties on the boundary timestamp.
+        return qs.filter(**{f"{self.time_field}__{op}e": value}).filter(
+            Q(**{f"{self.time_field}__{op}": value})
+            | Q(**{self.time_field: value, f"id__{op}": pk})
+        )
+
+    def _cursor(self, obj, reverse=False):
+        return encode_cursor(getattr(obj, self.time_field), obj.pk, reverse)
+
+    def paginate(self, qs, cursor=None):
+        size = self.page_size
+        if not cursor:
+            items = list(self.order(qs)[: size + 1])
+            page = KeysetPage(items[:size])
+            if len(items) > size:
+                page.next_cursor = self._cursor(page.items[-1])
+            return page
+        value, pk, reverse = decode_cursor(cursor)
+        if not reverse:
+            items = list(self.order(self._seek(qs, value, pk, False))[: size + 1])
+            page = KeysetPage(items[:size])
+            if len(items) > size:
+                page.next_cursor = self._cursor(page.items[-1])
+            if page.items:
+                page.previous_cursor = self._cursor(page.items[0], reverse=True)
+            return page
+        items = list(self.order(self._seek(qs, value, pk, True), backwards=True)[: size + 1])
+        page = KeysetPage(list(reversed(items[:size])))
+        if len(items) > size:
+            page.previous_cursor = self._cursor(page.items[0], reverse=True)
+        if page.items:
+            page.next_cursor = self._cursor(page.items[-1])
+        return page
+
+def encode_offset(offset):
+    raw = json.dumps(["offset", offset], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_offset(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        kind, offset = json.loads(raw)
+        if kind != "offset" or not isinstance(offset, int) or offset < 0:
+            raise ValueError(raw)
+        return offset
+    except (TypeError, ValueError, UnicodeError):
+        raise InvalidCursor("Некорректный курсор")
+
+class RankPaginator:
+    """Offset pagination in relevance order for full-text results.
+
+    A rank is not a stable key to seek on, so search pages are LIMIT/OFFSET;
+    matches are few compared to the whole table.
+    """
+
+    def __init__(self, page_size=50):
+        self.page_size = page_size
+
+    def paginate(self, qs, cursor=None):
+        size = self.page_size
+        offset = decode_offset(cursor) if cursor else 0
+        items = list(qs.order_by("-search_rank", "-created_at", "-id")[offset: offset + size + 1])
+        page = KeysetPage(items[:size])
+        if len(items) > size:
+            page.next_cursor = encode_offset(offset + size)
+        if offset:
+            page.previous_cursor = encode_offset(max(offset - size, 0))
+        return page
+
+def paginator_for(qs, time_field="created_at", page_size=50, descending=True):
+    """RankPaginator for search_defects() results, KeysetPaginator otherwise."""
+    if "search_rank" in qs.query.annotations:
+        return RankPaginator(page_size)
+    return KeysetPaginator(time_field, page_size, descending)
+
+class KeysetPagination(BasePagination):
+    time_field = "created_at"
+    descending = True
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = paginator_for(queryset, self.time_field, self.get_page_size(request), self.descending)
+        try:
+            self.page = paginator.paginate(queryset, request.query_params.get(self.cursor_query_param))
+        except InvalidCursor as e:
+            raise NotFound(str(e))
+        return self.page.items
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self.get_link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        return self.get_link(self.page.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+class DefectPagination(KeysetPagination):
+    pass
+
+class CommentPagination(KeysetPagination):
+    descending = False
+
+class AttachmentPagination(KeysetPagination):
+    time_field = "uploaded_at"
+    descending = False
+
+def page_links(request, page, param="cursor"):
+    path = request.get_full_path()
+    return (
+        replace_query_param(path, param, page.next_cursor) if page.has_next() else None,
+        replace_query_param(path, param, page.previous_cursor) if page.has_previous() else None,
+    )
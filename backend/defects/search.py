@@ -0,0 +1,162 @@
+import re
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend
+from .models import Defect
+
+TABLE = Defect._meta.db_table
+FTS_TABLE = f"{TABLE}_fts"
+PG_CONFIG = "russian"
+MAX_TERMS = 8
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+CYRILLIC_RE = re.compile(r"[а-яё]", re.IGNORECASE)
+# Окончания для облегчённого стемминга запроса в режиме SQLite: основа ищется
+# префиксом, поэтому достаточно отрезать самое длинное окончание.
+RUSSIAN_ENDINGS = sorted(
+    [
+        "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ых", "их",
+        "ый", "ий", "ой", "ая", "яя", "ое", "ее", "ые", "ие", "ую", "юю",
+        "ам", "ям", "ах", "ях", "ом", "ем", "ов", "ев", "ей", "ия", "ию", "ии",
+        "ать", "ять", "ить", "еть", "ть", "ла", "ло", "ли", "ет", "ут", "ют", "ит", "ат", "ят",
+        "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+    ],
+    key=len,
+    reverse=True,
+)
+
+def stem(word):
+    word = word.lower()
+    if len(word) < 4 or not CYRILLIC_RE.search(word):
+        return word
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[: -len(ending)]
+    return word
+
+def query_terms(query):
+    return TOKEN_RE.findall(query or "")[:MAX_TERMS]
+
+def fts5_expression(query):
+    return " AND ".join(f'"{stem(t)}"*' for t in query_terms(query))
+
+def search_defects(qs, query):
+    """Filter a Defect queryset by full-text query and annotate `search_rank`."""
+    terms = query_terms(query)
+    if not terms:
+        return qs.none()
+    vendor = connection.vendor
+    if vendor == "postgresql":
+        tsquery = f"websearch_to_tsquery('{PG_CONFIG}', %s)"
+        return qs.annotate(
+            search_rank=RawSQL(f"ts_rank({TABLE}.search_vector, {tsquery})", [query], output_field=FloatField())
+        ).filter(RawSQL(f"{TABLE}.search_vector @@ {tsquery}", [query], output_field=BooleanField()))
+    if vendor == "sqlite":
+        expr = fts5_expression(query)
+        return qs.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expr])
+        ).annotate(
+            search_rank=RawSQL(
+                f"(SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid = {TABLE}.id)",
+                [expr],
+                output_field=FloatField(),
+            )
+        )
+    cond = Q()
+    for t in terms:
+        cond &= Q(title__icontains=t) | Q(description__icontains=t)
+    return qs.filter(cond).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+class DefectSearchFilter(BaseFilterBackend):
+    search_param = "q"
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param)
+        if not query:
+            return queryset
+        return search_defects(queryset, query)
+
+PG_INSTALL = [
+    f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    f"""
+    CREATE OR REPLACE FUNCTION {TABLE}_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{PG_CONFIG}', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('{PG_CONFIG}', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"DROP TRIGGER IF EXISTS {TABLE}_search_vector_trg ON {TABLE}",
+    f"""
+    CREATE TRIGGER {TABLE}_search_vector_trg
+    BEFORE INSERT OR UPDATE OF title, description ON {TABLE}
+    FOR EACH ROW EXECUTE FUNCTION {TABLE}_search_vector_update()
+    """,
+    f"CREATE INDEX IF NOT EXISTS {TABLE}_search_vector_gin ON {TABLE} USING gin (search_vector)",
+]
+
+PG_BACKFILL = f"""
+    UPDATE {TABLE} SET search_vector =
+        setweight(to_tsvector('{PG_CONFIG}', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('{PG_CONFIG}', coalesce(description, '')), 'B')
+    WHERE search_vector IS NULL
+"""
+
+SQLITE_TRIGGERS = {
+    f"{FTS_TABLE}_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END
+    """,
+    f"{FTS_TABLE}_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        END
+    """,
+    f"{FTS_TABLE}_au": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, description ON {TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END
+    """,
+}
+
+def install(conn, backfill=False):
+    """Create (or repair) the search index for the given connection. Idempotent."""
+    with conn.cursor() as cursor:
+        if conn.vendor == "postgresql":
+            for sql in PG_INSTALL:
+                cursor.execute(sql)
+            if backfill:
+                cursor.execute(PG_BACKFILL)
+        elif conn.vendor == "sqlite":
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                f"title, description, content='{TABLE}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [TABLE]
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = [name for name in SQLITE_TRIGGERS if name not in existing]
+            for name in missing:
+                cursor.execute(SQLITE_TRIGGERS[name])
+            # Пересоздание таблицы при миграциях SQLite удаляет триггеры, индекс мог устареть.
+            if missing or backfill:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+def uninstall(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == "postgresql":
+            cursor.execute(f"DROP TRIGGER IF EXISTS {TABLE}_search_vector_trg ON {TABLE}")
+            cursor.execute(f"DROP FUNCTION IF EXISTS {TABLE}_search_vector_update()")
+            cursor.execute(f"ALTER TABLE {TABLE} DROP COLUMN IF EXISTS search_vector")
+        elif conn.vendor == "sqlite":
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Defect, Attachment, Comment, StatusHistory
+from users.models import User
+from .models import Defect, DefectConflict, Attachment, Comment, StatusHistory
 
 class AttachmentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -16,7 +17,58 @@ class StatusHistorySerializer(serializers.ModelSerializer):
         model = StatusHistory
         fields = ["id", "defect", "old_status", "new_status", "changed_by", "changed_at"]
 
-class DefectSerializer(serializers.ModelSerializer):
+EXPANDABLE = {
+    "attachments": AttachmentSerializer,
+    "comments": CommentSerializer,
+    "status_history": StatusHistorySerializer,
+}
+
+def query_list(request, name):
+    if request is None:
+        return []
+    return [v.strip() for v in request.query_params.get(name, "").split(",") if v.strip()]
+
+def requested_expansions(request):
+    return [name for name in query_list(request, "expand") if name in EXPANDABLE]
+
+class SparseFieldsMixin:
+    """Honour ?fields=a,b (sparse fieldset) and ?expand=comments,... on reads."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get("request")
+        if request is None or request.method not in ("GET", "HEAD"):
+            return fields
+        expanded = requested_expansions(request)
+        for name in expanded:
+            fields.setdefault(name, EXPANDABLE[name](many=True, read_only=True))
+        only = set(query_list(request, "fields"))
+        if only:
+            for name in list(fields):
+                if name not in only and name not in expanded:
+                    fields.pop(name)
+        return fields
+
+class DefectListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Defect
+        fields = [
+            "id",
+            "project",
+            "stage",
+            "title",
+            "description",
+            "priority",
+            "status",
+            "performer",
+            "deadline",
+            "created_at",
+            "updated_at",
+            "version",
+        ]
+        read_only_fields = ["version"]
+
+class DefectSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     attachments = AttachmentSerializer(many=True, read_only=True)
     comments = CommentSerializer(many=True, read_only=True)
     status_history = StatusHistorySerializer(many=True, read_only=True)
@@ -35,7 +87,35 @@ class DefectSerializer(serializers.ModelSerializer):
             "deadline",
             "created_at",
             "updated_at",
+            "version",
             "attachments",
             "comments",
             "status_history",
-        ]
\ No newline at end of file
+        ]
+        extra_kwargs = {"version": {"required": False}}
+
+    def create(self, validated_data):
+        validated_data.pop("version", None)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        version = validated_data.pop("version", None)
+        if version is not None and version != instance.version:
+            raise DefectConflict(instance)
+        return super().update(instance, validated_data)
+
+class DefectBulkSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000)
+    status = serializers.ChoiceField(choices=Defect.STATUS_CHOICES, required=False)
+    priority = serializers.ChoiceField(choices=Defect.PRIORITY_CHOICES, required=False)
+    performer = serializers.PrimaryKeyRelatedField(
+        queryset=User.objects.filter(role=User.ROLE_ENGINEER, is_active=True), allow_null=True, required=False
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+    def validate(self, attrs):
+        if not {"status", "priority", "performer"} & set(attrs):
+            raise serializers.ValidationError("Укажите status, priority или performer")
+        return attrs
@@ -1,6 +1,11 @@
 from django.db import transaction
+from django.utils import timezone
 from users.models import User
-from .models import Defect, StatusHistory
+from activity import feed
+from activity.models import ActivityEvent
+from . import stats
+from .models import Defect, DefectConflict, StatusHistory
+from .signals import defects_bulk_changed
 
 ALLOWED_TRANSITIONS = {
     Defect.STATUS_NEW: {Defect.STATUS_IN_PROGRESS, Defect.STATUS_CANCELLED},
@@ -13,11 +18,8 @@ def can_assign_performer(user: User, performer: User):
         return False
     return True
 
-@transaction.atomic
-def change_status(defect: Defect, new_status: str, actor: User):
+def check_transition(defect: Defect, new_status: str, actor: User):
     current = defect.status
-    if new_status == current:
-        return defect
     allowed = ALLOWED_TRANSITIONS.get(current, set())
     if new_status not in allowed:
         raise ValueError("Недопустимый переход статуса")
@@ -31,7 +33,91 @@ def change_status(defect: Defect, new_status: str, actor: User):
             raise PermissionError("Недостаточно прав для изменения статуса")
     if new_status == Defect.STATUS_CLOSED and current != Defect.STATUS_REVIEW:
         raise ValueError("Нельзя закрыть дефект если статус не 'На проверке'")
-    StatusHistory.objects.create(defect=defect, old_status=current, new_status=new_status, changed_by=actor)
+
+def status_text(old_status, new_status):
+    labels = dict(Defect.STATUS_CHOICES)
+    return f"{labels.get(old_status, old_status)} → {labels.get(new_status, new_status)}"
+
+@transaction.atomic
+def change_status(defect: Defect, new_status: str, actor: User, version=None):
+    """Move the defect to `new_status`.
+
+    The write is conditional on the version the instance was loaded with
+    (or the `version` the client saw), so a concurrent transition makes
+    this one fail with DefectConflict instead of writing a second history row.
+    """
+    if version is not None and version != defect.version:
+        raise DefectConflict(defect)
+    current = defect.status
+    if new_status == current:
+        return defect
+    check_transition(defect, new_status, actor)
     defect.status = new_status
-    defect.save(update_fields=["status", "updated_at"])
-    return defect
\ No newline at end of file
+    try:
+        defect.save(update_fields=["status", "updated_at"])
+    except DefectConflict:
+        defect.status = current
+        raise
+    StatusHistory.objects.create(defect=defect, old_status=current, new_status=new_status, changed_by=actor)
+    feed.record(
+        ActivityEvent.SCOPE_DEFECTS, ActivityEvent.KIND_STATUS, defect, actor,
+        text=status_text(current, new_status), old_status=current, new_status=new_status,
+    )
+    return defect
+
+UNSET = object()
+
+@transaction.atomic
+def bulk_change(queryset, ids, actor: User, status=None, priority=None, performer=UNSET):
+    """Apply the same status/priority/performer change to many defects.
+
+    Every defect is checked like change_status() and the API permissions;
+    the accepted ones are written with one bulk_update() and one
+    bulk_create() of StatusHistory. Returns one {"id", "ok", "detail"}
+    result per requested id.
+    """
+    defects = queryset.select_related(None).prefetch_related(None).select_for_update(of=("self",)).in_bulk(ids)
+    now = timezone.now()
+    results, changed, history, events = [], [], [], []
+    for pk in ids:
+        defect = defects.get(pk)
+        if defect is None:
+            results.append({"id": pk, "ok": False, "detail": "Дефект не найден"})
+            continue
+        try:
+            if not actor.is_manager and not (actor.is_engineer and defect.performer_id == actor.id):
+                raise PermissionError("Недостаточно прав для изменения дефекта")
+            if status is not None and status != defect.status:
+                check_transition(defect, status, actor)
+        except (ValueError, PermissionError) as e:
+            results.append({"id": pk, "ok": False, "detail": str(e)})
+            continue
+        results.append({"id": pk, "ok": True})
+        dirty = False
+        if status is not None and status != defect.status:
+            history.append(StatusHistory(defect=defect, old_status=defect.status, new_status=status, changed_by=actor))
+            events.append((ActivityEvent.KIND_STATUS, defect, {
+                "text": status_text(defect.status, status), "old_status": defect.status, "new_status": status,
+            }))
+            defect.status, dirty = status, True
+        if priority is not None and priority != defect.priority:
+            events.append((ActivityEvent.KIND_UPDATED, defect, {}))
+            defect.priority, dirty = priority, True
+        if performer is not UNSET and getattr(performer, "pk", None) != defect.performer_id:
+            if performer is None:
+                events.append((ActivityEvent.KIND_UPDATED, defect, {}))
+            else:
+                events.append((ActivityEvent.KIND_ASSIGNED, defect, {"text": performer.username}))
+            defect.performer, dirty = performer, True
+        if dirty:
+            defect.updated_at = now
+            defect.version += 1
+            changed.append(defect)
+    if changed:
+        fields = ["status", "priority", "performer", "updated_at", "version"]
+        Defect.objects.bulk_update(changed, fields, batch_size=500)
+        StatusHistory.objects.bulk_create(history, batch_size=500)
+        stats.track_bulk(changed)
+        feed.record_many(ActivityEvent.SCOPE_DEFECTS, events, actor)
+        defects_bulk_changed.send(sender=Defect, defects=changed)
+    return results
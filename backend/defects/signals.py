@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Sent after bulk_change() writes defects with bulk_update(), which bypasses post_save.
+defects_bulk_changed = Signal()
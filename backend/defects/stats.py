@@ -0,0 +1,96 @@
+"""Incremental DefectStat rollup.
+
+Defect.save() and the post_delete signal move one unit between
+(project, performer, status, priority) keys inside the same transaction.
+QuerySet.update()/bulk_create() bypass this (services.bulk_change() calls
+track_bulk() itself); `manage.py rebuild_stats` reconciles the table with
+the defects.
+"""
+from collections import Counter
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+KEY_FIELDS = ("project_id", "performer_id", "status", "priority")
+KEY_NAMES = set(KEY_FIELDS) | {"project", "performer"}
+
+def key_of(defect):
+    return tuple(getattr(defect, f) for f in KEY_FIELDS)
+
+def loaded_key(defect):
+    """Key as stored in the database before this save."""
+    key = getattr(defect, "_stat_key", None)
+    if key is None and defect.pk is not None:
+        from .models import Defect
+        row = Defect.objects.filter(pk=defect.pk).values_list(*KEY_FIELDS).first()
+        key = tuple(row) if row else None
+    return key
+
+def tracks(update_fields):
+    return update_fields is None or bool(KEY_NAMES.intersection(update_fields))
+
+def lookup(key):
+    return dict(zip(KEY_FIELDS, key))
+
+def apply(key, delta):
+    from .models import DefectStat
+    rows = DefectStat.objects.filter(**lookup(key))
+    if rows.update(count=F("count") + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            DefectStat.objects.create(count=delta, **lookup(key))
+    except IntegrityError:
+        rows.update(count=F("count") + delta)
+
+def track_save(defect, old_key):
+    new_key = key_of(defect)
+    if old_key != new_key:
+        if old_key is not None:
+            apply(old_key, -1)
+        apply(new_key, 1)
+    defect._stat_key = new_key
+
+def track_bulk(defects):
+    """Rollup for defects written with bulk_update(): one update per changed key."""
+    deltas = Counter()
+    for defect in defects:
+        old_key, new_key = loaded_key(defect), key_of(defect)
+        if old_key != new_key:
+            deltas[old_key] -= 1
+            deltas[new_key] += 1
+        defect._stat_key = new_key
+    for key, delta in deltas.items():
+        if delta:
+            apply(key, delta)
+
+def track_delete(sender, instance, **kwargs):
+    apply(getattr(instance, "_stat_key", None) or key_of(instance), -1)
+
+def release_performer(sender, instance, **kwargs):
+    """Defects keep their counts when the performer is deleted (FK is SET_NULL)."""
+    from .models import DefectStat
+    for stat in DefectStat.objects.filter(performer_id=instance.pk, count__gt=0):
+        apply((stat.project_id, None, stat.status, stat.priority), stat.count)
+
+def actual_counts():
+    from .models import Defect
+    rows = Defect.objects.values_list(*KEY_FIELDS).annotate(n=Count("id")).order_by()
+    return {tuple(r[:4]): r[4] for r in rows}
+
+def stored_counts():
+    from .models import DefectStat
+    rows = DefectStat.objects.filter(count__gt=0).values_list(*KEY_FIELDS, "count")
+    return {tuple(r[:4]): r[4] for r in rows}
+
+def drift(actual, stored):
+    return sum(1 for k in actual.keys() | stored.keys() if actual.get(k, 0) != stored.get(k, 0))
+
+@transaction.atomic
+def rebuild():
+    """Replace the rollup with fresh counts; returns the number of keys that had drifted."""
+    from .models import DefectStat
+    actual = actual_counts()
+    drifted = drift(actual, stored_counts())
+    DefectStat.objects.all().delete()
+    DefectStat.objects.bulk_create(DefectStat(count=n, **lookup(k)) for k, n in actual.items())
+    return drifted
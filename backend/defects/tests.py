@@ -1,12 +1,14 @@
 import pytest
 from django.contrib.auth import get_user_model
 from projects.models import Project, Stage
-from defects.models import Defect
+from defects.models import Defect, Comment, Attachment
 from defects.services import change_status
 from django.test import Client
 from rest_framework.test import APIClient
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 User = get_user_model()
 
@@ -137,6 +139,28 @@ def test_web_defect_assign_invalid_username_error():
     assert resp.status_code == 200
     assert "username" in resp.context.get("form").errors
 
+@pytest.mark.django_db
+def test_web_defect_assign_conflict_rerenders_form(monkeypatch):
+    from django.db.models import F
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    e = User.objects.create_user(username="e", email="e@example.com", password="x", role="engineer")
+    p = Project.objects.create(title="P")
+    d = Defect.objects.create(project=p, title="D")
+    save = Defect.save
+
+    def concurrent_save(self, *args, **kwargs):
+        Defect.objects.filter(pk=self.pk).update(version=F("version") + 1)
+        return save(self, *args, **kwargs)
+
+    monkeypatch.setattr(Defect, "save", concurrent_save)
+    client = Client()
+    client.login(username="m", password="x")
+    resp = client.post(f"/defects/{d.id}/assign/", {"username": "e"})
+    assert resp.status_code == 200
+    assert resp.context["form"].non_field_errors()
+    d.refresh_from_db()
+    assert d.performer_id is None
+
 @pytest.mark.django_db
 def test_api_defects_list_manager_ok():
     m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
@@ -147,8 +171,8 @@ def test_api_defects_list_manager_ok():
     client.force_authenticate(user=m)
     resp = client.get("/api/defects/")
     assert resp.status_code == 200
-    assert isinstance(resp.data, list)
-    assert len(resp.data) == 1
+    assert isinstance(resp.data["results"], list)
+    assert len(resp.data["results"]) == 1
 
 @pytest.mark.django_db
 def test_api_change_status_invalid_transition_400():
@@ -255,4 +279,366 @@ def test_api_sql_injection_attempt_no_error_and_no_bypass():
     assert r.status_code in (200, 400)
     data = r.json()
     titles = [d["title"] for d in data] if isinstance(data, list) else [item.get("title") for item in data.get("results", [])]
-    assert "B1" not in titles
\ No newline at end of file
+    assert "B1" not in titles
+
+@pytest.mark.django_db
+def test_api_defects_cursor_pagination_walks_all_pages():
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    s = Stage.objects.create(project=p, title="S")
+    ids = [Defect.objects.create(project=p, stage=s, title=f"D{i}").id for i in range(5)]
+    client = APIClient()
+    client.force_authenticate(user=m)
+    resp = client.get("/api/defects/", {"page_size": 2})
+    seen = [d["id"] for d in resp.data["results"]]
+    assert resp.data["previous"] is None
+    while resp.data["next"]:
+        resp = client.get(resp.data["next"])
+        seen += [d["id"] for d in resp.data["results"]]
+    assert seen == sorted(ids, reverse=True)
+    back = client.get(resp.data["previous"])
+    assert [d["id"] for d in back.data["results"]] == seen[2:4]
+
+@pytest.mark.django_db
+def test_keyset_seek_is_an_index_range_scan():
+    from django.db import connection
+    from defects.pagination import KeysetPaginator, decode_cursor
+    p = Project.objects.create(title="P")
+    for i in range(5):
+        Defect.objects.create(project=p, title=f"D{i}")
+    paginator = KeysetPaginator("created_at", 2)
+    value, pk, _ = decode_cursor(paginator.paginate(Defect.objects.all()).next_cursor)
+    qs = paginator.order(paginator._seek(Defect.objects.all(), value, pk, False))
+    where = str(qs.query).split(" WHERE ", 1)[1]
+    # a bare range bound ANDed with the tie-break OR, not only the OR
+    assert where.startswith('("defects_defect"."created_at" <= ') and " AND (" in where
+    if connection.vendor == "sqlite":
+        plan = qs.explain()
+        assert "defect_created_id_idx (created_at<?)" in plan, plan
+    assert [d.pk for d in qs] == sorted(Defect.objects.filter(pk__lt=pk).values_list("pk", flat=True), reverse=True)
+
+@pytest.mark.django_db
+def test_api_defects_invalid_cursor_404():
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    client = APIClient()
+    client.force_authenticate(user=m)
+    resp = client.get("/api/defects/", {"cursor": "garbage"})
+    assert resp.status_code == 404
+
+@pytest.mark.django_db
+def test_api_comments_paginated_chronologically():
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    d = Defect.objects.create(project=p, title="D")
+    client = APIClient()
+    client.force_authenticate(user=m)
+    for i in range(3):
+        client.post(f"/api/defects/{d.id}/comments/", {"text": f"c{i}"}, format="json")
+    resp = client.get(f"/api/defects/{d.id}/comments/", {"page_size": 2})
+    assert [c["text"] for c in resp.data["results"]] == ["c0", "c1"]
+    resp = client.get(resp.data["next"])
+    assert [c["text"] for c in resp.data["results"]] == ["c2"]
+    assert resp.data["next"] is None
+
+@pytest.mark.django_db
+def test_web_defects_list_keyset_pages():
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    for i in range(55):
+        Defect.objects.create(project=p, title=f"D{i}")
+    client = Client()
+    client.login(username="m", password="x")
+    resp = client.get("/defects/")
+    assert len(resp.context["defects"]) == 50
+    assert resp.context["previous_url"] is None
+    resp2 = client.get(resp.context["next_url"])
+    assert [d.title for d in resp2.context["defects"]] == [f"D{i}" for i in range(4, -1, -1)]
+    assert resp2.context["next_url"] is None
+    assert client.get("/defects/", {"cursor": "bad"}).status_code == 404
+
+@pytest.mark.django_db
+def test_api_defects_list_is_lean_and_supports_sparse_fields():
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    d = Defect.objects.create(project=p, title="D")
+    Comment.objects.create(defect=d, author=m, text="c")
+    client = APIClient()
+    client.force_authenticate(user=m)
+    item = client.get("/api/defects/").data["results"][0]
+    assert "comments" not in item and "attachments" not in item and "status_history" not in item
+    item = client.get("/api/defects/", {"fields": "id,title", "expand": "comments"}).data["results"][0]
+    assert set(item) == {"id", "title", "comments"}
+    assert item["comments"][0]["text"] == "c"
+    detail = client.get(f"/api/defects/{d.id}/").data
+    assert len(detail["comments"]) == 1
+
+@pytest.mark.django_db
+def test_api_defects_list_query_count_is_constant():
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    client = APIClient()
+    client.force_authenticate(user=m)
+
+    def count_queries(n):
+        for i in range(n):
+            d = Defect.objects.create(project=p, title=f"D{i}")
+            Comment.objects.create(defect=d, author=m, text="c")
+            Attachment.objects.create(defect=d, file="attachments/x.jpg")
+        with CaptureQueriesContext(connection) as ctx:
+            resp = client.get("/api/defects/", {"expand": "comments,attachments,status_history"})
+        assert resp.status_code == 200
+        return len(ctx.captured_queries)
+
+    small = count_queries(2)
+    large = count_queries(10)
+    assert small == large
+
+@pytest.mark.django_db
+def test_search_matches_russian_word_forms_and_ranks_title_first():
+    from defects.search import search_defects
+    p = Project.objects.create(title="P")
+    d1 = Defect.objects.create(project=p, title="Трещина в стене", description="")
+    d2 = Defect.objects.create(project=p, title="Осмотр", description="Найдены трещины на фасаде")
+    Defect.objects.create(project=p, title="Протечка крыши", description="")
+    found = list(search_defects(Defect.objects.all(), "трещины").order_by("-search_rank"))
+    assert found == [d1, d2]
+    d1.title = "Скол плитки"
+    d1.save()
+    assert list(search_defects(Defect.objects.all(), "трещина")) == [d2]
+    assert not search_defects(Defect.objects.all(), "\"'*)").exists()
+
+@pytest.mark.django_db
+def test_api_and_export_search_q_param():
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    Defect.objects.create(project=p, title="Протечка крыши")
+    Defect.objects.create(project=p, title="Скол плитки")
+    api = APIClient()
+    api.force_authenticate(user=m)
+    resp = api.get("/api/defects/", {"q": "протечки"})
+    assert [d["title"] for d in resp.data["results"]] == ["Протечка крыши"]
+    client = Client()
+    client.login(username="m", password="x")
+    text = b"".join(client.get("/defects/export/csv/", {"q": "плитка"}).streaming_content).decode("utf-8")
+    assert "Скол плитки" in text and "Протечка" not in text
+    html = client.get("/defects/", {"q": "крыша"}).content.decode("utf-8")
+    assert "Протечка крыши" in html and "Скол плитки" not in html
+
+@pytest.mark.django_db
+def test_search_q_lists_by_rank_with_offset_pages():
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    titled = Defect.objects.create(project=p, title="Трещина в стене")
+    for i in range(3):
+        Defect.objects.create(project=p, title=f"Осмотр {i}", description="Найдены трещины на фасаде")
+    api = APIClient()
+    api.force_authenticate(user=m)
+    resp = api.get("/api/defects/", {"q": "трещина", "page_size": 2})
+    assert resp.data["results"][0]["id"] == titled.id and resp.data["previous"] is None
+    rest = api.get(resp.data["next"]).data
+    assert len(rest["results"]) == 2 and rest["next"] is None and rest["previous"]
+    ids = [d["id"] for d in resp.data["results"] + rest["results"]]
+    assert sorted(ids) == sorted(Defect.objects.values_list("id", flat=True))
+    client = Client()
+    client.login(username="m", password="x")
+    resp = client.get("/defects/", {"q": "трещина"})
+    assert [d.id for d in resp.context["defects"]][0] == titled.id
+    assert client.get("/defects/", {"q": "трещина", "cursor": "bm9wZQ"}).status_code == 404
+
+@pytest.mark.django_db
+def test_defect_stats_follow_save_status_change_and_delete():
+    from defects import stats
+    from defects.models import DefectStat
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    e = User.objects.create_user(username="e", email="e@example.com", password="x", role="engineer")
+    p = Project.objects.create(title="P")
+    d1 = Defect.objects.create(project=p, title="D1", priority="high", performer=e)
+    d2 = Defect.objects.create(project=p, title="D2")
+    change_status(Defect.objects.get(pk=d1.pk), Defect.STATUS_IN_PROGRESS, m)
+    d2.priority = "low"
+    d2.save()
+    Defect.objects.create(project=p, title="D3").delete()
+    assert stats.stored_counts() == {
+        (p.id, e.id, "in_progress", "high"): 1,
+        (p.id, None, "new", "low"): 1,
+    }
+    e.delete()
+    assert stats.stored_counts() == stats.actual_counts()
+    assert not DefectStat.objects.filter(performer__isnull=False).exists()
+
+@pytest.mark.django_db
+def test_rebuild_stats_fixes_drift():
+    from django.core.management import call_command
+    from defects import stats
+    p = Project.objects.create(title="P")
+    Defect.objects.create(project=p, title="D1")
+    Defect.objects.filter(project=p).update(status=Defect.STATUS_CLOSED)
+    assert stats.drift(stats.actual_counts(), stats.stored_counts()) == 2
+    call_command("rebuild_stats")
+    assert stats.stored_counts() == {(p.id, None, "closed", "medium"): 1}
+
+@pytest.mark.django_db
+def test_defect_save_validates_performer_only_when_it_changes():
+    from defects.models import check_performers
+    e = User.objects.create_user(username="e", email="e@example.com", password="x", role="engineer")
+    o = User.objects.create_user(username="o", email="o@example.com", password="x", role="observer")
+    p = Project.objects.create(title="P")
+    d = Defect.objects.create(project=p, title="D", performer=e)
+    d = Defect.objects.get(pk=d.pk)
+    with CaptureQueriesContext(connection) as ctx:
+        d.status = Defect.STATUS_IN_PROGRESS
+        d.save(update_fields=["status", "updated_at"])
+        d.title = "D2"
+        d.save()
+    assert not any('"users_user"' in q["sql"] for q in ctx.captured_queries)
+    d.performer_id = o.pk
+    with pytest.raises(ValueError):
+        d.save()
+    with CaptureQueriesContext(connection) as ctx:
+        with pytest.raises(ValueError):
+            check_performers([e.pk, o.pk, None])
+        check_performers([e.pk])
+    assert len(ctx.captured_queries) == 2
+
+@pytest.mark.django_db
+def test_api_bulk_change_status_and_performer_per_item_results():
+    from defects import stats
+    from defects.models import StatusHistory
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    e = User.objects.create_user(username="e", email="e@example.com", password="x", role="engineer")
+    p = Project.objects.create(title="P")
+    ok = [Defect.objects.create(project=p, title=f"D{i}", status=Defect.STATUS_REVIEW) for i in range(20)]
+    bad = Defect.objects.create(project=p, title="N", status=Defect.STATUS_NEW)
+    client = APIClient()
+    client.force_authenticate(user=m)
+    ids = [d.id for d in ok] + [bad.id, 999999]
+    with CaptureQueriesContext(connection) as ctx:
+        resp = client.post("/api/defects/bulk/", {"ids": ids, "status": "closed", "performer": e.id}, format="json")
+    assert resp.status_code == 200
+    assert len(ctx.captured_queries) < 25
+    assert resp.data["updated"] == 20
+    by_id = {r["id"]: r for r in resp.data["results"]}
+    assert not by_id[bad.id]["ok"] and not by_id[999999]["ok"]
+    assert set(Defect.objects.filter(id__in=[d.id for d in ok]).values_list("status", "performer_id")) == {("closed", e.id)}
+    assert StatusHistory.objects.filter(new_status="closed").count() == 20
+    assert Defect.objects.get(pk=bad.pk).status == Defect.STATUS_NEW
+    assert stats.drift(stats.actual_counts(), stats.stored_counts()) == 0
+    client.force_authenticate(user=e)
+    resp = client.post("/api/defects/bulk/", {"ids": [bad.id], "priority": "high"}, format="json")
+    assert resp.data["updated"] == 0
+
+@pytest.mark.django_db
+def test_web_bulk_assign_and_close_manager_only():
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    e = User.objects.create_user(username="e", email="e@example.com", password="x", role="engineer")
+    p = Project.objects.create(title="P")
+    d1 = Defect.objects.create(project=p, title="A", status=Defect.STATUS_REVIEW)
+    d2 = Defect.objects.create(project=p, title="B")
+    client = Client()
+    client.login(username="e", password="x")
+    assert client.post("/defects/bulk/", {"ids": [d1.id], "action": "close"}).status_code == 403
+    client.login(username="m", password="x")
+    assert b'name="ids"' in client.get("/defects/").content
+    resp = client.post("/defects/bulk/", {"ids": [d1.id, d2.id], "action": "assign", "performer": e.id})
+    assert resp.status_code == 302
+    assert set(Defect.objects.values_list("performer_id", flat=True)) == {e.id}
+    client.post("/defects/bulk/", {"ids": [d1.id, d2.id], "action": "close"})
+    assert Defect.objects.get(pk=d1.pk).status == Defect.STATUS_CLOSED
+    assert Defect.objects.get(pk=d2.pk).status == Defect.STATUS_NEW
+
+@pytest.mark.django_db
+def test_api_stale_status_change_returns_409_with_current_state():
+    from defects.models import DefectConflict, StatusHistory
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    d = Defect.objects.create(project=p, title="D")
+    stale = Defect.objects.get(pk=d.pk)
+    change_status(Defect.objects.get(pk=d.pk), Defect.STATUS_IN_PROGRESS, m)
+    with pytest.raises(DefectConflict):
+        change_status(stale, Defect.STATUS_CANCELLED, m)
+    client = APIClient()
+    client.force_authenticate(user=m)
+    resp = client.post(f"/api/defects/{d.id}/change_status/", {"status": "review", "version": 0}, format="json")
+    assert resp.status_code == 409
+    assert resp.data["current"]["status"] == "in_progress" and resp.data["current"]["version"] == 1
+    resp = client.patch(f"/api/defects/{d.id}/", {"title": "X", "version": 0}, format="json")
+    assert resp.status_code == 409
+    resp = client.post(f"/api/defects/{d.id}/change_status/", {"status": "review", "version": 1}, format="json")
+    assert resp.status_code == 200 and resp.data["version"] == 2
+    assert list(StatusHistory.objects.filter(defect=d).values_list("new_status", flat=True).order_by("id")) == ["in_progress", "review"]
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_status_changes_keep_history_linear():
+    import threading
+    from django.db import connections
+    from defects.models import DefectConflict, StatusHistory
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    d = Defect.objects.create(project=p, title="D")
+    path = [Defect.STATUS_IN_PROGRESS, Defect.STATUS_REVIEW, Defect.STATUS_CLOSED]
+    wins = 0
+    for target in path:
+        barrier = threading.Barrier(8)
+        outcomes = []
+
+        def worker():
+            try:
+                defect = Defect.objects.get(pk=d.pk)
+                barrier.wait()
+                try:
+                    change_status(defect, target, m)
+                    outcomes.append("ok")
+                except Exception as e:
+                    outcomes.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        losers = [o for o in outcomes if o != "ok"]
+        assert outcomes.count("ok") == 1, outcomes
+        assert len(losers) == 7 and all(isinstance(e, DefectConflict) for e in losers), losers
+        wins += 1
+        assert Defect.objects.get(pk=d.pk).status == target
+        assert StatusHistory.objects.filter(defect=d).count() == wins
+    rows = list(StatusHistory.objects.filter(defect=d).order_by("changed_at", "id").values_list("old_status", "new_status"))
+    assert rows == [("new", "in_progress"), ("in_progress", "review"), ("review", "closed")]
+    assert Defect.objects.get(pk=d.pk).version == 3
+
+@pytest.mark.django_db
+def test_api_defect_detail_etag_304_and_child_changes():
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    d = Defect.objects.create(project=p, title="D")
+    client = APIClient()
+    client.force_authenticate(user=m)
+    resp = client.get(f"/api/defects/{d.id}/")
+    etag = resp["ETag"]
+    assert etag.startswith('W/"') and resp.has_header("Last-Modified")
+    with CaptureQueriesContext(connection) as ctx:
+        resp = client.get(f"/api/defects/{d.id}/", HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 304 and len(ctx.captured_queries) == 1
+    Comment.objects.create(defect=d, author=m, text="c")
+    resp = client.get(f"/api/defects/{d.id}/", HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 200 and resp["ETag"] != etag
+    assert client.get(f"/api/defects/{d.id}/?expand=comments", HTTP_IF_NONE_MATCH=resp["ETag"]).status_code == 200
+
+@pytest.mark.django_db
+def test_api_defect_detail_304_checks_object_permissions(monkeypatch):
+    from defects.permissions import DefectPermission
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    e = User.objects.create_user(username="e", email="e@example.com", password="x", role="engineer")
+    p = Project.objects.create(title="P")
+    p.members.add(e)
+    d = Defect.objects.create(project=p, title="D")
+    client = APIClient()
+    client.force_authenticate(user=m)
+    etag = client.get(f"/api/defects/{d.id}/")["ETag"]
+    # a rule that hides the defect from the engineer must hold for revalidation too
+    monkeypatch.setattr(DefectPermission, "has_object_permission", lambda self, request, view, obj: request.user.is_manager)
+    client.force_authenticate(user=e)
+    assert client.get(f"/api/defects/{d.id}/").status_code == 403
+    assert client.get(f"/api/defects/{d.id}/", HTTP_IF_NONE_MATCH=etag).status_code == 403
@@ -4,55 +4,147 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.parsers import MultiPartParser, FormParser
-from .models import Defect, Attachment, Comment
-from .serializers import DefectSerializer, AttachmentSerializer, CommentSerializer
+from django.db.models import Count, Max, OuterRef, Subquery
+from config.conditional import conditional, weak_etag
+from activity import feed
+from activity.models import ActivityEvent
+from projects.access import member_project_ids
+from .models import Defect, DefectConflict, Attachment, Comment, StatusHistory
+from .serializers import (
+    DefectSerializer,
+    DefectListSerializer,
+    DefectBulkSerializer,
+    AttachmentSerializer,
+    CommentSerializer,
+    EXPANDABLE,
+    requested_expansions,
+)
 from .permissions import DefectPermission
-from .services import change_status, can_assign_performer
+from .pagination import DefectPagination, CommentPagination, AttachmentPagination
+from .search import DefectSearchFilter
+from .services import UNSET, bulk_change, change_status, can_assign_performer
+
+CHILD_MARKERS = {
+    "comments": (Comment, "created_at"),
+    "attachments": (Attachment, "uploaded_at"),
+    "status_history": (StatusHistory, "changed_at"),
+}
+
+def child_marker(model, aggregate):
+    rows = model.objects.filter(defect=OuterRef("pk")).order_by().values("defect")
+    return Subquery(rows.annotate(v=aggregate).values("v")[:1])
+
+def defect_validators(queryset, pk):
+    """(light instance, ETag parts, Last-Modified) of one defect and its children from a single query, or None."""
+    markers = {}
+    for name, (model, field) in CHILD_MARKERS.items():
+        markers[f"{name}_n"] = child_marker(model, Count("id"))
+        markers[f"{name}_at"] = child_marker(model, Max(field))
+    obj = (
+        queryset.select_related(None).prefetch_related(None).filter(pk=pk)
+        .annotate(**markers).only("version", "updated_at", "project", "performer").first()
+    )
+    if obj is None:
+        return None
+    row = {name: getattr(obj, name) for name in ("version", "updated_at", *markers)}
+    stamps = [row["updated_at"]] + [row[f"{name}_at"] for name in CHILD_MARKERS]
+    return obj, tuple(sorted(row.items())), max(s for s in stamps if s is not None)
 
 class DefectViewSet(viewsets.ModelViewSet):
     serializer_class = DefectSerializer
     permission_classes = [IsAuthenticated, DefectPermission]
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, DefectSearchFilter]
+    pagination_class = DefectPagination
     filterset_fields = ["project", "performer", "status", "priority"]
-    search_fields = ["title", "description"]
     ordering_fields = ["created_at", "updated_at", "deadline"]
 
+    def get_serializer_class(self):
+        if self.action == "list":
+            return DefectListSerializer
+        if self.action == "bulk":
+            return DefectBulkSerializer
+        return DefectSerializer
+
+    def handle_exception(self, exc):
+        if isinstance(exc, DefectConflict):
+            return Response({"detail": str(exc), "current": DefectSerializer(exc.current).data}, status=status.HTTP_409_CONFLICT)
+        return super().handle_exception(exc)
+
     def get_queryset(self):
-        qs = Defect.objects.select_related("project", "stage", "performer")
+        if self.action == "list":
+            qs = Defect.objects.prefetch_related(*requested_expansions(self.request))
+        else:
+            qs = Defect.objects.select_related("project", "stage", "performer")
+            if self.action in ("retrieve", "update", "partial_update"):
+                qs = qs.prefetch_related(*EXPANDABLE)
         user = self.request.user
         if user.is_manager:
             return qs
-        if user.is_engineer:
-            return qs.filter(project__members=user)
-        return qs.filter(project__members=user)
+        return qs.filter(project_id__in=member_project_ids(user))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = str(kwargs.get("pk", ""))
+        validators = defect_validators(self.get_queryset(), int(pk)) if pk.isdigit() else None
+        if validators is None:
+            return super().retrieve(request, *args, **kwargs)
+        obj, parts, last_modified = validators
+        # a 304 confirms the defect exists and is readable, so it needs the same check as a 200
+        self.check_object_permissions(request, obj)
+        etag = weak_etag("defect", pk, parts, request.query_params.get("fields"), request.query_params.get("expand"))
+        return conditional(request, etag, last_modified, lambda: super(DefectViewSet, self).retrieve(request, *args, **kwargs))
 
     def perform_create(self, serializer):
         performer = serializer.validated_data.get("performer")
         if not can_assign_performer(self.request.user, performer):
             raise ValueError("Нельзя назначить наблюдателя исполнителем")
-        serializer.save()
+        defect = serializer.save()
+        feed.record(ActivityEvent.SCOPE_DEFECTS, ActivityEvent.KIND_CREATED, defect, self.request.user, status=defect.status)
 
     def perform_update(self, serializer):
         performer = serializer.validated_data.get("performer")
         if performer is not None and not can_assign_performer(self.request.user, performer):
             raise ValueError("Нельзя назначить наблюдателя исполнителем")
-        serializer.save()
+        defect = serializer.save()
+        feed.record(ActivityEvent.SCOPE_DEFECTS, ActivityEvent.KIND_UPDATED, defect, self.request.user)
+
+    def perform_destroy(self, instance):
+        deleted = dict(object_id=instance.pk, object_repr=str(instance), project_id=instance.project_id, status=instance.status)
+        instance.delete()
+        feed.record(ActivityEvent.SCOPE_DEFECTS, ActivityEvent.KIND_DELETED, actor=self.request.user, **deleted)
 
     @action(detail=True, methods=["post"]) 
     def change_status(self, request, pk=None):
         defect = self.get_object()
         new_status = request.data.get("status")
+        version = request.data.get("version")
         try:
-            change_status(defect, new_status, request.user)
+            version = None if version in (None, "") else int(version)
+        except (TypeError, ValueError):
+            return Response({"detail": "Некорректная версия"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            change_status(defect, new_status, request.user, version=version)
         except (ValueError, PermissionError) as e:
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response(DefectSerializer(defect).data)
 
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        results = bulk_change(
+            self.get_queryset(), data["ids"], request.user,
+            status=data.get("status"), priority=data.get("priority"), performer=data.get("performer", UNSET),
+        )
+        return Response({"updated": sum(r["ok"] for r in results), "results": results})
+
     @action(detail=True, methods=["get", "post"], parser_classes=[MultiPartParser, FormParser])
     def attachments(self, request, pk=None):
         defect = self.get_object()
         if request.method == "GET":
-            return Response(AttachmentSerializer(defect.attachments.all(), many=True).data)
+            paginator = AttachmentPagination()
+            page = paginator.paginate_queryset(defect.attachments.all(), request, view=self)
+            return paginator.get_paginated_response(AttachmentSerializer(page, many=True).data)
         file = request.FILES.get("file")
         if not file:
             return Response({"detail": "file required"}, status=400)
@@ -63,7 +155,9 @@ class DefectViewSet(viewsets.ModelViewSet):
     def comments(self, request, pk=None):
         defect = self.get_object()
         if request.method == "GET":
-            return Response(CommentSerializer(defect.comments.all(), many=True).data)
+            paginator = CommentPagination()
+            page = paginator.paginate_queryset(defect.comments.all(), request, view=self)
+            return paginator.get_paginated_response(CommentSerializer(page, many=True).data)
         text = request.data.get("text")
         if not text:
             return Response({"detail": "text required"}, status=400)
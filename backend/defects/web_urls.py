@@ -13,12 +13,14 @@ from .web_views import (
     DefectExportCSVView,
     DefectExportExcelView,
     DefectAcceptView,
+    DefectBulkView,
     DefectSubmitReportView,
 )
 
 urlpatterns = [
     path("", DefectListView.as_view(), name="defects_list"),
     path("create/", DefectCreateView.as_view(), name="defect_create"),
+    path("bulk/", DefectBulkView.as_view(), name="defects_bulk"),
     path("<int:pk>/", DefectDetailView.as_view(), name="defect_detail"),
     path("<int:pk>/edit/", DefectUpdateView.as_view(), name="defect_edit"),
     path("<int:pk>/change_status/", DefectStatusUpdateView.as_view(), name="defect_change_status"),
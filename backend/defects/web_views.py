@@ -3,17 +3,40 @@ from django.views.generic import ListView, DetailView, CreateView, UpdateView, F
 from django.views import View
 from django.urls import reverse_lazy
 from django.contrib import messages
-from django.contrib.admin.models import LogEntry, ADDITION, CHANGE, DELETION
-from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
-from django.http import HttpResponse
-import csv
+from django.http import Http404
 from django.shortcuts import redirect
-from django.db.models import Q
-from .models import Defect, Attachment, Comment
-from .forms import DefectForm, DefectStatusForm, AttachmentForm, CommentForm, AssignPerformerForm
-from .services import change_status
+from django.db.models import Prefetch, Q, Count
+from .models import Defect, DefectConflict, Attachment, Comment, StatusHistory
+from .forms import DefectForm, DefectStatusForm, AttachmentForm, CommentForm, AssignPerformerForm, DefectBulkForm
+from .services import bulk_change, change_status
+from .pagination import InvalidCursor, page_links, paginator_for
+from .search import search_defects
+from projects.access import member_project_ids
 from django.contrib.auth import get_user_model
+from reports.exports import Column, Export, choice_labels, csv_response, xlsx_response
+from activity import feed
+from activity.models import ActivityEvent
+
+STATUS_LABELS = choice_labels(Defect.STATUS_CHOICES)
+PRIORITY_LABELS = choice_labels(Defect.PRIORITY_CHOICES)
+
+DEFECTS_EXPORT_COLUMNS = [
+    Column("Проект", "project__title", kind="shared"),
+    Column("Название", "title"),
+    Column("Статус", "status", labels=STATUS_LABELS),
+    Column("Приоритет", "priority", labels=PRIORITY_LABELS),
+    Column("Исполнитель", "performer__username", kind="shared"),
+    Column("Срок", "deadline", kind="date"),
+]
+
+DEFECT_EXPORT_COLUMNS = DEFECTS_EXPORT_COLUMNS + [
+    Column("Этап", "stage__title", kind="shared"),
+    Column("Создан", "created_at", kind="datetime"),
+    Column("Описание", "description"),
+    Column("Вложений", "attachments_count", kind="number"),
+    Column("Комментариев", "comments_count", kind="number"),
+]
 
 class RoleMixin:
     def user_is_manager(self):
@@ -27,6 +50,7 @@ class DefectListView(LoginRequiredMixin, RoleMixin, ListView):
     model = Defect
     template_name = "defects/list.html"
     context_object_name = "defects"
+    paginate_by = 50
 
     def get_queryset(self):
         qs = Defect.objects.select_related("project", "stage", "performer")
@@ -39,7 +63,7 @@ class DefectListView(LoginRequiredMixin, RoleMixin, ListView):
         if user.is_manager:
             pass
         elif user.is_engineer:
-            qs = qs.filter(Q(project__members=user) | Q(performer=user))
+            qs = qs.filter(Q(project_id__in=member_project_ids(user)) | Q(performer=user))
         else:
             pass
         if project_id:
@@ -51,33 +75,31 @@ class DefectListView(LoginRequiredMixin, RoleMixin, ListView):
         if priority:
             qs = qs.filter(priority=priority)
         if search:
-            qs = qs.filter(Q(title__icontains=search) | Q(description__icontains=search))
-        return qs.order_by("-created_at")
+            qs = search_defects(qs, search)
+        return qs.order_by("-created_at", "-id")
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = paginator_for(queryset, "created_at", page_size)
+        try:
+            page = paginator.paginate(queryset, self.request.GET.get("cursor"))
+        except InvalidCursor:
+            raise Http404("Некорректный курсор")
+        return (None, page, page.items, page.has_next() or page.has_previous())
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        try:
-            ct = ContentType.objects.get_for_model(Defect)
-            entries = (
-                LogEntry.objects.filter(content_type_id=ct.id)
-                .order_by("-action_time")[:10]
-            )
-            action_map = {1: "создан дефект", 2: "отредактирован дефект", 3: "удалён дефект"}
-            recent = [
-                {
-                    "time": timezone.localtime(e.action_time).strftime("%H:%M"),
-                    "ts": int(e.action_time.timestamp()),
-                    "text": f"{action_map.get(e.action_flag, 'действие')} {e.object_repr}",
-                }
-                for e in entries
-            ]
-            ctx["recent_actions"] = recent
-        except Exception:
-            ctx["recent_actions"] = []
+        ctx["next_url"], ctx["previous_url"] = page_links(self.request, ctx["page_obj"])
+        ctx["recent_actions"] = feed.recent(ActivityEvent.SCOPE_DEFECTS)
+        if self.user_is_manager():
+            ctx["bulk_form"] = DefectBulkForm()
         return ctx
 
 class DefectDetailView(LoginRequiredMixin, RoleMixin, DetailView):
-    model = Defect
+    queryset = Defect.objects.select_related("project", "stage", "performer").prefetch_related(
+        Prefetch("status_history", queryset=StatusHistory.objects.select_related("changed_by")),
+        Prefetch("comments", queryset=Comment.objects.select_related("author")),
+        "attachments",
+    )
     template_name = "defects/detail.html"
     context_object_name = "defect"
 
@@ -143,14 +165,7 @@ class DefectCreateView(LoginRequiredMixin, RoleMixin, CreateView):
         file = self.request.FILES.get("attachments")
         if file:
             Attachment.objects.create(defect=self.object, file=file)
-        LogEntry.objects.log_action(
-            user_id=self.request.user.pk,
-            content_type_id=ContentType.objects.get_for_model(Defect).pk,
-            object_id=self.object.pk,
-            object_repr=str(self.object),
-            action_flag=ADDITION,
-            change_message="created",
-        )
+        feed.record(ActivityEvent.SCOPE_DEFECTS, ActivityEvent.KIND_CREATED, self.object, self.request.user, status=self.object.status)
         messages.success(self.request, "Дефект успешно создан")
         from django.shortcuts import redirect
         return redirect(self.get_success_url())
@@ -179,18 +194,15 @@ class DefectUpdateView(LoginRequiredMixin, RoleMixin, UpdateView):
         return form
 
     def form_valid(self, form):
-        self.object = form.save()
+        try:
+            self.object = form.save()
+        except DefectConflict as e:
+            form.add_error(None, str(e))
+            return self.form_invalid(form)
         file = self.request.FILES.get("attachments")
         if file:
             Attachment.objects.create(defect=self.object, file=file)
-        LogEntry.objects.log_action(
-            user_id=self.request.user.pk,
-            content_type_id=ContentType.objects.get_for_model(Defect).pk,
-            object_id=self.object.pk,
-            object_repr=str(self.object),
-            action_flag=CHANGE,
-            change_message="updated",
-        )
+        feed.record(ActivityEvent.SCOPE_DEFECTS, ActivityEvent.KIND_UPDATED, self.object, self.request.user)
         messages.success(self.request, "Дефект успешно сохранён")
         from django.shortcuts import redirect
         return redirect(self.get_success_url())
@@ -251,7 +263,12 @@ class DefectAssignView(LoginRequiredMixin, RoleMixin, FormView):
             form.add_error("username", "Инженер с таким логином не найден")
             return self.form_invalid(form)
         defect.performer = performer
-        defect.save(update_fields=["performer", "updated_at"])
+        try:
+            defect.save(update_fields=["performer", "updated_at"])
+        except DefectConflict as e:
+            form.add_error(None, str(e))
+            return self.form_invalid(form)
+        feed.record(ActivityEvent.SCOPE_DEFECTS, ActivityEvent.KIND_ASSIGNED, defect, self.request.user, text=performer.username)
         return super().form_valid(form)
 
     def get_context_data(self, **kwargs):
@@ -275,23 +292,36 @@ class DefectDeleteView(LoginRequiredMixin, RoleMixin, DeleteView):
             return HttpResponseForbidden()
         return super().dispatch(request, *args, **kwargs)
 
-    def delete(self, request, *args, **kwargs):
-        self.object = self.get_object()
-        obj_pk = self.object.pk
-        obj_repr = str(self.object)
-        ct_id = ContentType.objects.get_for_model(Defect).pk
-        response = super().delete(request, *args, **kwargs)
-        LogEntry.objects.log_action(
-            user_id=request.user.pk,
-            content_type_id=ct_id,
-            object_id=obj_pk,
-            object_repr=obj_repr,
-            action_flag=DELETION,
-            change_message="deleted",
-        )
-        messages.success(request, "Дефект удалён")
+    def form_valid(self, form):
+        deleted = dict(object_id=self.object.pk, object_repr=str(self.object), project_id=self.object.project_id, status=self.object.status)
+        response = super().form_valid(form)
+        feed.record(ActivityEvent.SCOPE_DEFECTS, ActivityEvent.KIND_DELETED, actor=self.request.user, **deleted)
+        messages.success(self.request, "Дефект удалён")
         return response
 
+class DefectBulkView(LoginRequiredMixin, RoleMixin, View):
+    def post(self, request):
+        if not self.user_is_manager():
+            from django.http import HttpResponseForbidden
+            return HttpResponseForbidden()
+        form = DefectBulkForm(request.POST)
+        if not form.is_valid():
+            for errors in form.errors.values():
+                messages.error(request, errors[0])
+            return redirect("defects_list")
+        data = form.cleaned_data
+        if data["action"] == DefectBulkForm.ACTION_ASSIGN:
+            results = bulk_change(Defect.objects.all(), data["ids"], request.user, performer=data["performer"])
+        else:
+            results = bulk_change(Defect.objects.all(), data["ids"], request.user, status=Defect.STATUS_CLOSED)
+        done = sum(r["ok"] for r in results)
+        if done:
+            messages.success(request, f"Обновлено дефектов: {done}")
+        if done < len(results):
+            reasons = "; ".join(sorted({r["detail"] for r in results if not r["ok"]}))
+            messages.warning(request, f"Пропущено дефектов: {len(results) - done} ({reasons})")
+        return redirect("defects_list")
+
 class DefectAcceptView(LoginRequiredMixin, RoleMixin, View):
     def post(self, request, pk):
         defect = Defect.objects.get(pk=pk)
@@ -320,111 +350,58 @@ class DefectSubmitReportView(LoginRequiredMixin, RoleMixin, FormView):
             pass
         return redirect("defect_detail", pk=defect.pk)
 
+def defects_export_queryset(user, params):
+    qs = Defect.objects.all()
+    project_id = params.get("project")
+    status = params.get("status")
+    performer_id = params.get("performer")
+    priority = params.get("priority")
+    search = params.get("q")
+    if user.is_manager:
+        pass
+    elif user.is_engineer:
+        qs = qs.filter(Q(project_id__in=member_project_ids(user)) | Q(performer=user))
+    if project_id:
+        qs = qs.filter(project_id=project_id)
+    if status:
+        qs = qs.filter(status=status)
+    if performer_id:
+        qs = qs.filter(performer_id=performer_id)
+    if priority:
+        qs = qs.filter(priority=priority)
+    if search:
+        return search_defects(qs, search).order_by("-search_rank", "-created_at")
+    return qs.order_by("-created_at")
+
 class DefectExportMixin(RoleMixin):
     def build_queryset(self, request):
-        qs = Defect.objects.select_related("project", "stage", "performer")
-        user = request.user
-        project_id = request.GET.get("project")
-        status = request.GET.get("status")
-        performer_id = request.GET.get("performer")
-        priority = request.GET.get("priority")
-        search = request.GET.get("q")
-        if user.is_manager:
-            pass
-        elif user.is_engineer:
-            qs = qs.filter(Q(project__members=user) | Q(performer=user))
-        if project_id:
-            qs = qs.filter(project_id=project_id)
-        if status:
-            qs = qs.filter(status=status)
-        if performer_id:
-            qs = qs.filter(performer_id=performer_id)
-        if priority:
-            qs = qs.filter(priority=priority)
-        if search:
-            qs = qs.filter(Q(title__icontains=search) | Q(description__icontains=search))
-        return qs.order_by("-created_at")
+        return defects_export_queryset(request.user, request.GET)
 
 class DefectsExportCSVView(LoginRequiredMixin, DefectExportMixin, View):
     def get(self, request):
-        qs = self.build_queryset(request)
-        resp = HttpResponse(content_type="text/csv; charset=utf-8")
-        resp["Content-Disposition"] = "attachment; filename=defects.csv"
-        resp.write("\ufeff")  # UTF-8 BOM for Excel
-        writer = csv.writer(resp, delimiter=';')
-        writer.writerow(["Проект", "Название", "Статус", "Приоритет", "Исполнитель", "Срок"]) 
-        for d in qs:
-            writer.writerow([
-                d.project.title,
-                d.title,
-                d.get_status_display(),
-                d.get_priority_display(),
-                (d.performer.username if d.performer else ""),
-                (d.deadline.isoformat() if d.deadline else ""),
-            ])
-        return resp
+        export = Export(self.build_queryset(request), DEFECTS_EXPORT_COLUMNS)
+        return csv_response(export, "defects.csv")
 
 class DefectsExportExcelView(LoginRequiredMixin, DefectExportMixin, View):
     def get(self, request):
-        qs = self.build_queryset(request)
-        resp = HttpResponse(content_type="application/vnd.ms-excel")
-        resp["Content-Disposition"] = "attachment; filename=defects.xls"
-        resp.write("\ufeff")  # UTF-8 BOM for Excel
-        writer = csv.writer(resp, delimiter=';')
-        writer.writerow(["Проект", "Название", "Статус", "Приоритет", "Исполнитель", "Срок"]) 
-        for d in qs:
-            writer.writerow([
-                d.project.title,
-                d.title,
-                d.get_status_display(),
-                d.get_priority_display(),
-                (d.performer.username if d.performer else ""),
-                (d.deadline.isoformat() if d.deadline else ""),
-            ])
-        return resp
-
-class DefectExportCSVView(LoginRequiredMixin, View):
+        export = Export(self.build_queryset(request), DEFECTS_EXPORT_COLUMNS)
+        return xlsx_response(export, "defects.xlsx")
+
+class SingleDefectExportMixin:
+    def defect_export(self, pk):
+        qs = Defect.objects.filter(pk=pk)
+        if not qs.exists():
+            raise Http404
+        qs = qs.annotate(
+            attachments_count=Count("attachments", distinct=True),
+            comments_count=Count("comments", distinct=True),
+        )
+        return Export(qs, DEFECT_EXPORT_COLUMNS)
+
+class DefectExportCSVView(LoginRequiredMixin, SingleDefectExportMixin, View):
     def get(self, request, pk):
-        d = Defect.objects.select_related("project", "performer", "stage").get(pk=pk)
-        resp = HttpResponse(content_type="text/csv; charset=utf-8")
-        resp["Content-Disposition"] = f"attachment; filename=defect_{pk}.csv"
-        resp.write("\ufeff")
-        writer = csv.writer(resp, delimiter=';')
-        writer.writerow(["Проект", "Название", "Статус", "Приоритет", "Исполнитель", "Срок", "Этап", "Создан", "Описание", "Вложений", "Комментариев"])
-        writer.writerow([
-            d.project.title,
-            d.title,
-            d.get_status_display(),
-            d.get_priority_display(),
-            (d.performer.username if d.performer else ""),
-            (d.deadline.isoformat() if d.deadline else ""),
-            (d.stage.title if d.stage else ""),
-            (d.created_at.isoformat() if hasattr(d, 'created_at') and d.created_at else ""),
-            (d.description or ""),
-            d.attachments.count(),
-            d.comments.count(),
-        ])
-        return resp
-
-class DefectExportExcelView(LoginRequiredMixin, View):
+        return csv_response(self.defect_export(pk), f"defect_{pk}.csv")
+
+class DefectExportExcelView(LoginRequiredMixin, SingleDefectExportMixin, View):
     def get(self, request, pk):
-        d = Defect.objects.select_related("project", "performer", "stage").get(pk=pk)
-        resp = HttpResponse(content_type="application/vnd.ms-excel")
-        resp["Content-Disposition"] = f"attachment; filename=defect_{pk}.xls"
-        resp.write("\ufeff")
-        writer = csv.writer(resp, delimiter=';')
-        writer.writerow(["Проект", "Название", "Статус", "Приоритет", "Исполнитель", "Срок", "Этап", "Создан", "Описание", "Вложений", "Комментариев"])
-        writer.writerow([
-            d.project.title,
-            d.title,
-            d.get_status_display(),
-            d.get_priority_display(),
-            (d.performer.username if d.performer else ""),
-            (d.deadline.isoformat() if d.deadline else ""),
-            (d.stage.title if d.stage else ""),
-            (d.created_at.isoformat() if hasattr(d, 'created_at') and d.created_at else ""),
-            (d.description or ""),
-            d.attachments.count(),
-            d.comments.count(),
-        ])
-        return resp
\ No newline at end of file
+        return xlsx_response(self.defect_export(pk), f"defect_{pk}.xlsx")
@@ -0,0 +1,48 @@
+"""Per-user visible project ids, cached and invalidated on Project.members changes.
+
+Scoped querysets filter with a plain `project_id IN (...)` instead of
+joining through the members table. Invalidation is repeated after commit,
+since a concurrent request may recache the old ids in between. With a
+process-local cache other processes never see the invalidation, so entries
+only live for LOCAL_CACHE_TIMEOUT seconds there.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from config.caching import is_shared_cache
+from .models import Project
+
+CACHE_TIMEOUT = 300
+LOCAL_CACHE_TIMEOUT = 10
+
+def _key(user_id):
+    return f"projects:members:{user_id}"
+
+def member_project_ids(user):
+    """Ids of the projects the user is a member of."""
+    if not getattr(user, "is_authenticated", False):
+        return []
+    key = _key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = sorted(Project.members.through.objects.filter(user_id=user.pk).values_list("project_id", flat=True))
+        cache.set(key, ids, CACHE_TIMEOUT if is_shared_cache() else LOCAL_CACHE_TIMEOUT)
+    return ids
+
+def invalidate(*user_ids):
+    keys = [_key(pk) for pk in user_ids]
+    cache.delete_many(keys)
+    if keys and transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+def members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if reverse:
+        invalidate(instance.pk)
+    elif action == "pre_clear":
+        invalidate(*instance.members.values_list("pk", flat=True))
+    else:
+        invalidate(*(pk_set or ()))
+
+def project_deleted(sender, instance, **kwargs):
+    invalidate(*instance.members.values_list("pk", flat=True))
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+
+class ProjectsConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "projects"
+
+    def ready(self):
+        from . import access
+        from .models import Project, Stage, members_changed, stage_changed
+        m2m_changed.connect(access.members_changed, sender=Project.members.through, dispatch_uid="projects_members_access")
+        pre_delete.connect(access.project_deleted, sender=Project, dispatch_uid="projects_delete_access")
+        m2m_changed.connect(members_changed, sender=Project.members.through, dispatch_uid="projects_members_touch")
+        post_save.connect(stage_changed, sender=Stage, dispatch_uid="projects_stage_save_touch")
+        post_delete.connect(stage_changed, sender=Stage, dispatch_uid="projects_stage_delete_touch")
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.4 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+def backfill_created_at(apps, schema_editor):
+    Project = apps.get_model('projects', 'Project')
+    LogEntry = apps.get_model('admin', 'LogEntry')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    ct = ContentType.objects.filter(app_label='projects', model='project').first()
+    if ct is None:
+        return
+    first_seen = {}
+    for object_id, action_time in (
+        LogEntry.objects.filter(content_type_id=ct.id, action_flag=1)
+        .order_by('action_time')
+        .values_list('object_id', 'action_time')
+    ):
+        first_seen.setdefault(object_id, action_time)
+    for project in Project.objects.filter(created_at__isnull=True).only('id'):
+        action_time = first_seen.get(str(project.pk))
+        if action_time is not None:
+            Project.objects.filter(pk=project.pk).update(created_at=action_time)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_alter_project_status'),
+        ('admin', '0003_logentry_add_action_flag_choices'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+    ]
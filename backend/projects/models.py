@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class Project(models.Model):
     STATUS_ACTIVE = "active"
@@ -15,10 +16,27 @@ class Project(models.Model):
     end_date = models.DateField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE, db_index=True)
     members = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name="projects", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, null=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.title
 
+def touch_projects(*project_ids):
+    """Advance updated_at (the API's Last-Modified/ETag marker) for changes stored outside the project row."""
+    Project.objects.filter(pk__in=project_ids).update(updated_at=timezone.now())
+
+def stage_changed(sender, instance, **kwargs):
+    touch_projects(instance.project_id)
+
+def members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action in ("post_add", "post_remove", "post_clear"):
+        touch_projects(instance.pk)
+    elif reverse and action in ("post_add", "post_remove"):
+        touch_projects(*pk_set)
+    elif reverse and action == "pre_clear":
+        touch_projects(*instance.projects.values_list("pk", flat=True))
+
 class Stage(models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="stages")
     title = models.CharField(max_length=255)
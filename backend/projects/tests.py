@@ -21,7 +21,7 @@ def test_web_projects_export_csv_bom_and_delimiter():
     client.login(username="m", password="x")
     resp = client.get("/projects/export/projects/csv/")
     assert resp.status_code == 200
-    text = resp.content.decode("utf-8")
+    text = b"".join(resp.streaming_content).decode("utf-8")
     assert text.startswith("\ufeff")
     assert ";" in text
 
@@ -35,6 +35,115 @@ def test_integration_projects_export_filters_by_engineer_membership():
     client = Client(); client.login(username="e", password="x")
     resp = client.get("/projects/export/projects/csv/")
     assert resp.status_code == 200
-    text = resp.content.decode("utf-8")
+    text = b"".join(resp.streaming_content).decode("utf-8")
     assert "P1" in text
-    assert "P2" not in text
\ No newline at end of file
+    assert "P2" not in text
+@pytest.mark.django_db
+def test_web_project_defects_export_streams_labels():
+    from defects.models import Defect
+    e = User.objects.create_user(username="e", email="e@example.com", password="x", role="engineer")
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P1")
+    Defect.objects.create(project=p, title="D1", performer=e, priority=Defect.PRIORITY_HIGH)
+    client = Client(); client.login(username="m", password="x")
+    resp = client.get(f"/projects/{p.id}/export/defects/csv/")
+    assert resp.streaming
+    lines = b"".join(resp.streaming_content).decode("utf-8").splitlines()
+    assert lines[1] == "P1;D1;новый;высокий;e;"
+    assert client.get("/projects/999/export/csv/").status_code == 404
+
+@pytest.mark.django_db
+def test_web_project_defects_export_xlsx_typed_and_shared_strings():
+    import io
+    import zipfile
+    from defects.models import Defect
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P1")
+    for i in range(3):
+        Defect.objects.create(project=p, title=f"D{i} <&>", deadline="2025-01-02")
+    client = Client(); client.login(username="m", password="x")
+    resp = client.get(f"/projects/{p.id}/export/defects/xls/")
+    assert resp["Content-Type"] == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    assert f"project_{p.id}_defects.xlsx" in resp["Content-Disposition"]
+    book = zipfile.ZipFile(io.BytesIO(b"".join(resp.streaming_content)))
+    sheet = book.read("xl/worksheets/sheet1.xml").decode("utf-8")
+    shared = book.read("xl/sharedStrings.xml").decode("utf-8")
+    assert shared.count("<t xml:space=\"preserve\">P1</t>") == 1
+    assert 'uniqueCount="3"' in shared
+    assert '<c r="F2" s="1"><v>45659</v></c>' in sheet
+    assert "D0 &lt;&amp;&gt;" in sheet
+
+@pytest.mark.django_db
+def test_member_project_ids_cached_and_invalidated_on_membership_change(django_assert_num_queries):
+    from django.core.cache import cache
+    from projects.access import member_project_ids
+    cache.clear()
+    e = User.objects.create_user(username="e", email="e@example.com", password="x", role="engineer")
+    p1 = Project.objects.create(title="P1")
+    p2 = Project.objects.create(title="P2")
+    p1.members.add(e)
+    assert member_project_ids(e) == [p1.id]
+    with django_assert_num_queries(0):
+        assert member_project_ids(e) == [p1.id]
+    e.projects.add(p2)
+    assert member_project_ids(e) == [p1.id, p2.id]
+    p1.members.remove(e)
+    assert member_project_ids(e) == [p2.id]
+    p2.members.clear()
+    assert member_project_ids(e) == []
+
+@pytest.mark.django_db
+def test_member_project_ids_invalidated_again_after_commit(django_capture_on_commit_callbacks):
+    from django.core.cache import cache
+    from projects.access import _key, member_project_ids
+    cache.clear()
+    e = User.objects.create_user(username="e", email="e@example.com", password="x", role="engineer")
+    p = Project.objects.create(title="P")
+    p.members.add(e)
+    assert member_project_ids(e) == [p.id]
+    with django_capture_on_commit_callbacks(execute=True):
+        p.members.remove(e)
+        # a concurrent request still sees the committed membership and recaches it
+        cache.set(_key(e.pk), [p.id])
+    assert member_project_ids(e) == []
+
+@pytest.mark.django_db
+def test_api_projects_scoped_without_members_join():
+    from django.core.cache import cache
+    from rest_framework.test import APIClient
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    cache.clear()
+    e = User.objects.create_user(username="e", email="e@example.com", password="x", role="engineer")
+    p = Project.objects.create(title="P1")
+    Project.objects.create(title="P2")
+    p.members.add(e)
+    client = APIClient()
+    client.force_authenticate(user=e)
+    client.get("/api/projects/")
+    with CaptureQueriesContext(connection) as ctx:
+        resp = client.get("/api/projects/")
+    assert resp.status_code == 200
+    data = resp.json()
+    items = data["results"] if isinstance(data, dict) else data
+    assert [i["id"] for i in items] == [p.id]
+    scoping = [q["sql"] for q in ctx.captured_queries if 'FROM "projects_project"' in q["sql"]]
+    assert scoping and not any("projects_project_members" in sql for sql in scoping)
+
+@pytest.mark.django_db
+def test_api_project_detail_etag_changes_with_stages_and_members():
+    from rest_framework.test import APIClient
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    client = APIClient()
+    client.force_authenticate(user=m)
+    etag = client.get(f"/api/projects/{p.id}/")["ETag"]
+    assert client.get(f"/api/projects/{p.id}/", HTTP_IF_NONE_MATCH=etag).status_code == 304
+    Project.objects.filter(pk=p.pk).update(updated_at="2020-01-01T00:00:00Z")
+    etag = client.get(f"/api/projects/{p.id}/")["ETag"]
+    Stage.objects.create(project=p, title="S")
+    assert client.get(f"/api/projects/{p.id}/", HTTP_IF_NONE_MATCH=etag).status_code == 200
+    Project.objects.filter(pk=p.pk).update(updated_at="2020-01-01T00:00:00Z")
+    etag = client.get(f"/api/projects/{p.id}/")["ETag"]
+    p.members.add(m)
+    assert client.get(f"/api/projects/{p.id}/", HTTP_IF_NONE_MATCH=etag).status_code == 200
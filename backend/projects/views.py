@@ -2,7 +2,11 @@ from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from config.conditional import conditional, weak_etag
 from users.permissions import IsManager
+from activity import feed
+from activity.models import ActivityEvent
+from .access import member_project_ids
 from .models import Project, Stage
 from .serializers import ProjectSerializer, StageSerializer
 
@@ -12,15 +16,37 @@ class ProjectViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        qs = Project.objects.prefetch_related("members", "stages")
         if user.is_manager:
-            return Project.objects.all()
-        return Project.objects.filter(members=user)
+            return qs
+        return qs.filter(id__in=member_project_ids(user))
 
     def get_permissions(self):
         if self.action in ["create", "update", "partial_update", "destroy"]:
             return [IsManager()]
         return [p() if isinstance(p, type) else p for p in self.permission_classes]
 
+    def retrieve(self, request, *args, **kwargs):
+        pk = str(kwargs.get("pk", ""))
+        updated_at = self.get_queryset().filter(pk=pk).values_list("updated_at", flat=True).first() if pk.isdigit() else None
+        if updated_at is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag = weak_etag("project", pk, updated_at)
+        return conditional(request, etag, updated_at, lambda: super(ProjectViewSet, self).retrieve(request, *args, **kwargs))
+
+    def perform_create(self, serializer):
+        project = serializer.save()
+        feed.record(ActivityEvent.SCOPE_PROJECTS, ActivityEvent.KIND_CREATED, project, self.request.user)
+
+    def perform_update(self, serializer):
+        project = serializer.save()
+        feed.record(ActivityEvent.SCOPE_PROJECTS, ActivityEvent.KIND_UPDATED, project, self.request.user)
+
+    def perform_destroy(self, instance):
+        deleted = dict(object_id=instance.pk, object_repr=str(instance), project_id=instance.pk)
+        instance.delete()
+        feed.record(ActivityEvent.SCOPE_PROJECTS, ActivityEvent.KIND_DELETED, actor=self.request.user, **deleted)
+
     @action(detail=True, methods=["get"])
     def stages(self, request, pk=None):
         project = self.get_object()
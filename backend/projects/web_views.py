@@ -2,22 +2,53 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.views import View
 from django.urls import reverse_lazy
-from django.db.models import Count
+from django.db.models import Count, Prefetch
+from django.http import Http404
 from users.models import User
 from users.permissions import IsManager
+from .access import member_project_ids
 from .models import Project, Stage, BuildObject
 from .forms import ProjectForm, StageForm, BuildObjectForm
 from django.contrib import messages
-from django.contrib.admin.models import LogEntry, ADDITION, CHANGE, DELETION
-from django.contrib.contenttypes.models import ContentType
-from django.utils import timezone
-from django.views import View
-from django.http import HttpResponse
-import csv
-from defects.models import Defect
-from django.http import HttpResponse
-import csv
 from defects.models import Defect
+from reports.exports import Column, Export, choice_labels, csv_response, xlsx_response
+from activity import feed
+from activity.models import ActivityEvent
+
+PROJECT_STATUS_LABELS = choice_labels(Project.STATUS_CHOICES)
+DEFECT_STATUS_LABELS = choice_labels(Defect.STATUS_CHOICES)
+DEFECT_PRIORITY_LABELS = choice_labels(Defect.PRIORITY_CHOICES)
+
+PROJECT_DEFECTS_EXPORT_COLUMNS = [
+    Column("Проект", "project__title", kind="shared"),
+    Column("Название дефекта", "title"),
+    Column("Статус", "status", labels=DEFECT_STATUS_LABELS),
+    Column("Приоритет", "priority", labels=DEFECT_PRIORITY_LABELS),
+    Column("Исполнитель", "performer__username", kind="shared"),
+    Column("Срок", "deadline", kind="date"),
+]
+
+PROJECTS_DEFECTS_EXPORT_COLUMNS = [
+    Column("Проект", "project__title", kind="shared"),
+    Column("Статус проекта", "project__status", labels=PROJECT_STATUS_LABELS),
+    Column("Название дефекта", "title"),
+    Column("Статус дефекта", "status", labels=DEFECT_STATUS_LABELS),
+    Column("Приоритет", "priority", labels=DEFECT_PRIORITY_LABELS),
+    Column("Исполнитель", "performer__username", kind="shared"),
+    Column("Срок", "deadline", kind="date"),
+]
+
+PROJECT_EXPORT_COLUMNS = [
+    Column("Название", "title"),
+    Column("Статус", "status", labels=PROJECT_STATUS_LABELS),
+    Column("Дата начала", "start_date", kind="date"),
+    Column("Дата окончания", "end_date", kind="date"),
+    Column("Описание", "description"),
+]
+
+PROJECTS_EXPORT_COLUMNS = PROJECT_EXPORT_COLUMNS + [
+    Column("Дефектов", "defects_count", kind="number"),
+]
 
 class ManagerRequiredMixin:
     def dispatch(self, request, *args, **kwargs):
@@ -37,7 +68,7 @@ class ProjectListView(LoginRequiredMixin, ListView):
         if user.is_manager:
             pass
         elif user.is_engineer:
-            qs = qs.filter(members=user)
+            qs = qs.filter(id__in=member_project_ids(user))
         status = self.request.GET.get("status")
         q = self.request.GET.get("q")
         if status in (Project.STATUS_ACTIVE, Project.STATUS_CLOSED):
@@ -48,28 +79,13 @@ class ProjectListView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        try:
-            ct = ContentType.objects.get_for_model(Project)
-            entries = (
-                LogEntry.objects.filter(content_type_id=ct.id)
-                .order_by("-action_time")[:10]
-            )
-            action_map = {1: "создан проект", 2: "отредактирован проект", 3: "удалён проект"}
-            recent = [
-                {
-                    "time": timezone.localtime(e.action_time).strftime("%H:%M"),
-                    "ts": int(e.action_time.timestamp()),
-                    "text": f"{action_map.get(e.action_flag, 'действие')} {e.object_repr}",
-                }
-                for e in entries
-            ]
-            ctx["recent_actions"] = recent
-        except Exception:
-            ctx["recent_actions"] = []
+        ctx["recent_actions"] = feed.recent(ActivityEvent.SCOPE_PROJECTS)
         return ctx
 
 class ProjectDetailView(LoginRequiredMixin, DetailView):
-    model = Project
+    queryset = Project.objects.prefetch_related(
+        "stages", "build_objects", Prefetch("defects", queryset=Defect.objects.select_related("performer")),
+    )
     template_name = "projects/detail.html"
     context_object_name = "project"
 
@@ -81,14 +97,7 @@ class ProjectCreateView(ManagerRequiredMixin, CreateView):
 
     def form_valid(self, form):
         response = super().form_valid(form)
-        LogEntry.objects.log_action(
-            user_id=self.request.user.pk,
-            content_type_id=ContentType.objects.get_for_model(Project).pk,
-            object_id=self.object.pk,
-            object_repr=str(self.object),
-            action_flag=ADDITION,
-            change_message="created",
-        )
+        feed.record(ActivityEvent.SCOPE_PROJECTS, ActivityEvent.KIND_CREATED, self.object, self.request.user)
         messages.success(self.request, "Проект успешно создан")
         return response
 
@@ -100,14 +109,7 @@ class ProjectUpdateView(ManagerRequiredMixin, UpdateView):
 
     def form_valid(self, form):
         response = super().form_valid(form)
-        LogEntry.objects.log_action(
-            user_id=self.request.user.pk,
-            content_type_id=ContentType.objects.get_for_model(Project).pk,
-            object_id=self.object.pk,
-            object_repr=str(self.object),
-            action_flag=CHANGE,
-            change_message="updated",
-        )
+        feed.record(ActivityEvent.SCOPE_PROJECTS, ActivityEvent.KIND_UPDATED, self.object, self.request.user)
         messages.success(self.request, "Проект успешно сохранён")
         return response
 
@@ -142,157 +144,72 @@ class ProjectDeleteView(ManagerRequiredMixin, DeleteView):
     template_name = "projects/confirm_delete.html"
     success_url = reverse_lazy("projects_list")
 
-    def delete(self, request, *args, **kwargs):
-        self.object = self.get_object()
-        obj_pk = self.object.pk
-        obj_repr = str(self.object)
-        ct_id = ContentType.objects.get_for_model(Project).pk
-        response = super().delete(request, *args, **kwargs)
-        LogEntry.objects.log_action(
-            user_id=request.user.pk,
-            content_type_id=ct_id,
-            object_id=obj_pk,
-            object_repr=obj_repr,
-            action_flag=DELETION,
-            change_message="deleted",
-        )
+    def form_valid(self, form):
+        deleted = dict(object_id=self.object.pk, object_repr=str(self.object), project_id=self.object.pk)
+        response = super().form_valid(form)
+        feed.record(ActivityEvent.SCOPE_PROJECTS, ActivityEvent.KIND_DELETED, actor=self.request.user, **deleted)
         return response
 
 class SingleProjectDefectsExportMixin:
     def defects_queryset(self, request, pk):
-        qs = Defect.objects.select_related("project", "performer").filter(project_id=pk)
+        qs = Defect.objects.filter(project_id=pk)
         return qs.order_by("-created_at")
 
 class ProjectDefectsExportCSVView(LoginRequiredMixin, SingleProjectDefectsExportMixin, View):
     def get(self, request, pk):
-        qs = self.defects_queryset(request, pk)
-        resp = HttpResponse(content_type="text/csv; charset=utf-8")
-        resp["Content-Disposition"] = f"attachment; filename=project_{pk}_defects.csv"
-        resp.write("\ufeff")
-        writer = csv.writer(resp, delimiter=';')
-        writer.writerow(["Проект", "Название дефекта", "Статус", "Приоритет", "Исполнитель", "Срок"])
-        for d in qs:
-            writer.writerow([
-                d.project.title,
-                d.title,
-                d.get_status_display(),
-                d.get_priority_display(),
-                (d.performer.username if d.performer else ""),
-                (d.deadline.isoformat() if d.deadline else ""),
-            ])
-        return resp
+        export = Export(self.defects_queryset(request, pk), PROJECT_DEFECTS_EXPORT_COLUMNS)
+        return csv_response(export, f"project_{pk}_defects.csv")
 
 class ProjectDefectsExportExcelView(LoginRequiredMixin, SingleProjectDefectsExportMixin, View):
     def get(self, request, pk):
-        qs = self.defects_queryset(request, pk)
-        resp = HttpResponse(content_type="application/vnd.ms-excel")
-        resp["Content-Disposition"] = f"attachment; filename=project_{pk}_defects.xls"
-        resp.write("\ufeff")
-        writer = csv.writer(resp, delimiter=';')
-        writer.writerow(["Проект", "Название дефекта", "Статус", "Приоритет", "Исполнитель", "Срок"])
-        for d in qs:
-            writer.writerow([
-                d.project.title,
-                d.title,
-                d.get_status_display(),
-                d.get_priority_display(),
-                (d.performer.username if d.performer else ""),
-                (d.deadline.isoformat() if d.deadline else ""),
-            ])
-        return resp
-
-class ProjectExportCSVView(LoginRequiredMixin, View):
+        export = Export(self.defects_queryset(request, pk), PROJECT_DEFECTS_EXPORT_COLUMNS)
+        return xlsx_response(export, f"project_{pk}_defects.xlsx")
+
+class SingleProjectExportMixin:
+    def project_export(self, pk):
+        qs = Project.objects.filter(pk=pk)
+        if not qs.exists():
+            raise Http404
+        return Export(qs, PROJECT_EXPORT_COLUMNS)
+
+class ProjectExportCSVView(LoginRequiredMixin, SingleProjectExportMixin, View):
     def get(self, request, pk):
-        proj = Project.objects.get(pk=pk)
-        resp = HttpResponse(content_type="text/csv; charset=utf-8")
-        resp["Content-Disposition"] = f"attachment; filename=project_{pk}.csv"
-        resp.write("\ufeff")
-        writer = csv.writer(resp, delimiter=';')
-        writer.writerow(["Название", "Статус", "Дата начала", "Дата окончания", "Описание"])
-        writer.writerow([
-            proj.title,
-            proj.get_status_display(),
-            (proj.start_date.isoformat() if proj.start_date else ""),
-            (proj.end_date.isoformat() if proj.end_date else ""),
-            (proj.description or ""),
-        ])
-        return resp
-
-class ProjectExportExcelView(LoginRequiredMixin, View):
+        return csv_response(self.project_export(pk), f"project_{pk}.csv")
+
+class ProjectExportExcelView(LoginRequiredMixin, SingleProjectExportMixin, View):
     def get(self, request, pk):
-        proj = Project.objects.get(pk=pk)
-        resp = HttpResponse(content_type="application/vnd.ms-excel")
-        resp["Content-Disposition"] = f"attachment; filename=project_{pk}.xls"
-        resp.write("\ufeff")
-        writer = csv.writer(resp, delimiter=';')
-        writer.writerow(["Название", "Статус", "Дата начала", "Дата окончания", "Описание"])
-        writer.writerow([
-            proj.title,
-            proj.get_status_display(),
-            (proj.start_date.isoformat() if proj.start_date else ""),
-            (proj.end_date.isoformat() if proj.end_date else ""),
-            (proj.description or ""),
-        ])
-        return resp
+        return xlsx_response(self.project_export(pk), f"project_{pk}.xlsx")
+
+def filter_projects(user, params):
+    qs = Project.objects.all()
+    if getattr(user, "is_engineer", False):
+        qs = qs.filter(id__in=member_project_ids(user))
+    status = params.get("status")
+    q = params.get("q")
+    if status in (Project.STATUS_ACTIVE, Project.STATUS_CLOSED):
+        qs = qs.filter(status=status)
+    if q:
+        qs = qs.filter(title__icontains=q)
+    return qs
 
 class ProjectsDefectsExportMixin:
     def filtered_projects(self, request):
-        qs = Project.objects.all()
-        user = request.user
-        if getattr(user, "is_engineer", False):
-            qs = qs.filter(members=user)
-        status = request.GET.get("status")
-        q = request.GET.get("q")
-        if status in (Project.STATUS_ACTIVE, Project.STATUS_CLOSED):
-            qs = qs.filter(status=status)
-        if q:
-            qs = qs.filter(title__icontains=q)
-        return qs
+        return filter_projects(request.user, request.GET)
 
     def defects_queryset(self, request):
         pqs = self.filtered_projects(request)
-        qs = Defect.objects.select_related("project", "performer").filter(project__in=pqs)
+        qs = Defect.objects.filter(project__in=pqs)
         return qs.order_by("project__title", "-created_at")
 
 class ProjectsDefectsExportCSVView(LoginRequiredMixin, ProjectsDefectsExportMixin, View):
     def get(self, request):
-        qs = self.defects_queryset(request)
-        resp = HttpResponse(content_type="text/csv; charset=utf-8")
-        resp["Content-Disposition"] = "attachment; filename=projects_defects.csv"
-        resp.write("\ufeff")
-        writer = csv.writer(resp, delimiter=';')
-        writer.writerow(["Проект", "Статус проекта", "Название дефекта", "Статус дефекта", "Приоритет", "Исполнитель", "Срок"])
-        for d in qs:
-            writer.writerow([
-                d.project.title,
-                d.project.get_status_display(),
-                d.title,
-                d.get_status_display(),
-                d.get_priority_display(),
-                (d.performer.username if d.performer else ""),
-                (d.deadline.isoformat() if d.deadline else ""),
-            ])
-        return resp
+        export = Export(self.defects_queryset(request), PROJECTS_DEFECTS_EXPORT_COLUMNS)
+        return csv_response(export, "projects_defects.csv")
 
 class ProjectsDefectsExportExcelView(LoginRequiredMixin, ProjectsDefectsExportMixin, View):
     def get(self, request):
-        qs = self.defects_queryset(request)
-        resp = HttpResponse(content_type="application/vnd.ms-excel")
-        resp["Content-Disposition"] = "attachment; filename=projects_defects.xls"
-        resp.write("\ufeff")
-        writer = csv.writer(resp, delimiter=';')
-        writer.writerow(["Проект", "Статус проекта", "Название дефекта", "Статус дефекта", "Приоритет", "Исполнитель", "Срок"])
-        for d in qs:
-            writer.writerow([
-                d.project.title,
-                d.project.get_status_display(),
-                d.title,
-                d.get_status_display(),
-                d.get_priority_display(),
-                (d.performer.username if d.performer else ""),
-                (d.deadline.isoformat() if d.deadline else ""),
-            ])
-        return resp
+        export = Export(self.defects_queryset(request), PROJECTS_DEFECTS_EXPORT_COLUMNS)
+        return xlsx_response(export, "projects_defects.xlsx")
 
 class BuildObjectCreateView(ManagerRequiredMixin, CreateView):
     model = BuildObject
@@ -317,62 +234,12 @@ class BuildObjectUpdateView(ManagerRequiredMixin, UpdateView):
     def form_valid(self, form):
         messages.success(self.request, "Объект успешно сохранён")
         return super().form_valid(form)
-class ProjectsExportCSVView(LoginRequiredMixin, View):
+class ProjectsExportCSVView(LoginRequiredMixin, ProjectsDefectsExportMixin, View):
     def get(self, request):
-        qs = Project.objects.annotate(defects_count=Count("defects"))
-        user = request.user
-        if getattr(user, "is_manager", False):
-            pass
-        elif getattr(user, "is_engineer", False):
-            qs = qs.filter(members=user)
-        status = request.GET.get("status")
-        q = request.GET.get("q")
-        if status in (Project.STATUS_ACTIVE, Project.STATUS_CLOSED):
-            qs = qs.filter(status=status)
-        if q:
-            qs = qs.filter(title__icontains=q)
-        resp = HttpResponse(content_type="text/csv; charset=utf-8")
-        resp["Content-Disposition"] = "attachment; filename=projects.csv"
-        resp.write("\ufeff")
-        writer = csv.writer(resp, delimiter=';')
-        writer.writerow(["Название", "Статус", "Дата начала", "Дата окончания", "Описание", "Дефектов"])
-        for p in qs:
-            writer.writerow([
-                p.title,
-                p.get_status_display(),
-                (p.start_date.isoformat() if p.start_date else ""),
-                (p.end_date.isoformat() if p.end_date else ""),
-                (p.description or ""),
-                p.defects_count,
-            ])
-        return resp
-
-class ProjectsExportExcelView(LoginRequiredMixin, View):
+        qs = self.filtered_projects(request).annotate(defects_count=Count("defects"))
+        return csv_response(Export(qs, PROJECTS_EXPORT_COLUMNS), "projects.csv")
+
+class ProjectsExportExcelView(LoginRequiredMixin, ProjectsDefectsExportMixin, View):
     def get(self, request):
-        qs = Project.objects.annotate(defects_count=Count("defects"))
-        user = request.user
-        if getattr(user, "is_manager", False):
-            pass
-        elif getattr(user, "is_engineer", False):
-            qs = qs.filter(members=user)
-        status = request.GET.get("status")
-        q = request.GET.get("q")
-        if status in (Project.STATUS_ACTIVE, Project.STATUS_CLOSED):
-            qs = qs.filter(status=status)
-        if q:
-            qs = qs.filter(title__icontains=q)
-        resp = HttpResponse(content_type="application/vnd.ms-excel")
-        resp["Content-Disposition"] = "attachment; filename=projects.xls"
-        resp.write("\ufeff")
-        writer = csv.writer(resp, delimiter=';')
-        writer.writerow(["Название", "Статус", "Дата начала", "Дата окончания", "Описание", "Дефектов"])
-        for p in qs:
-            writer.writerow([
-                p.title,
-                p.get_status_display(),
-                (p.start_date.isoformat() if p.start_date else ""),
-                (p.end_date.isoformat() if p.end_date else ""),
-                (p.description or ""),
-                p.defects_count,
-            ])
-        return resp
\ No newline at end of file
+        qs = self.filtered_projects(request).annotate(defects_count=Count("defects"))
+        return xlsx_response(Export(qs, PROJECTS_EXPORT_COLUMNS), "projects.xlsx")
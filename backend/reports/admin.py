@@ -0,0 +1,13 @@
+from django.contrib import admin
+from .models import ExportJob, BacklogSnapshot
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "dataset", "format", "status", "progress", "total", "created_by", "created_at")
+    list_filter = ("status", "dataset", "format")
+
+@admin.register(BacklogSnapshot)
+class BacklogSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("date", "project", "status", "priority", "count")
+    list_filter = ("status", "priority")
+    date_hierarchy = "date"
@@ -1,140 +1,108 @@
-from django.db.models import Count
-from django.db.models.functions import TruncDate
+from django.db.models import Count, Q, Sum
 from django.utils import timezone
-from datetime import timedelta
-from defects.models import Defect
-from django.contrib.admin.models import LogEntry, ADDITION
-from django.contrib.contenttypes.models import ContentType
+from defects.models import Defect, DefectStat
 from projects.models import Project
+from .timeseries import bounds, daily_counts, daily_counts_many, daily_series
 
-def summary():
+def rollup_counts(rows):
     return {
-        "total": Defect.objects.count(),
-        "by_status": list(
-            Defect.objects.values("status").annotate(count=Count("id")).order_by("status")
-        ),
-        "by_priority": list(
-            Defect.objects.values("priority").annotate(count=Count("id")).order_by("priority")
-        ),
+        "total": rows.aggregate(total=Sum("count"))["total"] or 0,
+        "by_status": list(rows.values("status").annotate(count=Sum("count")).order_by("status")),
     }
 
+def summary():
+    rows = DefectStat.objects.filter(count__gt=0)
+    data = rollup_counts(rows)
+    data["by_priority"] = list(rows.values("priority").annotate(count=Sum("count")).order_by("priority"))
+    return data
+
 def by_project(project_id: int):
-    qs = Defect.objects.filter(project_id=project_id)
-    return {
-        "project_id": project_id,
-        "total": qs.count(),
-        "by_status": list(qs.values("status").annotate(count=Count("id"))),
-    }
+    return {"project_id": project_id, **rollup_counts(DefectStat.objects.filter(project_id=project_id, count__gt=0))}
 
 def by_engineer(user_id: int):
-    qs = Defect.objects.filter(performer_id=user_id)
+    return {"engineer_id": user_id, **rollup_counts(DefectStat.objects.filter(performer_id=user_id, count__gt=0))}
+
+def by_day(days: int = 30, start=None, end=None, tz=None):
+    """Defects created per day per priority, zero-filled."""
+    priorities = [value for value, _ in Defect.PRIORITY_CHOICES]
+    return daily_series(Defect.objects.all(), "created_at", "priority", priorities, days, start, end, tz)
+
+def by_day_projects(days: int = 7, start=None, end=None, tz=None):
+    data = daily_counts(Project.objects.all(), "created_at", days, start, end, tz)
+    return {"labels": data["labels"], "counts": data["counts"]}
+
+def by_day_defects(days: int = 7, start=None, end=None, tz=None):
+    data = daily_counts(Defect.objects.all(), "created_at", days, start, end, tz)
+    return {"labels": data["labels"], "counts": data["counts"]}
+
+def dashboard(days: int = 7, end=None, tz=None):
+    """Status, priority and daily activity for the dashboard in two queries."""
+    statuses = [value for value, _ in Defect.STATUS_CHOICES]
+    priorities = [value for value, _ in Defect.PRIORITY_CHOICES]
+    totals = DefectStat.objects.aggregate(
+        **{f"status_{s}": Sum("count", filter=Q(status=s)) for s in statuses},
+        **{f"priority_{p}": Sum("count", filter=Q(priority=p)) for p in priorities},
+    )
+    by_status = [(s, totals[f"status_{s}"]) for s in statuses if totals[f"status_{s}"]]
+    by_priority = [(p, totals[f"priority_{p}"]) for p in priorities if totals[f"priority_{p}"]]
+    daily = daily_counts_many(
+        {"projects": (Project.objects.all(), "created_at"), "defects": (Defect.objects.all(), "created_at")},
+        days, end=end, tz=tz,
+    )
     return {
-        "engineer_id": user_id,
-        "total": qs.count(),
-        "by_status": list(qs.values("status").annotate(count=Count("id"))),
+        "status_labels": [s for s, _ in by_status],
+        "status_counts": [n for _, n in by_status],
+        "priority_labels": [p for p, _ in by_priority],
+        "priority_counts": [n for _, n in by_priority],
+        "daily_labels": daily["labels"],
+        "daily_projects": daily["projects"],
+        "daily_defects": daily["defects"],
     }
 
-def by_day(days: int = 30):
-    """Return daily activity based on Defect additions per priority.
-    Uses admin LogEntry ADDITION events to avoid relying on missing created_at.
+MATRIX_KEYS = {"projects": ("project_id", "project_id"), "engineers": ("performer_id", "engineer_id")}
+
+def matrix_rows(kind, ids=None, priority=None, start=None, end=None):
+    """(id, status, count) rows behind status_matrix(), ordered by id.
+
+    Without a date range the DefectStat rollup is read; with one, defects are
+    grouped directly by created_at.
     """
-    end = timezone.localdate()
-    start = end - timedelta(days=days - 1)
-    ct = ContentType.objects.get_for_model(Defect)
-    # Gather additions grouped by day
-    additions = (
-        LogEntry.objects.filter(
-            content_type_id=ct.id,
-            action_flag=ADDITION,
-            action_time__date__gte=start,
-            action_time__date__lte=end,
-        )
-        .annotate(day=TruncDate("action_time"))
-        .values("day")
-        .annotate(ids=Count("object_id"))
-    )
-    # Build date index
-    dates = [start + timedelta(days=i) for i in range(days)]
-    labels = [d.strftime("%d.%m") for d in dates]
-    series = {"low": [0]*days, "medium": [0]*days, "high": [0]*days}
-    idx_map = {dates[i]: i for i in range(days)}
-    # For each day, fetch priorities of created defects
-    daily_ids = (
-        LogEntry.objects.filter(
-            content_type_id=ct.id,
-            action_flag=ADDITION,
-            action_time__date__gte=start,
-            action_time__date__lte=end,
-        )
-        .annotate(day=TruncDate("action_time"))
-        .values_list("day", "object_id")
-    )
-    day_to_ids = {}
-    for day, oid in daily_ids:
-        dd = day.date() if hasattr(day, "date") else day
-        day_to_ids.setdefault(dd, []).append(oid)
-    for dd, ids in day_to_ids.items():
-        i = idx_map.get(dd)
-        if i is None:
-            continue
-        prios = Defect.objects.filter(id__in=ids).values_list("priority", flat=True)
-        # Count per priority for this day
-        low = sum(1 for p in prios if p == "low")
-        med = sum(1 for p in prios if p == "medium")
-        high = sum(1 for p in prios if p == "high")
-        series["low"][i] = low
-        series["medium"][i] = med
-        series["high"][i] = high
-    return {"labels": labels, "series": series}
+    field = MATRIX_KEYS[kind][0]
+    if start is None and end is None:
+        qs = DefectStat.objects.filter(count__gt=0)
+        agg = Sum("count")
+    else:
+        qs = Defect.objects.all()
+        if start is not None:
+            qs = qs.filter(created_at__gte=bounds(start, start, timezone.get_current_timezone())[0])
+        if end is not None:
+            qs = qs.filter(created_at__lt=bounds(end, end, timezone.get_current_timezone())[1])
+        agg = Count("pk")
+    qs = qs.filter(**{f"{field}__isnull": False})
+    if ids is not None:
+        qs = qs.filter(**{f"{field}__in": ids})
+    if priority:
+        qs = qs.filter(priority=priority)
+    return qs.values_list(field, "status").annotate(n=agg).order_by(field, "status")
 
-def by_day_projects(days: int = 7):
-    end = timezone.localdate()
-    start = end - timedelta(days=days - 1)
-    ct = ContentType.objects.get_for_model(Project)
-    rows = (
-        LogEntry.objects.filter(
-            content_type_id=ct.id,
-            action_flag=ADDITION,
-            action_time__date__gte=start,
-            action_time__date__lte=end,
-        )
-        .annotate(day=TruncDate("action_time"))
-        .values("day")
-        .annotate(count=Count("id"))
-    )
-    dates = [start + timedelta(days=i) for i in range(days)]
-    labels = [d.strftime("%d.%m") for d in dates]
-    counts = [0]*days
-    idx_map = {dates[i]: i for i in range(days)}
-    for r in rows:
-        dd = r["day"].date() if hasattr(r["day"], "date") else r["day"]
-        i = idx_map.get(dd)
-        if i is not None:
-            counts[i] = r["count"]
-    return {"labels": labels, "counts": counts}
+def status_matrix(kind, ids=None, priority=None, start=None, end=None):
+    """Yield {<id>, total, by_status} per project or engineer from one grouped query.
 
-def by_day_defects(days: int = 7):
-    end = timezone.localdate()
-    start = end - timedelta(days=days - 1)
-    ct = ContentType.objects.get_for_model(Defect)
-    rows = (
-        LogEntry.objects.filter(
-            content_type_id=ct.id,
-            action_flag=ADDITION,
-            action_time__date__gte=start,
-            action_time__date__lte=end,
-        )
-        .annotate(day=TruncDate("action_time"))
-        .values("day")
-        .annotate(count=Count("id"))
-    )
-    dates = [start + timedelta(days=i) for i in range(days)]
-    labels = [d.strftime("%d.%m") for d in dates]
-    counts = [0]*days
-    idx_map = {dates[i]: i for i in range(days)}
-    for r in rows:
-        dd = r["day"].date() if hasattr(r["day"], "date") else r["day"]
-        i = idx_map.get(dd)
-        if i is not None:
-            counts[i] = r["count"]
-    return {"labels": labels, "counts": counts}
\ No newline at end of file
+    Requested ids with no defects come out as zeros.
+    """
+    out = MATRIX_KEYS[kind][1]
+    rows = matrix_rows(kind, ids, priority, start, end)
+    seen = set()
+    current, by_status = None, {}
+    for key, status, n in rows.iterator():
+        if key != current:
+            if current is not None:
+                yield {out: current, "total": sum(by_status.values()), "by_status": by_status}
+                seen.add(current)
+            current, by_status = key, {}
+        by_status[status] = n
+    if current is not None:
+        yield {out: current, "total": sum(by_status.values()), "by_status": by_status}
+        seen.add(current)
+    for key in sorted(set(ids or ()) - seen):
+        yield {out: key, "total": 0, "by_status": {}}
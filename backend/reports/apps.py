@@ -0,0 +1,23 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
+
+def bump_defects(sender, **kwargs):
+    from .cache import bump, DEFECTS
+    bump(DEFECTS)
+
+def bump_projects(sender, **kwargs):
+    from .cache import bump, DEFECTS, PROJECTS
+    bump(PROJECTS, DEFECTS)
+
+class ReportsConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "reports"
+
+    def ready(self):
+        from defects.signals import defects_bulk_changed
+        for model in ("defects.Defect", "defects.StatusHistory"):
+            post_save.connect(bump_defects, sender=model, dispatch_uid=f"reports_cache_save_{model}")
+            post_delete.connect(bump_defects, sender=model, dispatch_uid=f"reports_cache_delete_{model}")
+        defects_bulk_changed.connect(bump_defects, dispatch_uid="reports_cache_bulk_defects")
+        post_save.connect(bump_projects, sender="projects.Project", dispatch_uid="reports_cache_save_project")
+        post_delete.connect(bump_projects, sender="projects.Project", dispatch_uid="reports_cache_delete_project")
@@ -0,0 +1,146 @@
+"""Daily backlog snapshots replayed from defect creations and StatusHistory.
+
+State at the end of the last stored day is taken from its snapshot rows, so
+catching up only replays events after it. Priority changes and project moves
+are not logged, so events are keyed by the defect's current priority and
+project, and deleted defects take their history with them. Either makes an
+incremental catch-up disagree with the stored state; snapshot() detects it
+by replaying up to now and comparing with the live DefectStat rollup, and
+then rebuilds every day from scratch.
+"""
+import datetime
+import heapq
+from collections import Counter
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from defects.models import OPEN_STATUSES, Defect, DefectStat, StatusHistory
+from .cache import bump, BACKLOG
+from .models import BacklogSnapshot
+from .timeseries import bounds, date_range
+
+def last_snapshot_date():
+    return BacklogSnapshot.objects.order_by("-date").values_list("date", flat=True).first()
+
+def first_activity_date(tz):
+    first = Defect.objects.order_by("created_at").values_list("created_at", flat=True).first()
+    return timezone.localtime(first, tz).date() if first else None
+
+def state_at(day):
+    rows = BacklogSnapshot.objects.filter(date=day).values_list("project_id", "status", "priority", "count")
+    return Counter({(p, s, pr): n for p, s, pr, n in rows})
+
+def events(since, until):
+    """Creations and transitions in [since, until) as (time, kind, key...) tuples, in time order."""
+    initial = StatusHistory.objects.filter(defect=OuterRef("pk")).order_by("changed_at", "id").values("old_status")[:1]
+    created = Defect.objects.filter(created_at__lt=until)
+    history = StatusHistory.objects.filter(changed_at__lt=until)
+    if since is not None:
+        created = created.filter(created_at__gte=since)
+        history = history.filter(changed_at__gte=since)
+    created = (
+        created.annotate(initial_status=Coalesce(Subquery(initial), F("status")))
+        .values_list("created_at", "id", "project_id", "priority", "initial_status")
+        .order_by("created_at", "id")
+    )
+    history = (
+        history.values_list("changed_at", "id", "defect__project_id", "defect__priority", "old_status", "new_status")
+        .order_by("changed_at", "id")
+    )
+    return heapq.merge(
+        ((t, 0, pk, project, priority, None, status) for t, pk, project, priority, status in created.iterator()),
+        ((t, 1, pk, project, priority, old, new) for t, pk, project, priority, old, new in history.iterator()),
+    )
+
+def replay(start, end, tz=None):
+    """Yield (day, Counter) with counts at the end of each day in [start, end]."""
+    tz = tz or timezone.get_current_timezone()
+    prev = start - datetime.timedelta(days=1)
+    if BacklogSnapshot.objects.filter(date=prev).exists():
+        state, since = state_at(prev), bounds(prev, prev, tz)[1]
+    else:
+        state, since = Counter(), None
+    stream = events(since, bounds(end, end, tz)[1])
+    pending = next(stream, None)
+    for day in date_range(start, end):
+        day_end = bounds(day, day, tz)[1]
+        while pending is not None and pending[0] < day_end:
+            _, kind, _, project, priority, old, new = pending
+            if kind == 1:
+                state[(project, old, priority)] -= 1
+            state[(project, new, priority)] += 1
+            pending = next(stream, None)
+        yield day, state
+
+def live_state():
+    rows = (
+        DefectStat.objects.filter(count__gt=0)
+        .values_list("project_id", "status", "priority")
+        .annotate(n=Sum("count"))
+        .order_by()
+    )
+    return Counter({(p, st, pr): n for p, st, pr, n in rows})
+
+def write(start, end, tz):
+    """Replay and store [start, end]; returns (days written, replayed state as of now)."""
+    today = timezone.localdate(timezone=tz)
+    BacklogSnapshot.objects.filter(date__gte=start, date__lte=end).delete()
+    days, state = 0, Counter()
+    for day, state in replay(start, max(end, today), tz):
+        if day > end:
+            continue
+        BacklogSnapshot.objects.bulk_create(
+            BacklogSnapshot(date=day, project_id=p, status=s, priority=pr, count=n)
+            for (p, s, pr), n in state.items()
+            if n > 0
+        )
+        days += 1
+    return days, +state if all(n >= 0 for n in state.values()) else None
+
+@transaction.atomic
+def snapshot(start=None, end=None, tz=None):
+    """Store snapshots for [start, end]; by default only the days after the last stored one,
+    up to yesterday. Returns the number of days written."""
+    tz = tz or timezone.get_current_timezone()
+    end = end or timezone.localdate(timezone=tz) - datetime.timedelta(days=1)
+    if start is None:
+        last = last_snapshot_date()
+        start = last + datetime.timedelta(days=1) if last else first_activity_date(tz)
+    if start is None or start > end:
+        return 0
+    resumed = BacklogSnapshot.objects.filter(date=start - datetime.timedelta(days=1)).exists()
+    days, state = write(start, end, tz)
+    if resumed and state != live_state():
+        first = first_activity_date(tz)
+        BacklogSnapshot.objects.all().delete()
+        days, _ = write(first, end, tz) if first and first <= end else (0, None)
+    bump(BACKLOG)
+    return days
+
+def burndown(project_id=None, start=None, end=None):
+    """Open/closed/cancelled/total per day; today comes from the live DefectStat rollup."""
+    today = timezone.localdate()
+    aggregates = {
+        "open": Sum("count", filter=Q(status__in=OPEN_STATUSES)),
+        "closed": Sum("count", filter=Q(status=Defect.STATUS_CLOSED)),
+        "cancelled": Sum("count", filter=Q(status=Defect.STATUS_CANCELLED)),
+        "total": Sum("count"),
+    }
+    rows = BacklogSnapshot.objects.filter(date__gte=start, date__lte=min(end, today))
+    if project_id is not None:
+        rows = rows.filter(project_id=project_id)
+    by_day = {r["date"]: r for r in rows.values("date").annotate(**aggregates).order_by("date")}
+    if start <= today <= end:
+        live = DefectStat.objects.filter(count__gt=0)
+        if project_id is not None:
+            live = live.filter(project_id=project_id)
+        by_day[today] = live.aggregate(**aggregates)
+    results = []
+    for day in date_range(start, end):
+        row = by_day.get(day)
+        if row is None:
+            results.append({"date": day.isoformat(), "open": None, "closed": None, "cancelled": None, "total": None})
+        else:
+            results.append({"date": day.isoformat(), **{k: row[k] or 0 for k in aggregates}})
+    return results
@@ -0,0 +1,111 @@
+"""Report results cached under generation-numbered keys.
+
+Every cached value lists the data scopes it depends on ("defects",
+"projects"); the key embeds the current generation of each scope, so a
+bump makes old entries unreachable without deleting them. Misses are
+single-flight: one caller recomputes under a cache.add() lock while the
+others wait briefly for the value to appear.
+
+Generations only work when every process sees the same cache. With a
+process-local backend (LocMemCache, the default) a bump in one worker is
+invisible to the others, so reports are computed on every request and
+carry no ETag instead of serving stale data and stale 304s.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from config.caching import is_shared_cache
+from config.conditional import weak_etag
+
+PREFIX = "reports"
+LOCK_TIMEOUT = 30
+WAIT_TIMEOUT = 5.0
+WAIT_STEP = 0.05
+DEFECTS = "defects"
+PROJECTS = "projects"
+BACKLOG = "backlog"
+COUNTERS = ("hits", "misses", "computed")
+
+def _gen_key(scope):
+    return f"{PREFIX}:gen:{scope}"
+
+def _counter_key(name):
+    return f"{PREFIX}:stats:{name}"
+
+def generation(scope):
+    key = _gen_key(scope)
+    value = cache.get(key)
+    if value is None:
+        # Start from the clock so an evicted generation never reuses an old number.
+        cache.add(key, time.time_ns())
+        value = cache.get(key)
+    return value
+
+def _bump(scopes):
+    for scope in scopes:
+        try:
+            cache.incr(_gen_key(scope))
+        except ValueError:
+            cache.set(_gen_key(scope), time.time_ns())
+
+def bump(*scopes):
+    _bump(scopes)
+    if transaction.get_connection().in_atomic_block:
+        # Readers may have recached pre-commit data in the meantime.
+        transaction.on_commit(lambda: _bump(scopes))
+
+def _count(name):
+    key = _counter_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1):
+            cache.incr(key)
+
+def counters():
+    values = cache.get_many([_counter_key(n) for n in COUNTERS])
+    return {n: values.get(_counter_key(n), 0) for n in COUNTERS}
+
+def reset_counters():
+    cache.delete_many([_counter_key(n) for n in COUNTERS])
+
+def report_key(name, scopes, args):
+    gens = ".".join(str(generation(s)) for s in scopes)
+    parts = ":".join(str(a) for a in args)
+    return f"{PREFIX}:{name}:{parts}:{gens}"
+
+def enabled():
+    return is_shared_cache()
+
+def report_etag(name, scopes, *args):
+    """Weak ETag that changes whenever cached_report(name, scopes, ..., *args) could; None without a shared cache."""
+    return weak_etag(report_key(name, scopes, args)) if enabled() else None
+
+def cached_report(name, scopes, compute, *args, timeout=None):
+    if not enabled():
+        return compute(*args)
+    timeout = settings.REPORTS_CACHE_TIMEOUT if timeout is None else timeout
+    key = report_key(name, scopes, args)
+    value = cache.get(key)
+    if value is not None:
+        _count("hits")
+        return value
+    _count("misses")
+    lock = f"{key}:lock"
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    locked = cache.add(lock, 1, LOCK_TIMEOUT)
+    while not locked and time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        locked = cache.add(lock, 1, LOCK_TIMEOUT)
+    try:
+        value = compute(*args)
+        _count("computed")
+        cache.set(key, value, timeout)
+    finally:
+        if locked:
+            cache.delete(lock)
+    return value
@@ -0,0 +1,99 @@
+import csv
+import io
+from django.http import StreamingHttpResponse
+from .xlsx import iter_xlsx, XLSX_CONTENT_TYPE
+
+CHUNK_SIZE = 2000
+ROWS_PER_WRITE = 500
+
+CSV_CONTENT_TYPE = "text/csv; charset=utf-8"
+
+def choice_labels(choices):
+    return {value: str(label) for value, label in choices}
+
+class Column:
+    """One export column: header, values_list() path and how to render the value.
+
+    kind is one of "text", "shared" (short text repeated across rows, e.g. a
+    project title), "date", "datetime" or "number".
+    """
+
+    def __init__(self, header, field, labels=None, kind=None):
+        self.header = header
+        self.field = field
+        self.labels = labels
+        self.kind = kind or ("shared" if labels else "text")
+
+    def value(self, raw):
+        if raw is None:
+            return None
+        if self.labels is not None:
+            return self.labels.get(raw, raw)
+        return raw
+
+class Export:
+    """Tabular export streamed from a values_list() queryset in chunks."""
+
+    def __init__(self, queryset, columns, chunk_size=CHUNK_SIZE):
+        self.queryset = queryset
+        self.columns = columns
+        self.chunk_size = chunk_size
+
+    def header(self):
+        return [c.header for c in self.columns]
+
+    def rows(self):
+        fields = [c.field for c in self.columns]
+        columns = self.columns
+        for raw in self.queryset.values_list(*fields).iterator(chunk_size=self.chunk_size):
+            yield [col.value(v) for col, v in zip(columns, raw)]
+
+def csv_cell(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+def iter_csv(export, delimiter=";", bom=True):
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=delimiter)
+    if bom:
+        buf.write("\ufeff")  # UTF-8 BOM for Excel
+    writer.writerow(export.header())
+    pending = 0
+    for row in export.rows():
+        writer.writerow([csv_cell(v) for v in row])
+        pending += 1
+        if pending >= ROWS_PER_WRITE:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            pending = 0
+    yield buf.getvalue()
+
+def attachment_response(content, filename, content_type):
+    resp = StreamingHttpResponse(content, content_type=content_type)
+    resp["Content-Disposition"] = f"attachment; filename={filename}"
+    return resp
+
+def csv_response(export, filename, content_type=CSV_CONTENT_TYPE, delimiter=";", bom=True):
+    return attachment_response(iter_csv(export, delimiter=delimiter, bom=bom), filename, content_type)
+
+def xlsx_response(export, filename):
+    return attachment_response(iter_xlsx(export), filename, XLSX_CONTENT_TYPE)
+
+RAW_DEFECT_COLUMNS = [
+    Column("id", "id", kind="number"),
+    Column("project", "project_id", kind="number"),
+    Column("stage", "stage_id", kind="number"),
+    Column("title", "title"),
+    Column("status", "status", kind="shared"),
+    Column("priority", "priority", kind="shared"),
+    Column("performer", "performer_id", kind="number"),
+    Column("deadline", "deadline", kind="date"),
+]
+
+def raw_defects_export():
+    from defects.models import Defect
+    return Export(Defect.objects.order_by("id"), RAW_DEFECT_COLUMNS)
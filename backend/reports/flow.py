@@ -0,0 +1,122 @@
+"""Flow metrics (time in status, lead and cycle time) from StatusHistory.
+
+Each defect's transitions are paired with the previous one through a
+LAG() window, so the time spent in every status comes out of a single
+query. Facts are built per closing day and cached by date: a past day
+never changes (closed is terminal), so trends over long ranges only
+query the days not cached yet.
+"""
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import Lag
+from django.utils import timezone
+from defects.models import Defect, StatusHistory
+from .timeseries import bounds, date_range, window
+
+PERCENTILES = (50, 90, 99)
+GROUPS = ("project", "stage", "engineer")
+MAX_DAYS = 366
+PAST_DAY_TIMEOUT = 7 * 24 * 3600
+TODAY_TIMEOUT = 60
+
+def percentile(sorted_values, p):
+    """Linear interpolation between closest ranks (numpy's default method)."""
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def distribution(values):
+    values = sorted(v for v in values if v is not None)
+    data = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+    data["count"] = len(values)
+    data["mean"] = sum(values) / len(values) if values else None
+    return data
+
+def closed_facts(day, tz=None):
+    """One dict per defect closed on `day`: group ids, lead/cycle seconds, seconds per status."""
+    tz = tz or timezone.get_current_timezone()
+    lo, hi = bounds(day, day, tz)
+    closed_ids = StatusHistory.objects.filter(
+        new_status=Defect.STATUS_CLOSED, changed_at__gte=lo, changed_at__lt=hi
+    ).values("defect_id")
+    rows = (
+        StatusHistory.objects.filter(defect_id__in=closed_ids)
+        .annotate(prev_at=Window(
+            Lag("changed_at"), partition_by=[F("defect_id")], order_by=[F("changed_at").asc(), F("id").asc()]
+        ))
+        .values_list(
+            "defect_id", "old_status", "new_status", "changed_at", "prev_at",
+            "defect__created_at", "defect__project_id", "defect__stage_id", "defect__performer_id",
+        )
+        .order_by("defect_id", "changed_at", "id")
+    )
+    facts = {}
+    for defect_id, old, new, changed_at, prev_at, created_at, project, stage, engineer in rows:
+        fact = facts.setdefault(defect_id, {
+            "defect": defect_id, "project": project, "stage": stage, "engineer": engineer,
+            "created_at": created_at, "started_at": None, "closed_at": None, "in_status": {},
+        })
+        spent = (changed_at - (prev_at or created_at)).total_seconds()
+        fact["in_status"][old] = fact["in_status"].get(old, 0) + spent
+        if new == Defect.STATUS_IN_PROGRESS and fact["started_at"] is None:
+            fact["started_at"] = changed_at
+        if new == Defect.STATUS_CLOSED:
+            fact["closed_at"] = changed_at
+    result = []
+    for fact in facts.values():
+        created_at, started_at, closed_at = fact.pop("created_at"), fact.pop("started_at"), fact.pop("closed_at")
+        fact["lead"] = (closed_at - created_at).total_seconds()
+        fact["cycle"] = (closed_at - started_at).total_seconds() if started_at else None
+        result.append(fact)
+    return result
+
+def cached_closed_facts(day, tz=None):
+    tz = tz or timezone.get_current_timezone()
+    today = timezone.localdate(timezone=tz)
+    if day > today:
+        return []
+    key = f"reports:flow:{tz}:{day.isoformat()}"
+    facts = cache.get(key)
+    if facts is None:
+        facts = closed_facts(day, tz)
+        cache.set(key, facts, TODAY_TIMEOUT if day == today else PAST_DAY_TIMEOUT)
+    return facts
+
+def flow_metrics(group_by="project", days=30, start=None, end=None, tz=None):
+    if group_by not in GROUPS:
+        raise ValueError("group_by must be one of: " + ", ".join(GROUPS))
+    start, end = window(days, start, end, tz)
+    throughput = []
+    facts = []
+    for day in date_range(start, end):
+        day_facts = cached_closed_facts(day, tz)
+        throughput.append({"date": day.isoformat(), "closed": len(day_facts)})
+        facts.extend(day_facts)
+    statuses = [s for s, _ in Defect.STATUS_CHOICES if s != Defect.STATUS_CLOSED]
+    groups = {}
+    for fact in facts:
+        groups.setdefault(fact[group_by], []).append(fact)
+    return {
+        "date_from": start.isoformat(),
+        "date_to": end.isoformat(),
+        "group_by": group_by,
+        "closed": len(facts),
+        "throughput": throughput,
+        "lead_time": distribution(f["lead"] for f in facts),
+        "cycle_time": distribution(f["cycle"] for f in facts),
+        "time_in_status": {
+            s: distribution(f["in_status"][s] for f in facts if s in f["in_status"]) for s in statuses
+        },
+        "groups": [
+            {
+                "id": key,
+                "closed": len(items),
+                "lead_time": distribution(f["lead"] for f in items),
+                "cycle_time": distribution(f["cycle"] for f in items),
+            }
+            for key, items in sorted(groups.items(), key=lambda kv: (kv[0] is None, kv[0] or 0))
+        ],
+    }
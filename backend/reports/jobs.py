@@ -0,0 +1,190 @@
+import datetime
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.utils import timezone
+from .exports import Export, iter_csv, raw_defects_export
+from .models import ExportJob
+from .xlsx import iter_xlsx
+
+PROGRESS_EVERY = 1000
+LOCK_STALE_SECONDS = 300
+
+def _defects(user, params):
+    from defects.web_views import defects_export_queryset, DEFECTS_EXPORT_COLUMNS
+    return Export(defects_export_queryset(user, params), DEFECTS_EXPORT_COLUMNS), "defects"
+
+def _project_defects(user, params):
+    from defects.models import Defect
+    from projects.web_views import filter_projects, PROJECT_DEFECTS_EXPORT_COLUMNS
+    pk = int(params["project"])
+    qs = Defect.objects.filter(project__in=filter_projects(user, {}).filter(pk=pk)).order_by("-created_at")
+    return Export(qs, PROJECT_DEFECTS_EXPORT_COLUMNS), f"project_{pk}_defects"
+
+def _projects(user, params):
+    from django.db.models import Count
+    from projects.web_views import filter_projects, PROJECTS_EXPORT_COLUMNS
+    qs = filter_projects(user, params).annotate(defects_count=Count("defects"))
+    return Export(qs, PROJECTS_EXPORT_COLUMNS), "projects"
+
+def _projects_defects(user, params):
+    from defects.models import Defect
+    from projects.web_views import filter_projects, PROJECTS_DEFECTS_EXPORT_COLUMNS
+    qs = Defect.objects.filter(project__in=filter_projects(user, params)).order_by("project__title", "-created_at")
+    return Export(qs, PROJECTS_DEFECTS_EXPORT_COLUMNS), "projects_defects"
+
+def _raw_defects(user, params):
+    return raw_defects_export(), "defects_raw"
+
+# dataset -> (builder(user, params) -> (Export, base filename), manager only)
+DATASETS = {
+    "defects": (_defects, False),
+    "project_defects": (_project_defects, False),
+    "projects": (_projects, False),
+    "projects_defects": (_projects_defects, False),
+    "raw_defects": (_raw_defects, True),
+}
+
+def can_run(user, dataset):
+    entry = DATASETS.get(dataset)
+    return entry is not None and (user.is_manager or not entry[1])
+
+# filters the builders understand; anything else is dropped
+PARAMS = ("status", "priority", "project", "performer", "q")
+
+def clean_params(dataset, params):
+    if not isinstance(params or {}, dict):
+        raise ValueError("Некорректные параметры экспорта")
+    params = {k: v for k, v in (params or {}).items() if k in PARAMS and v not in (None, "")}
+    if dataset == "project_defects":
+        try:
+            int(params["project"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Укажите проект")
+    return params
+
+def enqueue(user, dataset, fmt=ExportJob.FORMAT_CSV, params=None):
+    if dataset not in DATASETS:
+        raise ValueError("Неизвестный набор данных")
+    if fmt not in dict(ExportJob.FORMAT_CHOICES):
+        raise ValueError("Неизвестный формат")
+    if not can_run(user, dataset):
+        raise PermissionError("Недостаточно прав для экспорта")
+    return ExportJob.objects.create(dataset=dataset, format=fmt, params=clean_params(dataset, params), created_by=user)
+
+@contextmanager
+def lock_file(path):
+    """Portable inter-process lock for databases without SKIP LOCKED (SQLite)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > LOCK_STALE_SECONDS:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.05)
+    try:
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        yield
+    finally:
+        os.close(fd)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _lock_path():
+    return getattr(settings, "EXPORT_JOBS_LOCK_FILE", os.path.join(settings.MEDIA_ROOT, "exports", ".claim.lock"))
+
+def fail_stale_jobs(now=None):
+    """Fail running jobs whose worker has not finished them within EXPORT_JOB_TIMEOUT."""
+    now = now or timezone.now()
+    return ExportJob.objects.filter(
+        status=ExportJob.STATUS_RUNNING,
+        started_at__lt=now - datetime.timedelta(seconds=settings.EXPORT_JOB_TIMEOUT),
+    ).update(status=ExportJob.STATUS_FAILED, error="Превышено время выполнения", finished_at=now)
+
+def claim_next_job():
+    fail_stale_jobs()
+    queued = ExportJob.objects.filter(status=ExportJob.STATUS_QUEUED).order_by("created_at", "id")
+    now = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = queued.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            job.status = ExportJob.STATUS_RUNNING
+            job.started_at = now
+            job.save(update_fields=["status", "started_at"])
+            return job
+    with lock_file(_lock_path()):
+        job = queued.first()
+        if job is None:
+            return None
+        claimed = ExportJob.objects.filter(pk=job.pk, status=ExportJob.STATUS_QUEUED).update(
+            status=ExportJob.STATUS_RUNNING, started_at=now
+        )
+        if not claimed:
+            return None
+        job.status = ExportJob.STATUS_RUNNING
+        job.started_at = now
+        return job
+
+class ProgressExport(Export):
+    def __init__(self, export, job):
+        super().__init__(export.queryset, export.columns, export.chunk_size)
+        self.job = job
+
+    def rows(self):
+        done = 0
+        for row in super().rows():
+            yield row
+            done += 1
+            if done % PROGRESS_EVERY == 0:
+                ExportJob.objects.filter(pk=self.job.pk).update(progress=done)
+        self.job.progress = done
+
+def run_job(job):
+    from users.models import User
+    try:
+        user = User.objects.get(pk=job.created_by_id)
+        builder, _ = DATASETS[job.dataset]
+        export, basename = builder(user, job.params)
+        job.total = export.queryset.count()
+        ExportJob.objects.filter(pk=job.pk).update(total=job.total)
+        export = ProgressExport(export, job)
+        with tempfile.TemporaryFile() as tmp:
+            if job.format == ExportJob.FORMAT_XLSX:
+                for chunk in iter_xlsx(export):
+                    tmp.write(chunk)
+            else:
+                for chunk in iter_csv(export):
+                    tmp.write(chunk.encode("utf-8"))
+            tmp.seek(0)
+            job.file.save(f"{basename}_{job.pk}.{job.format}", File(tmp), save=False)
+        job.status = ExportJob.STATUS_DONE
+    except Exception as e:
+        job.status = ExportJob.STATUS_FAILED
+        job.error = str(e) or e.__class__.__name__
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "progress", "total", "file", "error", "finished_at"])
+    return job
+
+def work(max_jobs=None):
+    done = 0
+    while max_jobs is None or done < max_jobs:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        done += 1
+    return done
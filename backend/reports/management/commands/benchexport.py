@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+import gc
+import os
+import resource
+import sys
+import time
+
+class Rollback(Exception):
+    pass
+
+def current_rss_mb():
+    """Текущий RSS из /proc/self/statm; None, если /proc недоступен."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+class Command(BaseCommand):
+    help = "Замер потокового экспорта дефектов: строк в секунду и пиковый RSS (данные откатываются)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=50000)
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def seed(self, rows):
+        from projects.models import Project
+        from defects.models import Defect
+        project = Project.objects.create(title="bench")
+        batch = []
+        for i in range(rows):
+            batch.append(Defect(project=project, title=f"bench defect {i}", description="x" * 200))
+            if len(batch) == 5000:
+                Defect.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Defect.objects.bulk_create(batch)
+        return project
+
+    def run(self, options):
+        from defects.models import Defect
+        from defects.web_views import DEFECTS_EXPORT_COLUMNS
+        from reports.exports import Export, iter_csv
+        from reports.xlsx import iter_xlsx
+        rows = options["rows"]
+        self.stdout.write(f"Seeding {rows} defects...")
+        project = self.seed(rows)
+        qs = Defect.objects.filter(project=project).order_by("-created_at")
+        export = Export(qs, DEFECTS_EXPORT_COLUMNS, chunk_size=options["chunk_size"])
+        # ru_maxrss is a lifetime high-water mark that seeding has already raised,
+        # so the export is measured by sampling the current RSS after every chunk.
+        gc.collect()
+        rss_before = current_rss_mb()
+        rss_peak = rss_before
+        started = time.perf_counter()
+        size = 0
+        chunks = iter_xlsx(export) if options["format"] == "xlsx" else iter_csv(export)
+        for chunk in chunks:
+            size += len(chunk) if isinstance(chunk, bytes) else len(chunk.encode("utf-8"))
+            if rss_before is not None:
+                rss_peak = max(rss_peak, current_rss_mb())
+        elapsed = time.perf_counter() - started
+        if rss_before is None:
+            memory = f"peak RSS {peak_rss_mb():.1f} MB (process lifetime, seeding included)"
+        else:
+            memory = f"RSS {rss_before:.1f} MB before, peak {rss_peak:.1f} MB (+{rss_peak - rss_before:.1f} MB during export)"
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['format']}: {rows} rows in {elapsed:.2f}s "
+            f"({rows / elapsed:,.0f} rows/s, {size / 1024 / 1024:.1f} MB), {memory}"
+        ))
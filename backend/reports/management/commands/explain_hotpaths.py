@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+class Command(BaseCommand):
+    help = "Планы выполнения (EXPLAIN) для запросов списков, экспорта и отчётов по дефектам."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--analyze", action="store_true", help="EXPLAIN ANALYZE (только PostgreSQL, запросы выполняются)")
+        parser.add_argument("--project", type=int, help="Проект для запросов с фильтром по проекту")
+        parser.add_argument("--performer", type=int, help="Исполнитель для запросов с фильтром по исполнителю")
+        parser.add_argument("--only", help="Показать только запросы, в названии которых есть подстрока")
+
+    def queries(self, project_id, performer_id):
+        import datetime
+        from django.db.models import Q
+        from django.utils import timezone
+        from defects.models import OPEN_STATUSES, Defect, DefectStat, StatusHistory
+        from defects.web_views import defects_export_queryset
+        from reports.analytics import matrix_rows
+        from reports.timeseries import bounds
+        today = timezone.localdate()
+        lo, hi = bounds(today, today, timezone.get_current_timezone())
+        newest = ("-created_at", "-id")
+        listing = Defect.objects.select_related("project", "stage", "performer")
+        closed_ids = StatusHistory.objects.filter(
+            new_status=Defect.STATUS_CLOSED, changed_at__gte=lo, changed_at__lt=hi
+        ).values("defect_id")
+        return [
+            ("defects list", listing.order_by(*newest)[:25]),
+            ("defects list: project", listing.filter(project_id=project_id).order_by(*newest)[:25]),
+            ("defects list: project + status", listing.filter(project_id=project_id, status=Defect.STATUS_NEW).order_by(*newest)[:25]),
+            ("defects list: engineer scope", listing.filter(Q(project_id__in=[project_id]) | Q(performer_id=performer_id)).order_by(*newest)[:25]),
+            ("defects: performer open", Defect.objects.filter(performer_id=performer_id, status__in=OPEN_STATUSES).order_by("-created_at")[:25]),
+            ("defects: overdue", Defect.objects.filter(deadline__lt=today, status__in=OPEN_STATUSES).order_by("deadline")),
+            ("export", defects_export_queryset(_Manager(), {"project": project_id})),
+            ("report: summary", DefectStat.objects.filter(count__gt=0).values("status").order_by("status")),
+            ("report: by project", DefectStat.objects.filter(project_id=project_id, count__gt=0).values("status").order_by("status")),
+            ("report: matrix", matrix_rows("projects")),
+            ("report: matrix by dates", matrix_rows("projects", start=today - datetime.timedelta(days=30), end=today)),
+            ("report: flow closed", StatusHistory.objects.filter(defect_id__in=closed_ids).order_by("defect_id", "changed_at", "id")),
+        ]
+
+    def handle(self, *args, **options):
+        from defects.models import Defect
+        if options["analyze"] and connection.vendor != "postgresql":
+            raise CommandError("--analyze поддерживается только в PostgreSQL")
+        sample = Defect.objects.values("project_id", "performer_id").order_by("-id").first() or {}
+        project_id = options["project"] or sample.get("project_id") or 0
+        performer_id = options["performer"] or sample.get("performer_id") or 0
+        kwargs = {"analyze": True, "buffers": True} if options["analyze"] else {}
+        for name, queryset in self.queries(project_id, performer_id):
+            if options["only"] and options["only"] not in name:
+                continue
+            self.stdout.write(self.style.MIGRATE_HEADING(f"== {name}"))
+            self.stdout.write(queryset.explain(**kwargs))
+            self.stdout.write("")
+
+class _Manager:
+    is_manager = True
+    is_engineer = False
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+import time
+
+class Command(BaseCommand):
+    help = "Обработчик очереди экспортов: забирает задания и сохраняет файлы в media."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Обработать очередь и выйти")
+        parser.add_argument("--interval", type=float, default=2.0)
+        parser.add_argument("--max-jobs", type=int, default=None)
+
+    def handle(self, *args, **options):
+        from reports.jobs import work
+        processed = 0
+        while True:
+            limit = None if options["max_jobs"] is None else options["max_jobs"] - processed
+            done = work(max_jobs=limit)
+            processed += done
+            if done:
+                self.stdout.write(f"Processed {done} export job(s)")
+            if options["once"] or (options["max_jobs"] is not None and processed >= options["max_jobs"]):
+                break
+            if not done:
+                time.sleep(options["interval"])
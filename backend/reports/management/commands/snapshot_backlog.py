@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+import datetime
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Некорректная дата: {value}")
+
+class Command(BaseCommand):
+    help = "Снимки бэклога по дням: по умолчанию дозаполняет дни после последнего снимка до вчерашнего."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", type=parse_date, help="Пересчитать начиная с даты (ГГГГ-ММ-ДД)")
+        parser.add_argument("--until", dest="end", type=parse_date, help="Последний день (по умолчанию вчера)")
+
+    def handle(self, *args, **options):
+        from reports.backlog import snapshot
+        days = snapshot(options["start"], options["end"])
+        self.stdout.write(self.style.SUCCESS(f"Backlog snapshots written for {days} day(s)"))
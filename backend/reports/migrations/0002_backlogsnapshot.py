@@ -0,0 +1,33 @@
+# Generated by Django 5.0.4 on 2026-10-18 19:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0003_project_created_at'),
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BacklogSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('priority', models.CharField(max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backlog_snapshots', to='projects.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'date'], name='backlogsnapshot_project_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='backlogsnapshot',
+            constraint=models.UniqueConstraint(fields=('date', 'project', 'status', 'priority'), name='backlogsnapshot_unique_key'),
+        ),
+    ]
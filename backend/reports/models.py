@@ -0,0 +1,62 @@
+from django.db import models
+from django.conf import settings
+
+class ExportJob(models.Model):
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "в очереди"),
+        (STATUS_RUNNING, "выполняется"),
+        (STATUS_DONE, "готово"),
+        (STATUS_FAILED, "ошибка"),
+    ]
+
+    FORMAT_CSV = "csv"
+    FORMAT_XLSX = "xlsx"
+    FORMAT_CHOICES = [
+        (FORMAT_CSV, "CSV"),
+        (FORMAT_XLSX, "Excel"),
+    ]
+
+    dataset = models.CharField(max_length=50)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default=FORMAT_CSV)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    file = models.FileField(upload_to="exports/", blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="export_jobs")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="exportjob_status_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.dataset}.{self.format} #{self.pk}"
+
+class BacklogSnapshot(models.Model):
+    """Defect counts per project, status and priority at the end of a day (see reports.backlog)."""
+
+    date = models.DateField()
+    project = models.ForeignKey("projects.Project", on_delete=models.CASCADE, related_name="backlog_snapshots")
+    status = models.CharField(max_length=20)
+    priority = models.CharField(max_length=10)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["date", "project", "status", "priority"], name="backlogsnapshot_unique_key"),
+        ]
+        indexes = [
+            models.Index(fields=["project", "date"], name="backlogsnapshot_project_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.project_id}/{self.status}/{self.priority}: {self.count}"
@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from .jobs import DATASETS, can_run, clean_params
+from .models import ExportJob
 
 class SummarySerializer(serializers.Serializer):
     total = serializers.IntegerField()
@@ -7,4 +9,36 @@ class SummarySerializer(serializers.Serializer):
 
 class SimpleSerializer(serializers.Serializer):
     total = serializers.IntegerField()
-    by_status = serializers.ListField()
\ No newline at end of file
+    by_status = serializers.ListField()
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = [
+            "id", "dataset", "format", "params", "status", "progress", "total", "error",
+            "created_at", "started_at", "finished_at", "download_url",
+        ]
+        read_only_fields = [
+            "status", "progress", "total", "error", "created_at", "started_at", "finished_at",
+        ]
+
+    def get_download_url(self, obj):
+        if obj.status != ExportJob.STATUS_DONE:
+            return None
+        return f"/api/reports/exports/{obj.pk}/download/"
+
+    def validate_dataset(self, value):
+        if value not in DATASETS:
+            raise serializers.ValidationError("Неизвестный набор данных")
+        if not can_run(self.context["request"].user, value):
+            raise serializers.ValidationError("Недостаточно прав для экспорта")
+        return value
+
+    def validate(self, attrs):
+        try:
+            attrs["params"] = clean_params(attrs.get("dataset"), attrs.get("params"))
+        except ValueError as e:
+            raise serializers.ValidationError({"params": str(e)})
+        return attrs
@@ -8,6 +8,12 @@ from rest_framework.test import APIClient
 
 User = get_user_model()
 
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    # export job files and the SQLite claim lock go under MEDIA_ROOT/exports
+    settings.MEDIA_ROOT = tmp_path
+    return tmp_path
+
 @pytest.mark.django_db
 def test_summary_counts():
     m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
@@ -33,7 +39,7 @@ def test_web_reports_export_csv_manager_ok():
     client.login(username="m", password="x")
     resp = client.get("/reports/export/?download=csv")
     assert resp.status_code == 200
-    text = resp.content.decode("utf-8")
+    text = b"".join(resp.streaming_content).decode("utf-8")
     assert "id,project,stage,title,status,priority,performer,deadline" in text.replace(";", ",")
 
 @pytest.mark.django_db
@@ -65,4 +71,421 @@ def test_integration_reports_dashboard_context_keys():
     assert isinstance(ctx.get("priority_counts"), list)
     assert isinstance(ctx.get("daily_labels"), list)
     assert isinstance(ctx.get("daily_projects"), list)
-    assert isinstance(ctx.get("daily_defects"), list)
\ No newline at end of file
+    assert isinstance(ctx.get("daily_defects"), list)
+@pytest.mark.django_db
+def test_api_export_job_enqueue_run_download(media_root):
+    from django.core.management import call_command
+    from reports.models import ExportJob
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    s = Stage.objects.create(project=p, title="S")
+    Defect.objects.create(project=p, stage=s, title="D1")
+    client = APIClient()
+    client.force_authenticate(user=m)
+    resp = client.post("/api/reports/exports/", {"dataset": "defects", "format": "csv", "params": {}}, format="json")
+    assert resp.status_code == 201
+    job_id = resp.data["id"]
+    assert resp.data["status"] == ExportJob.STATUS_QUEUED
+    assert client.get(f"/api/reports/exports/{job_id}/download/").status_code == 404
+    call_command("runexportjobs", "--once")
+    data = client.get(f"/api/reports/exports/{job_id}/").data
+    assert data["status"] == ExportJob.STATUS_DONE
+    assert data["total"] == 1 and data["progress"] == 1
+    resp = client.get(data["download_url"])
+    assert resp.status_code == 200
+    text = b"".join(resp.streaming_content).decode("utf-8-sig")
+    assert "D1" in text
+    assert ExportJob.objects.get(pk=job_id).file.path.startswith(str(media_root / "exports"))
+
+@pytest.mark.django_db
+def test_api_export_job_permissions_and_ownership():
+    e = User.objects.create_user(username="e", email="e@example.com", password="x", role="engineer")
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    client = APIClient()
+    client.force_authenticate(user=e)
+    assert client.post("/api/reports/exports/", {"dataset": "raw_defects"}, format="json").status_code == 400
+    assert client.post("/api/reports/exports/", {"dataset": "nope"}, format="json").status_code == 400
+    client.force_authenticate(user=m)
+    job_id = client.post("/api/reports/exports/", {"dataset": "raw_defects", "format": "xlsx"}, format="json").data["id"]
+    client.force_authenticate(user=e)
+    assert client.get(f"/api/reports/exports/{job_id}/").status_code == 404
+
+@pytest.mark.django_db
+def test_export_job_params_validated_for_api_and_web():
+    from reports.models import ExportJob
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    client = APIClient()
+    client.force_authenticate(user=m)
+    assert client.post("/api/reports/exports/", {"dataset": "project_defects", "params": {}}, format="json").status_code == 400
+    resp = client.post(
+        "/api/reports/exports/", {"dataset": "defects", "params": {"performer": m.pk, "x": 1}}, format="json"
+    )
+    assert resp.status_code == 201 and resp.data["params"] == {"performer": m.pk}
+    web = Client()
+    web.login(username="m", password="x")
+    resp = web.post("/reports/export/", {"dataset": "project_defects", "format": "csv"}, follow=True)
+    assert [str(msg) for msg in resp.context["messages"]] == ["Укажите проект"]
+    web.post("/reports/export/", {"dataset": "defects", "format": "csv", "performer": str(m.pk)})
+    assert ExportJob.objects.order_by("-id").first().params == {"performer": str(m.pk)}
+    assert ExportJob.objects.count() == 2
+
+@pytest.mark.django_db
+def test_export_job_claim_is_exclusive():
+    from reports.jobs import claim_next_job, enqueue
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    job = enqueue(m, "raw_defects")
+    claimed = claim_next_job()
+    assert claimed.pk == job.pk and claimed.status == "running"
+    assert claim_next_job() is None
+
+@pytest.mark.django_db
+def test_claim_fails_stale_running_jobs():
+    import datetime
+    from django.utils import timezone
+    from reports.jobs import claim_next_job, enqueue
+    from reports.models import ExportJob
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    stale, fresh = enqueue(m, "raw_defects"), enqueue(m, "raw_defects")
+    ExportJob.objects.filter(pk=stale.pk).update(status="running", started_at=timezone.now() - datetime.timedelta(hours=2))
+    ExportJob.objects.filter(pk=fresh.pk).update(status="running", started_at=timezone.now())
+    assert claim_next_job() is None
+    stale.refresh_from_db()
+    fresh.refresh_from_db()
+    assert stale.status == "failed" and stale.error and stale.finished_at
+    assert fresh.status == "running"
+
+@pytest.mark.django_db
+def test_by_day_single_query_zero_filled_without_log_entries():
+    import datetime
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.utils import timezone
+    from reports.analytics import by_day
+    p = Project.objects.create(title="P")
+    today = timezone.localdate()
+    Defect.objects.create(project=p, title="D1", priority="high")
+    Defect.objects.create(project=p, title="D2", priority="high")
+    old = Defect.objects.create(project=p, title="D3", priority="low")
+    Defect.objects.filter(pk=old.pk).update(created_at=timezone.now() - datetime.timedelta(days=2))
+    with CaptureQueriesContext(connection) as ctx:
+        data = by_day(7)
+    assert len(ctx.captured_queries) == 1
+    assert len(data["labels"]) == 7
+    assert data["labels"][-1] == today.strftime("%d.%m")
+    assert data["series"]["high"][-1] == 2
+    assert data["series"]["low"][-3] == 1
+    assert sum(data["series"]["medium"]) == 0
+
+@pytest.mark.django_db
+def test_daily_counts_buckets_in_given_time_zone():
+    import datetime
+    import zoneinfo
+    from reports.timeseries import daily_counts
+    p = Project.objects.create(title="P")
+    d = Defect.objects.create(project=p, title="D")
+    # 22:30 UTC is already the next day in Moscow (UTC+3)
+    Defect.objects.filter(pk=d.pk).update(created_at=datetime.datetime(2024, 3, 1, 22, 30, tzinfo=datetime.timezone.utc))
+    day = datetime.date(2024, 3, 2)
+    msk = daily_counts(Defect.objects.all(), "created_at", start=day - datetime.timedelta(days=1), end=day, tz=zoneinfo.ZoneInfo("Europe/Moscow"))
+    utc = daily_counts(Defect.objects.all(), "created_at", start=day - datetime.timedelta(days=1), end=day, tz=datetime.timezone.utc)
+    assert msk["counts"] == [0, 1]
+    assert utc["counts"] == [1, 0]
+
+@pytest.mark.django_db
+def test_by_day_projects_uses_created_at():
+    from reports.analytics import by_day_projects
+    Project.objects.create(title="P1")
+    Project.objects.create(title="P2")
+    assert by_day_projects(7)["counts"][-1] == 2
+
+@pytest.mark.django_db
+def test_summary_reads_rollup():
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    p = Project.objects.create(title="P")
+    for prio in ("low", "high", "high"):
+        Defect.objects.create(project=p, title="D", priority=prio)
+    with CaptureQueriesContext(connection) as ctx:
+        data = summary()
+    assert "defects_defect" not in " ".join(q["sql"] for q in ctx.captured_queries).replace("defects_defectstat", "")
+    assert data["total"] == 3
+    assert {i["priority"]: i["count"] for i in data["by_priority"]} == {"low": 1, "high": 2}
+    assert by_project(p.id)["by_status"] == [{"status": "new", "count": 3}]
+
+@pytest.fixture
+def shared_cache(settings, db):
+    # report caching runs only on a backend every process shares
+    from django.core.management import call_command
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "test_cache"}}
+    call_command("createcachetable", verbosity=0)
+
+@pytest.mark.django_db
+def test_report_cache_hits_and_invalidation_on_defect_save(shared_cache):
+    from django.core.cache import cache
+    cache.clear()
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    Defect.objects.create(project=p, title="D1")
+    client = APIClient()
+    client.force_authenticate(user=m)
+    assert client.get("/api/reports/summary/").data["total"] == 1
+    assert client.get("/api/reports/summary/").data["total"] == 1
+    Defect.objects.create(project=p, title="D2")
+    assert client.get("/api/reports/summary/").data["total"] == 2
+    stats = client.get("/api/reports/cache_stats/").data
+    assert stats == {"hits": 1, "misses": 2, "computed": 2}
+
+@pytest.mark.django_db
+def test_report_generation_bumped_by_another_process_is_seen(shared_cache, monkeypatch):
+    from django.core.cache import caches
+    from reports import cache as report_cache
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    Defect.objects.create(project=p, title="D1")
+    client = APIClient()
+    client.force_authenticate(user=m)
+    etag = client.get("/api/reports/summary/")["ETag"]
+    # the write and its bump happen in another worker with its own cache connection
+    with monkeypatch.context() as patch:
+        patch.setattr(report_cache, "cache", caches.create_connection("default"))
+        Defect.objects.create(project=p, title="D2")
+    resp = client.get("/api/reports/summary/", HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 200 and resp.data["total"] == 2 and resp["ETag"] != etag
+
+def test_report_cache_single_flight(monkeypatch):
+    import threading
+    import time
+    from django.core.cache import cache
+    # LocMemCache stands in for a shared backend: its add() is atomic across threads
+    monkeypatch.setattr("reports.cache.is_shared_cache", lambda: True)
+    from reports.cache import cached_report, counters
+    cache.clear()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.3)
+        return {"total": 1}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cached_report("slow", ["test"], slow))) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == [{"total": 1}] * 10
+    assert counters()["computed"] == 1
+
+@pytest.mark.django_db
+def test_dashboard_data_two_queries_and_json_endpoint():
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from reports.analytics import dashboard
+    cache.clear()
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    Defect.objects.create(project=p, title="D1", priority="high")
+    Defect.objects.create(project=p, title="D2", priority="low", status="closed")
+    with CaptureQueriesContext(connection) as ctx:
+        data = dashboard(7)
+    assert len(ctx.captured_queries) == 2
+    assert dict(zip(data["status_labels"], data["status_counts"])) == {"new": 1, "closed": 1}
+    assert dict(zip(data["priority_labels"], data["priority_counts"])) == {"low": 1, "high": 1}
+    assert data["daily_projects"][-1] == 1 and data["daily_defects"][-1] == 2
+    client = Client(); client.login(username="m", password="x")
+    resp = client.get("/reports/dashboard/data/")
+    assert resp.status_code == 200
+    assert resp.json() == data
+
+@pytest.mark.django_db
+def test_matrix_endpoints_single_query():
+    import datetime
+    import json
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    e = User.objects.create_user(username="e", email="e@example.com", password="x", role="engineer")
+    p1 = Project.objects.create(title="P1")
+    p2 = Project.objects.create(title="P2")
+    Defect.objects.create(project=p1, title="D1", performer=e, priority="high")
+    Defect.objects.create(project=p1, title="D2", status="closed")
+    old = Defect.objects.create(project=p2, title="D3", performer=e)
+    Defect.objects.filter(pk=old.pk).update(created_at=old.created_at - datetime.timedelta(days=30))
+    client = APIClient()
+    client.force_authenticate(user=m)
+    with CaptureQueriesContext(connection) as ctx:
+        resp = client.get("/api/reports/matrix/projects/")
+        data = json.loads(b"".join(resp.streaming_content))
+    assert len([q for q in ctx.captured_queries if "defects_" in q["sql"]]) == 1
+    assert data["results"] == [
+        {"project_id": p1.id, "total": 2, "by_status": {"closed": 1, "new": 1}},
+        {"project_id": p2.id, "total": 1, "by_status": {"new": 1}},
+    ]
+    since = (datetime.date.today() - datetime.timedelta(days=7)).isoformat()
+    resp = client.get(f"/api/reports/matrix/engineers/?date_from={since}&ids={e.id},{m.id}")
+    data = json.loads(b"".join(resp.streaming_content))
+    assert data["results"] == [
+        {"engineer_id": e.id, "total": 1, "by_status": {"new": 1}},
+        {"engineer_id": m.id, "total": 0, "by_status": {}},
+    ]
+    resp = client.get("/api/reports/matrix/projects/?priority=high")
+    assert json.loads(b"".join(resp.streaming_content))["results"][0]["total"] == 1
+    assert client.get("/api/reports/matrix/projects/?date_to=bad").status_code == 400
+
+def test_flow_percentile_matches_linear_interpolation():
+    from reports.flow import percentile, distribution
+    values = [1, 2, 3, 4, 10]
+    assert percentile(values, 50) == 3
+    assert percentile(values, 90) == pytest.approx(7.6)
+    assert distribution([None, 4, 2])["count"] == 2
+
+@pytest.mark.django_db
+def test_flow_metrics_from_status_history():
+    import datetime
+    from django.core.cache import cache
+    from django.utils import timezone
+    from defects.models import StatusHistory
+    from defects.services import change_status
+    cache.clear()
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    d = Defect.objects.create(project=p, title="D1")
+    for status in ("in_progress", "review", "closed"):
+        change_status(d, status, m)
+    t0 = timezone.now() - datetime.timedelta(days=2)
+    Defect.objects.filter(pk=d.pk).update(created_at=t0)
+    for hours, status in ((1, "in_progress"), (5, "review"), (6, "closed")):
+        StatusHistory.objects.filter(defect=d, new_status=status).update(changed_at=t0 + datetime.timedelta(hours=hours))
+    closed_day = timezone.localtime(t0 + datetime.timedelta(hours=6)).date()
+    client = APIClient()
+    client.force_authenticate(user=m)
+    data = client.get("/api/reports/flow/?days=7").data
+    assert data["closed"] == 1
+    assert data["lead_time"]["p50"] == 6 * 3600
+    assert data["cycle_time"]["p50"] == 5 * 3600
+    assert data["time_in_status"]["new"]["p50"] == 3600
+    assert data["time_in_status"]["in_progress"]["p50"] == 4 * 3600
+    assert data["groups"] == [{"id": p.id, "closed": 1, "lead_time": data["lead_time"], "cycle_time": data["cycle_time"]}]
+    assert {"date": closed_day.isoformat(), "closed": 1} in data["throughput"]
+    assert client.get("/api/reports/flow/?group_by=nope").status_code == 400
+    assert client.get("/api/reports/flow/?date_from=2024-01-01&date_to=2024-12-31").status_code == 200
+    assert client.get("/api/reports/flow/?date_from=2024-01-01&date_to=2025-01-01").status_code == 400
+    assert client.get("/api/reports/flow/?date_from=2000-01-01").status_code == 400
+    assert client.get("/api/reports/flow/?date_from=2025-01-02&date_to=2025-01-01").status_code == 400
+
+@pytest.mark.django_db
+def test_backlog_snapshots_replay_and_burndown():
+    import datetime
+    from django.core.management import call_command
+    from django.utils import timezone
+    from defects.models import StatusHistory
+    from defects.services import change_status
+    from reports.models import BacklogSnapshot
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    today = timezone.localdate()
+    day = lambda n: timezone.make_aware(datetime.datetime.combine(today - datetime.timedelta(days=n), datetime.time(12)))
+    d1 = Defect.objects.create(project=p, title="D1")
+    d2 = Defect.objects.create(project=p, title="D2", priority="high")
+    Defect.objects.filter(pk=d1.pk).update(created_at=day(5))
+    Defect.objects.filter(pk=d2.pk).update(created_at=day(3))
+    for status in ("in_progress", "review", "closed"):
+        change_status(d1, status, m)
+    StatusHistory.objects.filter(defect=d1).update(changed_at=day(2))
+    call_command("snapshot_backlog")
+    assert set(BacklogSnapshot.objects.values_list("date", flat=True)) == {
+        today - datetime.timedelta(days=n) for n in range(1, 6)
+    }
+    assert BacklogSnapshot.objects.get(date=today - datetime.timedelta(days=3), status="new", priority="medium").count == 1
+    call_command("snapshot_backlog")
+    assert BacklogSnapshot.objects.count() == 8
+    client = APIClient()
+    client.force_authenticate(user=m)
+    since = (today - datetime.timedelta(days=6)).isoformat()
+    results = client.get(f"/api/reports/burndown/?project={p.id}&date_from={since}").data["results"]
+    assert [r["open"] for r in results] == [None, 1, 1, 2, 1, 1, 1]
+    assert [r["closed"] for r in results] == [None, 0, 0, 0, 1, 1, 1]
+    assert results[-1]["total"] == 2
+
+@pytest.mark.django_db
+def test_backlog_snapshot_rebuilds_after_priority_change_between_runs():
+    import datetime
+    from django.core.management import call_command
+    from django.utils import timezone
+    from defects.services import change_status
+    from reports.models import BacklogSnapshot
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    today = timezone.localdate()
+    d = Defect.objects.create(project=p, title="D")
+    Defect.objects.filter(pk=d.pk).update(
+        created_at=timezone.make_aware(datetime.datetime.combine(today - datetime.timedelta(days=5), datetime.time(12)))
+    )
+    call_command("snapshot_backlog", "--until", (today - datetime.timedelta(days=3)).isoformat())
+    assert set(BacklogSnapshot.objects.values_list("priority", flat=True)) == {"medium"}
+    d.refresh_from_db()
+    d.priority = "high"
+    d.save()
+    change_status(d, "in_progress", m)
+    call_command("snapshot_backlog")
+    rows = BacklogSnapshot.objects.values_list("date", "status", "priority", "count")
+    assert {(s, pr, n) for _, s, pr, n in rows} == {("new", "high", 1)}
+    assert BacklogSnapshot.objects.filter(date=today - datetime.timedelta(days=1)).exists()
+
+@pytest.mark.django_db
+def test_reports_uncached_without_etag_on_process_local_cache():
+    from django.core.cache import cache
+    cache.clear()
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    Defect.objects.create(project=p, title="D1")
+    client = APIClient()
+    client.force_authenticate(user=m)
+    resp = client.get("/api/reports/summary/")
+    assert resp.data["total"] == 1 and "ETag" not in resp
+    # the write happens in another worker: its generation bump never reaches this process
+    generations = cache.get_many([f"reports:gen:{s}" for s in ("defects", "projects")])
+    Defect.objects.create(project=p, title="D2")
+    cache.set_many(generations)
+    resp = client.get("/api/reports/summary/", HTTP_IF_NONE_MATCH="*")
+    assert resp.status_code == 200 and resp.data["total"] == 2
+
+@pytest.mark.django_db
+def test_report_endpoints_answer_304_until_generation_changes(shared_cache):
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    cache.clear()
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    p = Project.objects.create(title="P")
+    Defect.objects.create(project=p, title="D1")
+    client = APIClient()
+    client.force_authenticate(user=m)
+    for url in ("/api/reports/summary/", "/api/reports/matrix/projects/", "/api/reports/flow/", "/api/reports/burndown/"):
+        etag = client.get(url)["ETag"]
+        with CaptureQueriesContext(connection) as ctx:
+            assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+        # only generation lookups in the cache table, no report queries
+        assert all("test_cache" in q["sql"] for q in ctx.captured_queries)
+    etag = client.get("/api/reports/summary/")["ETag"]
+    Defect.objects.create(project=p, title="D2")
+    resp = client.get("/api/reports/summary/", HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 200 and resp.data["total"] == 2
+
+@pytest.mark.django_db
+def test_explain_hotpaths_prints_plans():
+    import io
+    from django.core.management import call_command
+    from django.db import connection
+    p = Project.objects.create(title="P")
+    u = User.objects.create_user(username="e", password="x", role="engineer")
+    Defect.objects.create(project=p, title="D", performer=u)
+    out = io.StringIO()
+    call_command("explain_hotpaths", stdout=out)
+    text = out.getvalue()
+    for name in ("defects list: project + status", "defects: performer open", "export", "report: matrix", "report: flow closed"):
+        assert f"== {name}" in text
+    if connection.vendor == "sqlite":
+        assert "defect_proj_status_created_idx" in text
@@ -0,0 +1,89 @@
+"""Daily time series answered by one GROUP BY TruncDate(...) query.
+
+The window is turned into an aware [start, end) range on the raw timestamp
+column, so the filter stays index-friendly; bucketing happens in the given
+time zone and missing days are zero-filled in Python.
+"""
+import datetime
+from django.db.models import CharField, Count, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+LABEL_FORMAT = "%d.%m"
+
+def window(days=None, start=None, end=None, tz=None):
+    """Resolve (start, end) local dates; defaults to the last `days` days ending today."""
+    tz = tz or timezone.get_current_timezone()
+    if end is None:
+        end = timezone.localdate(timezone=tz)
+    if start is None:
+        start = end - datetime.timedelta(days=(days or 1) - 1)
+    if start > end:
+        raise ValueError("start must not be after end")
+    return start, end
+
+def date_range(start, end):
+    return [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+
+def bounds(start, end, tz):
+    lo = timezone.make_aware(datetime.datetime.combine(start, datetime.time.min), tz)
+    hi = timezone.make_aware(datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min), tz)
+    return lo, hi
+
+def grouped_counts(queryset, field, start, end, group_by=None, tz=None):
+    """{(day, group) or day: count} for rows whose `field` falls in [start, end] local days."""
+    tz = tz or timezone.get_current_timezone()
+    lo, hi = bounds(start, end, tz)
+    keys = ["day"] + ([group_by] if group_by else [])
+    rows = (
+        queryset.filter(**{f"{field}__gte": lo, f"{field}__lt": hi})
+        .annotate(day=TruncDate(field, tzinfo=tz))
+        .values(*keys)
+        .annotate(count=Count("pk"))
+        .order_by()
+    )
+    if group_by:
+        return {(r["day"], r[group_by]): r["count"] for r in rows}
+    return {r["day"]: r["count"] for r in rows}
+
+def daily_counts(queryset, field, days=None, start=None, end=None, tz=None):
+    start, end = window(days, start, end, tz)
+    counts = grouped_counts(queryset, field, start, end, tz=tz)
+    dates = date_range(start, end)
+    return {
+        "labels": [d.strftime(LABEL_FORMAT) for d in dates],
+        "dates": [d.isoformat() for d in dates],
+        "counts": [counts.get(d, 0) for d in dates],
+    }
+
+def daily_series(queryset, field, group_by, groups, days=None, start=None, end=None, tz=None):
+    """Zero-filled per-day counts for every value in `groups` (e.g. priorities)."""
+    start, end = window(days, start, end, tz)
+    counts = grouped_counts(queryset, field, start, end, group_by=group_by, tz=tz)
+    dates = date_range(start, end)
+    return {
+        "labels": [d.strftime(LABEL_FORMAT) for d in dates],
+        "dates": [d.isoformat() for d in dates],
+        "series": {g: [counts.get((d, g), 0) for d in dates] for g in groups},
+    }
+
+def daily_counts_many(sources, days=None, start=None, end=None, tz=None):
+    """Zero-filled per-day counts for several {name: (queryset, field)} sources in one UNION ALL query."""
+    tz = tz or timezone.get_current_timezone()
+    start, end = window(days, start, end, tz)
+    lo, hi = bounds(start, end, tz)
+    parts = [
+        queryset.filter(**{f"{field}__gte": lo, f"{field}__lt": hi})
+        .annotate(day=TruncDate(field, tzinfo=tz), source=Value(name, output_field=CharField()))
+        .values("day", "source")
+        .annotate(count=Count("pk"))
+        .values_list("day", "source", "count")
+        .order_by()
+        for name, (queryset, field) in sources.items()
+    ]
+    counts = {(day, name): n for day, name, n in parts[0].union(*parts[1:], all=True)}
+    dates = date_range(start, end)
+    data = {"labels": [d.strftime(LABEL_FORMAT) for d in dates], "dates": [d.isoformat() for d in dates]}
+    for name in sources:
+        data[name] = [counts.get((d, name), 0) for d in dates]
+    return data
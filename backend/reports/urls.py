@@ -1,9 +1,18 @@
 from django.urls import path
-from .views import SummaryView, ByProjectView, ByEngineerView, ExportView
+from rest_framework.routers import DefaultRouter
+from .views import SummaryView, ByProjectView, ByEngineerView, ExportView, ExportJobViewSet, CacheStatsView, MatrixView, FlowView, BurndownView
+
+router = DefaultRouter()
+router.register(r"exports", ExportJobViewSet, basename="export-job")
 
 urlpatterns = [
     path("summary/", SummaryView.as_view()),
     path("by_project/", ByProjectView.as_view()),
     path("by_engineer/", ByEngineerView.as_view()),
+    path("matrix/projects/", MatrixView.as_view(kind="projects")),
+    path("matrix/engineers/", MatrixView.as_view(kind="engineers")),
+    path("flow/", FlowView.as_view()),
+    path("burndown/", BurndownView.as_view()),
     path("export/", ExportView.as_view()),
-]
\ No newline at end of file
+    path("cache_stats/", CacheStatsView.as_view()),
+] + router.urls
@@ -1,50 +1,158 @@
+import datetime
+import json
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from users.permissions import IsManager
-from .analytics import summary, by_project, by_engineer
-import csv
-from django.http import HttpResponse
+from defects.models import Defect
+from .analytics import summary, by_project, by_engineer, status_matrix
+from config.conditional import conditional
+from .cache import cached_report, counters, report_etag, BACKLOG, DEFECTS, PROJECTS
+from .backlog import burndown
+from .flow import flow_metrics, GROUPS, MAX_DAYS
+from .timeseries import window
+from .exports import raw_defects_export, csv_response
+from .models import ExportJob
+from .serializers import ExportJobSerializer
 
 class SummaryView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        data = summary()
-        return Response(data)
+        return conditional(
+            request, report_etag("summary", [DEFECTS]), None,
+            lambda: Response(cached_report("summary", [DEFECTS], summary)),
+        )
 
 class ByProjectView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        project_id = request.query_params.get("project_id")
-        return Response(by_project(int(project_id)))
+        project_id = int(request.query_params.get("project_id"))
+        return conditional(
+            request, report_etag("by_project", [DEFECTS], project_id), None,
+            lambda: Response(cached_report("by_project", [DEFECTS], by_project, project_id)),
+        )
 
 class ByEngineerView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        engineer_id = request.query_params.get("engineer_id")
-        return Response(by_engineer(int(engineer_id)))
+        engineer_id = int(request.query_params.get("engineer_id"))
+        return conditional(
+            request, report_etag("by_engineer", [DEFECTS], engineer_id), None,
+            lambda: Response(cached_report("by_engineer", [DEFECTS], by_engineer, engineer_id)),
+        )
+
+def parse_ids(value):
+    if not value:
+        return None
+    try:
+        return sorted({int(v) for v in value.split(",") if v.strip()})
+    except ValueError:
+        raise ValidationError({"ids": "Ожидается список id через запятую"})
+
+def parse_date(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError({name: "Ожидается дата в формате ГГГГ-ММ-ДД"})
+
+def iter_json_results(items):
+    yield '{"results": ['
+    for i, item in enumerate(items):
+        yield ("," if i else "") + json.dumps(item, ensure_ascii=False)
+    yield "]}"
+
+class MatrixView(APIView):
+    """Status counts for every project or engineer (or an ids= subset), streamed as JSON."""
+    permission_classes = [IsAuthenticated]
+    kind = None
+
+    def get(self, request):
+        params = request.query_params
+        priority = params.get("priority")
+        if priority and priority not in dict(Defect.PRIORITY_CHOICES):
+            raise ValidationError({"priority": "Неизвестный приоритет"})
+        ids, start, end = parse_ids(params.get("ids")), parse_date(params, "date_from"), parse_date(params, "date_to")
+        etag = report_etag(f"matrix_{self.kind}", [DEFECTS, PROJECTS], ids, priority, start, end)
+        return conditional(request, etag, None, lambda: StreamingHttpResponse(
+            iter_json_results(status_matrix(self.kind, ids=ids, priority=priority, start=start, end=end)),
+            content_type="application/json",
+        ))
+
+class FlowView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        group_by = params.get("group_by", "project")
+        if group_by not in GROUPS:
+            raise ValidationError({"group_by": "Допустимо: " + ", ".join(GROUPS)})
+        days = params.get("days", "30")
+        if not days.isdigit() or not 1 <= int(days) <= MAX_DAYS:
+            raise ValidationError({"days": f"Ожидается число от 1 до {MAX_DAYS}"})
+        try:
+            start, end = window(int(days), parse_date(params, "date_from"), parse_date(params, "date_to"))
+        except ValueError:
+            raise ValidationError({"date_from": "Некорректный период"})
+        if (end - start).days >= MAX_DAYS:
+            raise ValidationError({"date_from": f"Период не может быть длиннее {MAX_DAYS} дней"})
+        etag = report_etag("flow", [DEFECTS], group_by, start, end, timezone.localdate())
+        return conditional(request, etag, None, lambda: Response(flow_metrics(group_by, start=start, end=end)))
+
+class BurndownView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        end = parse_date(params, "date_to") or timezone.localdate()
+        start = parse_date(params, "date_from") or end - datetime.timedelta(days=29)
+        if start > end or (end - start).days > 730:
+            raise ValidationError({"date_from": "Некорректный период"})
+        project = params.get("project")
+        if project is not None and not project.isdigit():
+            raise ValidationError({"project": "Ожидается id проекта"})
+        project_id = int(project) if project is not None else None
+        etag = report_etag("burndown", [DEFECTS, BACKLOG], project_id, start, end, timezone.localdate())
+        return conditional(request, etag, None, lambda: Response({"project": project_id, "results": burndown(project_id, start, end)}))
+
+class CacheStatsView(APIView):
+    permission_classes = [IsAuthenticated, IsManager]
+
+    def get(self, request):
+        return Response(counters())
 
 class ExportView(APIView):
     permission_classes = [IsAuthenticated, IsManager]
 
     def get(self, request):
-        from defects.models import Defect
-        response = HttpResponse(content_type="text/csv")
-        response["Content-Disposition"] = "attachment; filename=defects.csv"
-        writer = csv.writer(response)
-        writer.writerow(["id", "project", "stage", "title", "status", "priority", "performer", "deadline"])
-        for d in Defect.objects.all().select_related("project", "stage", "performer"):
-            writer.writerow([
-                d.id,
-                d.project_id,
-                d.stage_id or "",
-                d.title,
-                d.status,
-                d.priority,
-                d.performer_id or "",
-                d.deadline or "",
-            ])
-        return response
\ No newline at end of file
+        return csv_response(raw_defects_export(), "defects.csv", content_type="text/csv", delimiter=",", bom=False)
+
+def export_job_file_response(job):
+    if job.status != ExportJob.STATUS_DONE or not job.file:
+        raise NotFound("Файл экспорта ещё не готов")
+    return FileResponse(job.file.open("rb"), as_attachment=True, filename=job.file.name.rsplit("/", 1)[-1])
+
+class ExportJobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    serializer_class = ExportJobSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = []
+
+    def get_queryset(self):
+        return ExportJob.objects.filter(created_by=self.request.user).order_by("-created_at", "-id")
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+    @action(detail=True, methods=["get"])
+    def download(self, request, pk=None):
+        return export_job_file_response(self.get_object())
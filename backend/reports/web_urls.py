@@ -1,9 +1,11 @@
 from django.urls import path
-from .web_views import ReportDashboardView, ReportExportView, ProjectReportView, EngineerReportView
+from .web_views import ReportDashboardView, DashboardDataView, ReportExportView, ProjectReportView, EngineerReportView, ExportJobDownloadView
 
 urlpatterns = [
     path("dashboard/", ReportDashboardView.as_view(), name="reports_dashboard"),
+    path("dashboard/data/", DashboardDataView.as_view(), name="reports_dashboard_data"),
     path("export/", ReportExportView.as_view(), name="reports_export"),
+    path("exports/<int:pk>/download/", ExportJobDownloadView.as_view(), name="reports_export_download"),
     path("by_project/", ProjectReportView.as_view(), name="reports_by_project"),
     path("by_engineer/", EngineerReportView.as_view(), name="reports_by_engineer"),
 ]
\ No newline at end of file
@@ -1,11 +1,18 @@
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.utils import timezone
+from django.views import View
 from django.views.generic import TemplateView
-from django.http import HttpResponse
+from config.conditional import conditional
 from users.models import User
 from users.permissions import IsManager
-from .analytics import summary, by_project, by_engineer
-from .analytics import by_day_projects, by_day_defects
-import csv
+from .analytics import by_project, by_engineer, dashboard
+from .cache import cached_report, report_etag, DEFECTS, PROJECTS
+from .exports import raw_defects_export, csv_response
+from .jobs import DATASETS, enqueue
+from .models import ExportJob
 
 class ManagerRequiredMixin:
     def dispatch(self, request, *args, **kwargs):
@@ -14,46 +21,63 @@ class ManagerRequiredMixin:
             return HttpResponseForbidden()
         return super().dispatch(request, *args, **kwargs)
 
+def cached_dashboard():
+    return cached_report("dashboard", [DEFECTS, PROJECTS], lambda day: dashboard(7, end=day), timezone.localdate())
+
+def dashboard_etag():
+    return report_etag("dashboard", [DEFECTS, PROJECTS], timezone.localdate())
+
 class ReportDashboardView(LoginRequiredMixin, TemplateView):
     template_name = "reports/dashboard.html"
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        s = summary()
-        ctx["status_labels"] = [i["status"] for i in s["by_status"]]
-        ctx["status_counts"] = [i["count"] for i in s["by_status"]]
-        ctx["priority_labels"] = [i["priority"] for i in s["by_priority"]]
-        ctx["priority_counts"] = [i["count"] for i in s["by_priority"]]
-        dp = by_day_projects(7)
-        dd = by_day_defects(7)
-        # Prefer labels from projects (should match defects range)
-        ctx["daily_labels"] = dp["labels"]
-        ctx["daily_projects"] = dp["counts"]
-        ctx["daily_defects"] = dd["counts"]
+        ctx.update(cached_dashboard())
         return ctx
 
+class DashboardDataView(LoginRequiredMixin, View):
+    def get(self, request):
+        return conditional(request, dashboard_etag(), None, lambda: JsonResponse(cached_dashboard()))
+
 class ReportExportView(ManagerRequiredMixin, TemplateView):
     template_name = "reports/export.html"
 
     def get(self, request, *args, **kwargs):
         if request.GET.get("download") == "csv":
-            from defects.models import Defect
-            response = HttpResponse(content_type="text/csv")
-            response["Content-Disposition"] = "attachment; filename=defects.csv"
-            writer = csv.writer(response)
-            writer.writerow(["id", "project", "stage", "title", "status", "priority", "performer", "deadline"])
-            for d in Defect.objects.all().select_related("project", "stage", "performer"):
-                writer.writerow([d.id, d.project_id, d.stage_id or "", d.title, d.status, d.priority, d.performer_id or "", d.deadline or ""])
-            return response
+            return csv_response(raw_defects_export(), "defects.csv", content_type="text/csv", delimiter=",", bom=False)
         return super().get(request, *args, **kwargs)
 
+    def post(self, request, *args, **kwargs):
+        dataset = request.POST.get("dataset", "raw_defects")
+        fmt = request.POST.get("format", ExportJob.FORMAT_CSV)
+        try:
+            job = enqueue(request.user, dataset, fmt, request.POST.dict())
+        except (ValueError, PermissionError) as e:
+            messages.error(request, str(e))
+        else:
+            messages.success(request, f"Экспорт #{job.pk} поставлен в очередь")
+        return redirect("reports_export")
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx["jobs"] = ExportJob.objects.filter(created_by=self.request.user).order_by("-created_at", "-id")[:20]
+        ctx["datasets"] = list(DATASETS)
+        return ctx
+
+class ExportJobDownloadView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        job = get_object_or_404(ExportJob, pk=pk, created_by=request.user)
+        if job.status != ExportJob.STATUS_DONE or not job.file:
+            raise Http404
+        return FileResponse(job.file.open("rb"), as_attachment=True, filename=job.file.name.rsplit("/", 1)[-1])
+
 class ProjectReportView(LoginRequiredMixin, TemplateView):
     template_name = "reports/project_report.html"
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         project_id = int(self.request.GET.get("project_id")) if self.request.GET.get("project_id") else None
-        ctx["data"] = by_project(project_id) if project_id else {"project_id": None, "total": 0, "by_status": []}
+        ctx["data"] = cached_report("by_project", [DEFECTS], by_project, project_id) if project_id else {"project_id": None, "total": 0, "by_status": []}
         return ctx
 
 class EngineerReportView(LoginRequiredMixin, TemplateView):
@@ -62,5 +86,5 @@ class EngineerReportView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         engineer_id = int(self.request.GET.get("engineer_id")) if self.request.GET.get("engineer_id") else None
-        ctx["data"] = by_engineer(engineer_id) if engineer_id else {"engineer_id": None, "total": 0, "by_status": []}
+        ctx["data"] = cached_report("by_engineer", [DEFECTS], by_engineer, engineer_id) if engineer_id else {"engineer_id": None, "total": 0, "by_status": []}
         return ctx
\ No newline at end of file
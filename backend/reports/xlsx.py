@@ -0,0 +1,181 @@
+"""Streaming XLSX writer: sheet XML is deflated into the zip as rows arrive.
+
+Only "shared" columns use the shared-string table; free text is written inline
+so the table does not grow with the number of rows.
+"""
+import datetime
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+from django.utils import timezone
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ROWS_PER_FLUSH = 500
+EPOCH = datetime.datetime(1899, 12, 30)
+
+STYLE_DEFAULT = 0
+STYLE_DATE = 1
+STYLE_DATETIME = 2
+STYLE_HEADER = 3
+
+ILLEGAL_XML_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>
+</Types>"""
+
+ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>
+</Relationships>"""
+
+STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm"/></numFmts>
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="4">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>
+</cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>"""
+
+SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_TAIL = "</sheetData></worksheet>"
+
+def column_letter(index):
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+def xml_text(value):
+    return escape(ILLEGAL_XML_RE.sub("", str(value)))
+
+def excel_serial(value):
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(timezone.localtime(value))
+        delta = value - EPOCH
+        return delta.days + delta.seconds / 86400 + delta.microseconds / 86400e6
+    return (value - EPOCH.date()).days
+
+class SharedStrings:
+    def __init__(self):
+        self.index = {}
+        self.count = 0
+
+    def get(self, value):
+        self.count += 1
+        value = str(value)
+        idx = self.index.get(value)
+        if idx is None:
+            idx = self.index[value] = len(self.index)
+        return idx
+
+    def xml(self):
+        parts = [
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            f'count="{self.count}" uniqueCount="{len(self.index)}">'
+        ]
+        parts.extend(f'<si><t xml:space="preserve">{xml_text(s)}</t></si>' for s in self.index)
+        parts.append("</sst>")
+        return "".join(parts)
+
+class _Sink:
+    """Write-only, unseekable file object that hands written bytes back on drain()."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def render_cell(ref, kind, value, strings):
+    if value is None or value == "":
+        return ""
+    if kind in ("date", "datetime") and isinstance(value, (datetime.date, datetime.datetime)):
+        style = STYLE_DATETIME if isinstance(value, datetime.datetime) else STYLE_DATE
+        return f'<c r="{ref}" s="{style}"><v>{excel_serial(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if kind == "shared":
+        return f'<c r="{ref}" t="s"><v>{strings.get(value)}</v></c>'
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{xml_text(value)}</t></is></c>'
+
+def iter_xlsx(export, sheet_name="Лист1"):
+    """Yield the bytes of an .xlsx workbook for an Export, batch by batch."""
+    sink = _Sink()
+    strings = SharedStrings()
+    letters = [column_letter(i) for i in range(len(export.columns))]
+    kinds = [c.kind for c in export.columns]
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", CONTENT_TYPES)
+        zf.writestr("_rels/.rels", ROOT_RELS)
+        zf.writestr("xl/workbook.xml", WORKBOOK.format(name=xml_text(sheet_name)))
+        zf.writestr("xl/_rels/workbook.xml.rels", WORKBOOK_RELS)
+        zf.writestr("xl/styles.xml", STYLES)
+        yield sink.drain()
+        with zf.open("xl/worksheets/sheet1.xml", mode="w", force_zip64=True) as sheet:
+            header = "".join(
+                f'<c r="{letter}1" s="{STYLE_HEADER}" t="inlineStr"><is><t>{xml_text(h)}</t></is></c>'
+                for letter, h in zip(letters, export.header())
+            )
+            buf = [SHEET_HEAD, f'<row r="1">{header}</row>']
+            rownum = 1
+            for row in export.rows():
+                rownum += 1
+                cells = "".join(
+                    render_cell(f"{letter}{rownum}", kind, value, strings)
+                    for letter, kind, value in zip(letters, kinds, row)
+                )
+                buf.append(f'<row r="{rownum}">{cells}</row>')
+                if len(buf) >= ROWS_PER_FLUSH:
+                    sheet.write("".join(buf).encode("utf-8"))
+                    buf.clear()
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+            buf.append(SHEET_TAIL)
+            sheet.write("".join(buf).encode("utf-8"))
+        zf.writestr("xl/sharedStrings.xml", strings.xml())
+    yield sink.drain()
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
+
+class UsersConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "users"
+
+    def ready(self):
+        from django.contrib.auth.models import Group
+        from .models import forget_group_ids
+        post_save.connect(forget_group_ids, sender=Group, dispatch_uid="users_group_ids_save")
+        post_delete.connect(forget_group_ids, sender=Group, dispatch_uid="users_group_ids_delete")
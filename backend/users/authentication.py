@@ -0,0 +1,49 @@
+"""JWT authentication that trusts role claims signed into the access token.
+
+Tokens carry the user's role, active flag and perm_version. The current
+perm_version of each user is kept in the cache; while it matches the
+token, the request user is built from the claims without a query. A
+change of role, is_active or is_superuser bumps perm_version, so older
+tokens fall back to loading the user row until they are refreshed.
+"""
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from .models import User
+
+CLAIMS = ("username", "role", "is_active", "is_superuser", "perm_version")
+
+def version_key(user_id):
+    return f"users:perm_version:{user_id}"
+
+def remember_perm_version(user):
+    # Bounded by the access token lifetime so a per-process cache cannot trust stale claims longer than one token.
+    cache.set(version_key(user.pk), user.perm_version, api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+def forget_perm_version(*user_ids):
+    cache.delete_many([version_key(pk) for pk in user_ids])
+
+def add_claims(token, user):
+    for claim in CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+def user_from_claims(token):
+    user = User(id=token[api_settings.USER_ID_CLAIM], **{c: token[c] for c in CLAIMS})
+    user._state.adding = False
+    user.from_token = True
+    return user
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if any(c not in validated_token for c in CLAIMS):
+            return super().get_user(validated_token)
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        if cache.get(version_key(user_id)) != validated_token["perm_version"]:
+            user = super().get_user(validated_token)
+            remember_perm_version(user)
+            return user
+        if not validated_token["is_active"]:
+            raise AuthenticationFailed("Пользователь отключён", code="user_inactive")
+        return user_from_claims(validated_token)
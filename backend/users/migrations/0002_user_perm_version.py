@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-18 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='perm_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
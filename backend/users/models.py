@@ -1,5 +1,61 @@
 from django.contrib.auth.models import AbstractUser, Group
-from django.db import models
+from django.db import connection, models, transaction
+
+LINK_BATCH = 500
+
+_group_ids = {}
+
+def role_group_ids():
+    """{role: Group id}, cached per process once the groups are known to be committed.
+
+    The signals below clear the cache, but a group can also disappear behind
+    their back (raw SQL, flush, another process), so link_role_group() checks
+    the id in the INSERT itself.
+    """
+    if len(_group_ids) == len(User.ROLE_CHOICES):
+        return _group_ids
+    ids = dict(Group.objects.filter(name__in=[r for r, _ in User.ROLE_CHOICES]).values_list("name", "pk"))
+    for role, _ in User.ROLE_CHOICES:
+        if role not in ids:
+            ids[role] = Group.objects.get_or_create(name=role)[0].pk
+    transaction.on_commit(lambda: _group_ids.update(ids))
+    return ids
+
+def forget_group_ids(**kwargs):
+    _group_ids.clear()
+
+def _insert_links(user_ids, group_id, role):
+    through = User.groups.through
+    qn = connection.ops.quote_name
+    user_col = through._meta.get_field("user").column
+    group_col = through._meta.get_field("group").column
+    marks = ", ".join(["%s"] * len(user_ids))
+    sql = (
+        f"INSERT INTO {qn(through._meta.db_table)} ({qn(user_col)}, {qn(group_col)}) "
+        f"SELECT u.{qn('id')}, g.{qn('id')} FROM {qn(User._meta.db_table)} u, {qn(Group._meta.db_table)} g "
+        f"WHERE g.{qn('id')} = %s AND g.{qn('name')} = %s AND u.{qn('id')} IN ({marks})"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [group_id, role, *user_ids])
+        return cursor.rowcount
+
+def link_role_group(user_ids, role):
+    """Put users without groups into the group of `role`; returns the number of rows inserted.
+
+    Rows are inserted only if the cached group id still names that group; a
+    short count drops the cache and retries once with ids read from the table.
+    """
+    user_ids = list(user_ids)
+    inserted = 0
+    for attempt in range(2):
+        group_id = role_group_ids()[role]
+        for i in range(0, len(user_ids), LINK_BATCH):
+            inserted += _insert_links(user_ids[i:i + LINK_BATCH], group_id, role)
+        if inserted == len(user_ids) or attempt:
+            return inserted
+        forget_group_ids()
+        User.groups.through.objects.filter(user_id__in=user_ids).delete()
+        inserted = 0
 
 class User(AbstractUser):
     ROLE_MANAGER = "manager"
@@ -13,20 +69,44 @@ class User(AbstractUser):
 
     email = models.EmailField(unique=True)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default=ROLE_ENGINEER)
+    perm_version = models.PositiveIntegerField(default=0)
+
+    AUTH_FIELDS = ("role", "is_active", "is_superuser")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if set(cls.AUTH_FIELDS) <= set(field_names):
+            instance._auth_state = instance.auth_state()
+        return instance
+
+    def auth_state(self):
+        return tuple(getattr(self, f) for f in self.AUTH_FIELDS)
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        self.sync_groups()
+        if getattr(self, "from_token", False):
+            raise ValueError("User built from token claims cannot be saved")
+        loaded = getattr(self, "_auth_state", None)
+        changed = loaded is not None and loaded != self.auth_state()
+        role_changed = self._state.adding or loaded is None or loaded[0] != self.role
+        if changed:
+            self.perm_version += 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "perm_version"}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if role_changed:
+                self.sync_groups()
+        self._auth_state = self.auth_state()
+        if changed:
+            from .authentication import forget_perm_version
+            transaction.on_commit(lambda: forget_perm_version(self.pk))
 
     def sync_groups(self):
-        groups = {
-            self.ROLE_MANAGER: Group.objects.get_or_create(name="manager")[0],
-            self.ROLE_ENGINEER: Group.objects.get_or_create(name="engineer")[0],
-            self.ROLE_OBSERVER: Group.objects.get_or_create(name="observer")[0],
-        }
-        for g in Group.objects.filter(user=self):
-            g.user_set.remove(self)
-        groups[self.role].user_set.add(self)
+        """Leave the user in exactly the group of their role: one delete and one insert."""
+        with transaction.atomic():
+            User.groups.through.objects.filter(user_id=self.pk).delete()
+            link_role_group([self.pk], self.role)
 
     @property
     def is_manager(self):
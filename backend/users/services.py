@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models import F
+from .authentication import forget_perm_version
+from .models import User, link_role_group
+
+@transaction.atomic
+def set_role(user_ids, role):
+    """Change the role of many users at once; returns the number of users changed."""
+    ids = list(User.objects.filter(pk__in=user_ids).exclude(role=role).values_list("pk", flat=True))
+    if not ids:
+        return 0
+    User.objects.filter(pk__in=ids).update(role=role, perm_version=F("perm_version") + 1)
+    User.groups.through.objects.filter(user_id__in=ids).delete()
+    link_role_group(ids, role)
+    transaction.on_commit(lambda: forget_perm_version(*ids))
+    return len(ids)
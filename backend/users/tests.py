@@ -78,4 +78,85 @@ def test_api_user_create_by_engineer_allowed():
     client.force_authenticate(user=e)
     payload = {"username": "newuser", "email": "new@example.com", "role": "observer", "password": "p"}
     resp = client.post("/api/users/", payload, format="json")
-    assert resp.status_code == 201
\ No newline at end of file
+    assert resp.status_code == 201
+@pytest.mark.django_db
+def test_api_token_claims_authenticate_without_user_query(django_assert_num_queries):
+    from django.core.cache import cache
+    cache.clear()
+    User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    client = APIClient()
+    access = client.post("/api/auth/login/", {"username": "m", "password": "x"}, format="json").data["access"]
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    assert client.get("/api/users/").status_code == 200
+    with django_assert_num_queries(1):
+        resp = client.get("/api/users/")
+    assert resp.status_code == 200
+
+@pytest.mark.django_db
+def test_api_role_change_invalidates_token_claims(django_capture_on_commit_callbacks):
+    from django.core.cache import cache
+    cache.clear()
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    client = APIClient()
+    tokens = client.post("/api/auth/login/", {"username": "m", "password": "x"}, format="json").data
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+    assert client.get("/api/users/").status_code == 200
+    with django_capture_on_commit_callbacks(execute=True):
+        m.role = User.ROLE_ENGINEER
+        m.save()
+    assert m.perm_version == 1
+    assert client.get("/api/users/").status_code == 403
+    refreshed = client.post("/api/auth/refresh/", {"refresh": tokens["refresh"]}, format="json")
+    assert refreshed.status_code == 200
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {refreshed.data['access']}")
+    assert client.get("/api/users/").status_code == 403
+    with django_capture_on_commit_callbacks(execute=True):
+        m.is_active = False
+        m.save()
+    assert client.get("/api/users/").status_code == 401
+
+@pytest.mark.django_db
+def test_user_save_syncs_groups_only_when_role_changes(django_assert_num_queries):
+    u = User.objects.create_user(username="e", email="e@example.com", password="x", role="engineer")
+    assert list(u.groups.values_list("name", flat=True)) == ["engineer"]
+    u = User.objects.get(pk=u.pk)
+    with django_assert_num_queries(3):
+        u.save(update_fields=["last_login"])
+    u.role = User.ROLE_OBSERVER
+    u.save()
+    assert list(u.groups.values_list("name", flat=True)) == ["observer"]
+
+@pytest.mark.django_db
+def test_api_bulk_role_change():
+    m = User.objects.create_user(username="m", email="m@example.com", password="x", role="manager")
+    users = [User.objects.create_user(username=f"u{i}", email=f"u{i}@example.com", password="x", role="observer") for i in range(3)]
+    client = APIClient()
+    client.force_authenticate(user=m)
+    resp = client.post("/api/users/bulk_role/", {"ids": [u.pk for u in users], "role": "engineer"}, format="json")
+    assert resp.status_code == 200
+    assert resp.data == {"updated": 3}
+    for u in users:
+        u = User.objects.get(pk=u.pk)
+        assert u.is_engineer and u.perm_version == 1
+        assert list(u.groups.values_list("name", flat=True)) == ["engineer"]
+    assert client.post("/api/users/bulk_role/", {"ids": [users[0].pk], "role": "boss"}, format="json").status_code == 400
+    client.force_authenticate(user=users[0])
+    assert client.post("/api/users/bulk_role/", {"ids": [m.pk], "role": "observer"}, format="json").status_code == 403
+
+@pytest.mark.django_db
+def test_stale_cached_group_id_is_detected_and_refreshed():
+    from django.contrib.auth.models import Group
+    from django.db import connection
+    from users.models import role_group_ids
+    User.objects.create_user(username="a", email="a@example.com", password="x", role="engineer")
+    stale = dict(role_group_ids())
+    # gone without signals, as with raw SQL, a flush or another process
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM users_user_groups WHERE group_id = %s", [stale["engineer"]])
+        cursor.execute("DELETE FROM auth_group WHERE id = %s", [stale["engineer"]])
+    role_group_ids().update(stale)
+    u = User.objects.create_user(username="b", email="b@example.com", password="x", role="engineer")
+    group = Group.objects.get(name="engineer")
+    assert group.pk != stale["engineer"]
+    assert list(u.groups.all()) == [group]
+    assert role_group_ids()["engineer"] == group.pk
@@ -1,8 +1,11 @@
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from .models import User
-from .serializers import UserSerializer, UserCreateSerializer
+from .serializers import BulkRoleSerializer, UserSerializer, UserCreateSerializer
 from .permissions import IsManager
+from .services import set_role
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
@@ -11,9 +14,18 @@ class UserViewSet(viewsets.ModelViewSet):
     def get_serializer_class(self):
         if self.action in ["create"]:
             return UserCreateSerializer
+        if self.action == "bulk_role":
+            return BulkRoleSerializer
         return UserSerializer
 
     def get_permissions(self):
-        if self.action in ["list", "retrieve", "update", "partial_update", "destroy"]:
+        if self.action in ["list", "retrieve", "update", "partial_update", "destroy", "bulk_role"]:
             return [IsManager()]
-        return [p() if isinstance(p, type) else p for p in self.permission_classes]
\ No newline at end of file
+        return [p() if isinstance(p, type) else p for p in self.permission_classes]
+
+    @action(detail=False, methods=["post"])
+    def bulk_role(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated = set_role(serializer.validated_data["ids"], serializer.validated_data["role"])
+        return Response({"updated": updated})